@@ -1,11 +1,28 @@
-from flask import Blueprint, request, jsonify
-from models import db, VotingSession, Question, Team, Vote, Voter, QuestionTemplate
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from models import db, VotingSession, Question, Team, Vote, Voter, QuestionTemplate, SessionArchive
+from export import EXPORT_FORMATS, parquet_available, stream_export
+from snapshot import save_snapshot, delete_snapshot, load_snapshot, get_snapshot
+from idempotency import idempotent
+from replica import read_replica
+from archive import delete_sessions, ensure_session_partitions
+from provisioning import MAX_BATCH_SIZE, clone_session, create_sessions, session_spec_error
+from broadcast import publish, votes_landed, SESSION_CHANGED, TEMPLATES_CHANGED
+from catalog import MAX_PER_PAGE, template_catalog
 from datetime import datetime
 import random
 import json
 
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
+def freeze_results(session):
+    """Persist the results snapshot of a just-ended session"""
+    try:
+        save_snapshot(session)
+    except Exception as e:
+        current_app.logger.warning(f'Could not build results snapshot for {session.unique_id}: {e}')
+
 def generate_unique_id():
     """Generate a unique 6-digit ID for voting sessions"""
     while True:
@@ -13,6 +30,68 @@ def generate_unique_id():
         if not VotingSession.query.filter_by(unique_id=unique_id).first():
             return unique_id
 
+def count_by_session(model, label):
+    """Subquery with the number of `model` rows per voting session"""
+    return db.session.query(
+        model.session_id.label('session_id'),
+        func.count(model.id).label(label)
+    ).group_by(model.session_id).subquery()
+
+def vote_counts_by_team_and_question(session_ids):
+    """Map (team_id, question_id) to vote count for the given sessions in one query"""
+    if not session_ids:
+        return {}
+    rows = db.session.query(
+        Vote.team_id, Vote.question_id, func.count(Vote.id)
+    ).filter(Vote.session_id.in_(session_ids)).group_by(Vote.team_id, Vote.question_id).all()
+    return {(team_id, question_id): count for team_id, question_id, count in rows}
+
+def build_crosstab(session):
+    """Voter team x voted team vote counts per question, counted in SQL"""
+    questions = Question.query.filter_by(session_id=session.id).order_by(Question.id).all()
+    teams = Team.query.filter_by(session_id=session.id).order_by(Team.id).all()
+    
+    snapshot = load_snapshot(session)
+    if snapshot is not None:
+        crosstabs = [snapshot.crosstab(q) for q in range(len(snapshot.question_ids))]
+        matrices = [matrix.tolist() for matrix, _ in crosstabs]
+        unknown = [row.tolist() for _, row in crosstabs]
+    else:
+        question_positions = {q.id: i for i, q in enumerate(questions)}
+        team_positions = {t.id: i for i, t in enumerate(teams)}
+        matrices = [[[0] * len(teams) for _ in teams] for _ in questions]
+        unknown = [[0] * len(teams) for _ in questions]
+        
+        rows = db.session.query(
+            Vote.question_id, Vote.voter_team_id, Vote.team_id, func.count(Vote.id)
+        ).filter(
+            Vote.session_id == session.id
+        ).group_by(Vote.question_id, Vote.voter_team_id, Vote.team_id).all()
+        
+        for question_id, voter_team_id, team_id, count in rows:
+            # Votes naming a question or team of another session are left out
+            if question_id not in question_positions or team_id not in team_positions:
+                continue
+            q = question_positions[question_id]
+            t = team_positions[team_id]
+            if voter_team_id in team_positions:
+                matrices[q][team_positions[voter_team_id]][t] += count
+            else:
+                unknown[q][t] += count
+    
+    return {
+        'team_ids': [t.id for t in teams],
+        'teams': [t.name for t in teams],
+        'questions': [{
+            'question_id': question.id,
+            'question_text': question.text,
+            'question_type': question.question_type,
+            'matrix': matrices[q],
+            'unknown_voter': unknown[q],
+            'totals': [sum(column) + unknown[q][t] for t, column in enumerate(zip(*matrices[q]))]
+        } for q, question in enumerate(questions)]
+    }
+
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """API health check endpoint"""
@@ -24,15 +103,27 @@ def health_check():
 
 @api_bp.route('/templates', methods=['GET'])
 def get_question_templates():
-    """Get all question templates"""
-    templates = QuestionTemplate.query.all()
-    return jsonify([{
-        'id': t.id,
-        'name': t.name,
-        'description': t.description,
-        'question_type': t.question_type,
-        'options': t.options
-    } for t in templates])
+    """Get question templates, optionally filtered by type or name and paginated"""
+    question_type = request.args.get('type') or None
+    name = request.args.get('q') or None
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', type=int)
+    if page < 1 or per_page is not None and not 1 <= per_page <= MAX_PER_PAGE:
+        return jsonify({'error': f'page must be at least 1 and per_page between 1 and {MAX_PER_PAGE}'}), 400
+    
+    catalog = template_catalog()
+    etag = catalog.etag()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    templates, total = catalog.page(question_type, name, page, per_page)
+    response = jsonify(templates)
+    response.headers['X-Total-Count'] = str(total)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 @api_bp.route('/templates', methods=['POST'])
 def create_question_template():
@@ -50,7 +141,11 @@ def create_question_template():
     )
     
     db.session.add(template)
+    db.session.flush()
+    publish(TEMPLATES_CHANGED, version=template.id)
     db.session.commit()
+    # The bus reaches this node too, but not necessarily before its next request
+    template_catalog().bump(template.id)
     
     return jsonify({
         'id': template.id,
@@ -74,6 +169,7 @@ def create_voting_session():
         )
         db.session.add(session)
         db.session.flush()  # Get the ID
+        ensure_session_partitions([session.id])
         
         # Add questions
         questions_data = data.get('questions', [])
@@ -112,10 +208,64 @@ def create_voting_session():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/voting:batch', methods=['POST'])
+@idempotent
+def create_voting_sessions():
+    """Create several voting sessions in one transaction, e.g. one per room"""
+    data = request.get_json(silent=True) or {}
+    specs = data.get('sessions')
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'Provide a non-empty list of voting sessions in "sessions"'}), 400
+    if len(specs) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} voting sessions per batch'}), 400
+    for idx, spec in enumerate(specs):
+        error = session_spec_error(spec)
+        if error:
+            return jsonify({'error': f'Session {idx}: {error}'}), 400
+    
+    try:
+        unique_ids = create_sessions(specs)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'message': f'{len(unique_ids)} voting sessions created successfully',
+        'sessions': [{
+            'id': unique_id,
+            'name': spec['name'],
+            'voting_url': f'/hlasovani/{unique_id}',
+            'qr_url': f'/presentation/{unique_id}'
+        } for unique_id, spec in zip(unique_ids, specs)]
+    }), 201
+
+@api_bp.route('/voting/<voting_id>/clone', methods=['POST'])
+@idempotent
+def clone_voting_session(voting_id):
+    """Create a new session with the questions and teams of an existing one"""
+    source = VotingSession.query.filter_by(unique_id=voting_id).first()
+    if not source:
+        return jsonify({'error': 'Voting session not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        unique_id = clone_session(source, data.get('name'), data.get('description'))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'id': unique_id,
+        'message': f'Voting session {voting_id} cloned successfully',
+        'voting_url': f'/hlasovani/{unique_id}',
+        'qr_url': f'/presentation/{unique_id}'
+    }), 201
+
 @api_bp.route('/voting/<voting_id>', methods=['GET'])
 def get_voting_session(voting_id):
     """Get voting session details"""
-    session = VotingSession.query.filter_by(unique_id=voting_id).first()
+    session = VotingSession.query.options(
+        selectinload(VotingSession.questions),
+        selectinload(VotingSession.teams)
+    ).filter_by(unique_id=voting_id).first()
     if not session:
         return jsonify({'error': 'Voting session not found'}), 404
     
@@ -152,30 +302,89 @@ def update_teams(voting_id):
     if not session:
         return jsonify({'error': 'Voting session not found'}), 404
     
+    if session.archive is not None:
+        return jsonify({'error': 'Voting session is archived'}), 409
+    
     data = request.get_json()
     teams_data = data.get('teams', [])
     
     try:
-        # Remove existing teams
-        Team.query.filter_by(session_id=session.id).delete()
-        
-        # Add new teams
+        # Existing teams are matched by external_id (or name) and updated in place,
+        # so votes keep pointing at them
+        existing = {team.external_id or team.name: team
+                    for team in Team.query.filter_by(session_id=session.id).all()}
         for team_data in teams_data:
-            team = Team(
-                session_id=session.id,
-                name=team_data['name'],
-                external_id=team_data.get('external_id'),
-                description=team_data.get('description')
-            )
-            db.session.add(team)
+            team = existing.pop(team_data.get('external_id') or team_data['name'], None)
+            if team is None:
+                team = Team(session_id=session.id)
+                db.session.add(team)
+            team.name = team_data['name']
+            team.external_id = team_data.get('external_id')
+            team.description = team_data.get('description')
+        
+        # Teams missing from the request are removed unless votes reference them
+        removed_ids = [team.id for team in existing.values()]
+        if removed_ids:
+            voted_for = db.session.query(Team.name).filter(
+                Team.id.in_(removed_ids),
+                db.or_(
+                    Team.id.in_(db.session.query(Vote.team_id).filter(Vote.team_id.in_(removed_ids))),
+                    Team.id.in_(db.session.query(Vote.voter_team_id).filter(Vote.voter_team_id.in_(removed_ids)))
+                )
+            ).all()
+            if voted_for:
+                db.session.rollback()
+                names = ', '.join(name for name, in voted_for)
+                return jsonify({'error': f'Teams with votes cannot be removed: {names}'}), 409
+            Team.query.filter(Team.id.in_(removed_ids)).delete(synchronize_session=False)
         
+        publish(SESSION_CHANGED, session=voting_id, change='teams')
         db.session.commit()
+        delete_snapshot(session)
         return jsonify({'message': 'Teams updated successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/voting/<voting_id>', methods=['DELETE'])
+def delete_voting_session(voting_id):
+    """Delete a voting session with all its questions, teams, voters and votes"""
+    session = VotingSession.query.filter_by(unique_id=voting_id).first()
+    if not session:
+        return jsonify({'error': 'Voting session not found'}), 404
+    
+    try:
+        publish(SESSION_CHANGED, session=voting_id, change='deleted')
+        deleted = delete_sessions([session])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'message': f'Voting session {voting_id} deleted successfully', 'deleted': deleted})
+
+@api_bp.route('/voting:delete', methods=['POST'])
+def delete_voting_sessions():
+    """Delete several voting sessions in one transaction"""
+    data = request.get_json(silent=True) or {}
+    voting_ids = data.get('ids')
+    if not isinstance(voting_ids, list) or not voting_ids:
+        return jsonify({'error': 'Provide a non-empty list of voting session ids in "ids"'}), 400
+    voting_ids = [str(voting_id) for voting_id in voting_ids]
+    
+    sessions = VotingSession.query.filter(VotingSession.unique_id.in_(voting_ids)).all()
+    missing = sorted(set(voting_ids) - {s.unique_id for s in sessions})
+    if missing:
+        return jsonify({'error': f'Voting sessions not found: {", ".join(missing)}'}), 404
+    
+    try:
+        for voting_id in voting_ids:
+            publish(SESSION_CHANGED, session=voting_id, change='deleted')
+        deleted = delete_sessions(sessions)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'message': f'{len(sessions)} voting sessions deleted successfully', 'deleted': deleted})
+
 @api_bp.route('/voting/<voting_id>/start', methods=['POST'])
 def start_voting_session(voting_id):
     """Start a voting session"""
@@ -185,6 +394,7 @@ def start_voting_session(voting_id):
     
     session.started = True
     session.updated_at = datetime.utcnow()
+    publish(SESSION_CHANGED, session=voting_id, change='started')
     db.session.commit()
     
     return jsonify({'message': f'Voting session {voting_id} started successfully'})
@@ -198,11 +408,14 @@ def stop_voting_session(voting_id):
     
     session.ended = True
     session.updated_at = datetime.utcnow()
+    publish(SESSION_CHANGED, session=voting_id, change='stopped')
     db.session.commit()
+    freeze_results(session)
     
     return jsonify({'message': f'Voting session {voting_id} stopped successfully'})
 
 @api_bp.route('/voting/<voting_id>/vote', methods=['POST'])
+@idempotent
 def submit_vote(voting_id):
     """Submit a vote"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
@@ -258,6 +471,7 @@ def submit_vote(voting_id):
         db.session.add(vote)
         voter.last_vote_at = datetime.utcnow()
         db.session.commit()
+        votes_landed(voting_id, 1)
         
         return jsonify({'message': 'Vote submitted successfully'}), 201
         
@@ -266,12 +480,23 @@ def submit_vote(voting_id):
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/voting/<voting_id>/results', methods=['GET'])
+@read_replica
 def get_voting_results(voting_id):
     """Get voting results with flexible aggregation"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
     if not session:
         return jsonify({'error': 'Voting session not found'}), 404
     
+    # Ended sessions are answered from their frozen snapshot
+    snapshot = load_snapshot(session)
+    if snapshot is not None:
+        return jsonify({
+            'session_id': voting_id,
+            'session_name': session.name,
+            'total_voters': snapshot.total_voters,
+            'results': snapshot.results()
+        })
+    
     # Basic aggregation - can be customized based on requirements
     results = []
     
@@ -312,11 +537,70 @@ def get_voting_results(voting_id):
     return jsonify({
         'session_id': voting_id,
         'session_name': session.name,
-        'total_voters': len(session.voters),
+        'total_voters': Voter.query.filter_by(session_id=session.id).count(),
         'results': results
     })
 
+@api_bp.route('/voting/<voting_id>/statistics', methods=['GET'])
+@read_replica
+def get_voting_statistics_detail(voting_id):
+    """Rating statistics per team with a per voter-team breakdown"""
+    session = VotingSession.query.filter_by(unique_id=voting_id).first()
+    if not session:
+        return jsonify({'error': 'Voting session not found'}), 404
+    
+    snapshot = get_snapshot(session)
+    return jsonify({
+        'session_id': voting_id,
+        'session_name': session.name,
+        'total_voters': snapshot.total_voters,
+        'vote_count': snapshot.vote_count,
+        'statistics': snapshot.statistics()
+    })
+
+@api_bp.route('/voting/<voting_id>/crosstab', methods=['GET'])
+@read_replica
+def get_voting_crosstab(voting_id):
+    """Get who-voted-for-whom count matrices per question"""
+    session = VotingSession.query.filter_by(unique_id=voting_id).first()
+    if not session:
+        return jsonify({'error': 'Voting session not found'}), 404
+    
+    crosstab = build_crosstab(session)
+    return jsonify({
+        'session_id': voting_id,
+        'session_name': session.name,
+        'rows': 'voter_team',
+        'columns': 'voted_team',
+        **crosstab
+    })
+
+@api_bp.route('/voting/<voting_id>/export', methods=['GET'])
+def export_votes(voting_id):
+    """Stream raw votes joined with team and question names"""
+    session = VotingSession.query.filter_by(unique_id=voting_id).first()
+    if not session:
+        return jsonify({'error': 'Voting session not found'}), 404
+    
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format, use one of: {", ".join(EXPORT_FORMATS)}'}), 400
+    
+    if export_format == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export requires the pyarrow package'}), 501
+    
+    if session.archive is not None:
+        return jsonify({'error': 'Votes of this session are archived, restore it with "manage.py archive --restore"'}), 410
+    
+    filename = f'votes_{session.unique_id}.{export_format}'
+    return Response(
+        stream_with_context(stream_export(session.id, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @api_bp.route('/voting/<voting_id>/results/nase-firmy', methods=['GET'])
+@read_replica
 def get_nase_firmy_results(voting_id):
     """Get specialized results for 'Naše firmy' template"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
@@ -345,6 +629,24 @@ def get_nase_firmy_results(voting_id):
     
     results = {}
     
+    # Ended sessions are answered from their frozen snapshot, archived ones have no votes left
+    snapshot = load_snapshot(session)
+    if snapshot is not None:
+        positions = {int(question_id): q for q, question_id in enumerate(snapshot.question_ids)}
+        for category, question in category_questions.items():
+            results[category] = snapshot.team_selection_winner(positions[question.id]) or {
+                'winning_team': None,
+                'votes_received': 0,
+                'voting_teams': [],
+                'self_votes': 0
+            }
+        return jsonify({
+            'session_id': voting_id,
+            'session_name': session.name,
+            'template': 'Naše firmy',
+            'results': results
+        })
+    
     for category, question in category_questions.items():
         # Get all votes for this category
         votes = Vote.query.filter_by(question_id=question.id).all()
@@ -398,19 +700,42 @@ def get_nase_firmy_results(voting_id):
     })
 
 @api_bp.route('/voting', methods=['GET'])
+@read_replica
 def get_all_voting_sessions():
     """Get all voting sessions"""
-    sessions = VotingSession.query.all()
+    # Counts come from grouped subqueries so the listing is a single SELECT
+    # regardless of how many sessions, teams or votes exist
+    question_counts = count_by_session(Question, 'question_count')
+    team_counts = count_by_session(Team, 'team_count')
+    vote_counts = count_by_session(Vote, 'vote_count')
+    
+    rows = db.session.query(
+        VotingSession,
+        func.coalesce(question_counts.c.question_count, 0),
+        func.coalesce(team_counts.c.team_count, 0),
+        func.coalesce(vote_counts.c.vote_count, SessionArchive.vote_count, 0),
+        SessionArchive.id.isnot(None)
+    ).outerjoin(
+        question_counts, question_counts.c.session_id == VotingSession.id
+    ).outerjoin(
+        team_counts, team_counts.c.session_id == VotingSession.id
+    ).outerjoin(
+        vote_counts, vote_counts.c.session_id == VotingSession.id
+    ).outerjoin(
+        SessionArchive, SessionArchive.session_id == VotingSession.id
+    ).all()
+    
     return jsonify([{
         'id': s.unique_id,
         'name': s.name,
         'started': s.started,
         'ended': s.ended,
         'created_at': s.created_at.isoformat(),
-        'question_count': len(s.questions),
-        'team_count': len(s.teams),
-        'vote_count': len(s.votes)
-    } for s in sessions])
+        'question_count': question_count,
+        'team_count': team_count,
+        'vote_count': vote_count,
+        'archived': archived
+    } for s, question_count, team_count, vote_count, archived in rows])
 
 # Error handlers
 @api_bp.errorhandler(404)
@@ -0,0 +1,429 @@
+"""
+Archival and bulk deletion of voting sessions.
+Voters and votes of sessions that ended more than ARCHIVE_AFTER_DAYS ago are
+moved out of the hot tables into a gzip-compressed file per session; the
+session, its questions and teams stay, and results keep being served from
+the session's snapshot. On PostgreSQL the votes table can additionally be
+partitioned by session_id range so each partition keeps its own small
+indexes. Sessions are deleted with one set-based DELETE per table instead
+of the ORM cascades, which load every dependent row first. A whole session
+can also be exported into a versioned file of the same layout and imported
+into any instance under new ids.
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select
+
+from models import db, JSONText, VotingSession, Question, QuestionTemplate, Team, Vote, Voter, SessionArchive
+from snapshot import save_snapshot, snapshot_path
+
+ARCHIVE_FORMAT = 'voting-archive'
+ARCHIVE_VERSION = 1
+ARCHIVE_CHUNK_SIZE = 5000
+ARCHIVED_TABLES = (Voter.__table__, Vote.__table__)  # in insert order
+EXPORT_FORMAT = 'voting-session'
+EXPORT_VERSION = 1
+EXPORTED_TABLES = (VotingSession.__table__, Question.__table__, Team.__table__,
+                   Voter.__table__, Vote.__table__)  # in insert order
+# Foreign keys rewritten on import: column -> table whose new ids it refers to
+REMAPPED_COLUMNS = {'session_id': 'voting_sessions', 'question_id': 'questions', 'team_id': 'teams',
+                    'voter_id': 'voters', 'voter_team_id': 'teams'}
+
+
+def archive_path(archive_file):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], archive_file)
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _write_rows(f, table, condition):
+    """Write a table header line and one JSON array per row, streamed in chunks"""
+    columns = [c.name for c in table.columns]
+    f.write(json.dumps({'table': table.name, 'columns': columns}) + '\n')
+
+    query = select(table).where(condition).order_by(table.c.id)
+    count = 0
+    for row in db.session.execute(query.execution_options(yield_per=ARCHIVE_CHUNK_SIZE)):
+        f.write(json.dumps([_encode(value) for value in row], separators=(',', ':')) + '\n')
+        count += 1
+    return count
+
+
+def archive_session(session):
+    """Move the voters and votes of an ended session into its archive file"""
+    if not session.ended:
+        raise ValueError(f'Voting session {session.unique_id} has not ended')
+    if session.archive is not None:
+        raise ValueError(f'Voting session {session.unique_id} is already archived')
+
+    # Results of archived sessions come from the snapshot, so it must exist first
+    save_snapshot(session)
+
+    archive_dir = current_app.config['ARCHIVE_DIR']
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_file = f'session_{session.id}_{session.unique_id}.jsonl.gz'
+    path = archive_path(archive_file)
+
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'session_id': session.id,
+            'unique_id': session.unique_id,
+            'archived_at': datetime.utcnow().isoformat()
+        }) + '\n')
+        voter_count = _write_rows(f, Voter.__table__, Voter.session_id == session.id)
+        vote_count = _write_rows(f, Vote.__table__, Vote.session_id == session.id)
+    os.replace(path + '.tmp', path)
+
+    try:
+        Vote.query.filter_by(session_id=session.id).delete(synchronize_session=False)
+        Voter.query.filter_by(session_id=session.id).delete(synchronize_session=False)
+        record = SessionArchive(session_id=session.id, archive_file=archive_file,
+                                vote_count=vote_count, voter_count=voter_count)
+        db.session.add(record)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return record
+
+
+def _decode_row(table, columns, values):
+    row = dict(zip(columns, values))
+    for column in table.columns:
+        if column.name not in row or row[column.name] is None:
+            continue
+        if isinstance(column.type, db.DateTime):
+            row[column.name] = datetime.fromisoformat(row[column.name])
+        elif isinstance(column.type, JSONText) and isinstance(row[column.name], str):
+            # Files exported while options were stored as JSON strings
+            row[column.name] = json.loads(row[column.name])
+    return row
+
+
+def restore_session(session):
+    """Move an archived session's voters and votes back into the hot tables"""
+    record = session.archive
+    if record is None:
+        raise ValueError(f'Voting session {session.unique_id} is not archived')
+
+    path = archive_path(record.archive_file)
+    tables = {table.name: table for table in ARCHIVED_TABLES}
+    table, columns, batch = None, None, []
+
+    def flush():
+        if batch:
+            db.session.execute(table.insert(), batch)
+            batch.clear()
+
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('format') != ARCHIVE_FORMAT or header.get('version') != ARCHIVE_VERSION:
+                raise ValueError(f'{path} is not a version {ARCHIVE_VERSION} session archive')
+
+            for line in f:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    flush()
+                    table, columns = tables[item['table']], item['columns']
+                    continue
+                batch.append(_decode_row(table, columns, item))
+                if len(batch) >= ARCHIVE_CHUNK_SIZE:
+                    flush()
+            flush()
+
+        db.session.delete(record)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    os.remove(path)
+
+
+def export_session(session, path):
+    """Write a session with its questions, teams, voters and votes to a gzip file.
+    Returns the number of exported rows per table."""
+    path = str(path)
+    counts = {}
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'format': EXPORT_FORMAT,
+            'version': EXPORT_VERSION,
+            'unique_id': session.unique_id,
+            'exported_at': datetime.utcnow().isoformat()
+        }) + '\n')
+        for model, condition in ((VotingSession, VotingSession.id == session.id),
+                                 (Question, Question.session_id == session.id),
+                                 (Team, Team.session_id == session.id)):
+            counts[model.__tablename__] = _write_rows(f, model.__table__, condition)
+
+        if session.archive is not None:
+            # Voters and votes of archived sessions are copied from the archive file as they are
+            with gzip.open(archive_path(session.archive.archive_file), 'rt', encoding='utf-8') as archived:
+                archived.readline()
+                for line in archived:
+                    f.write(line)
+                    if line.startswith('{'):
+                        table = json.loads(line)['table']
+                        counts[table] = 0
+                    else:
+                        counts[table] += 1
+        else:
+            counts['voters'] = _write_rows(f, Voter.__table__, Voter.session_id == session.id)
+            counts['votes'] = _write_rows(f, Vote.__table__, Vote.session_id == session.id)
+    os.replace(path + '.tmp', path)
+    return counts
+
+
+def import_session(path, unique_id=None):
+    """Insert an exported session under new ids, optionally with another unique_id.
+    Votes referring to a question, team or voter outside the session are left
+    out, and a voter team outside it becomes None. Returns the new session and
+    the number of votes left out."""
+    tables = {table.name: table for table in EXPORTED_TABLES}
+    new_ids = {name: {} for name in tables}
+    template_ids = set(db.session.execute(select(QuestionTemplate.id)).scalars())
+    table, columns, batch = None, None, []
+    dropped = 0
+
+    def remap(row):
+        for column, target in REMAPPED_COLUMNS.items():
+            if row.get(column) is not None:
+                row[column] = new_ids[target].get(row[column])
+        if 'template_id' in row and row['template_id'] not in template_ids:
+            # Template ids only mean something on the instance that exported the session
+            row['template_id'] = None
+        return row
+
+    def flush():
+        nonlocal dropped
+        if not batch:
+            return
+        old_ids = [row.pop('id') for row in batch]
+        rows = [remap(row) for row in batch]
+        if table.name == 'votes':
+            # The vote APIs do not check that a vote's references belong to its session
+            kept = [row for row in rows if None not in (row['question_id'], row['team_id'], row['voter_id'])]
+            dropped += len(rows) - len(kept)
+            if kept:
+                db.session.execute(insert(table), kept)
+        else:
+            inserted = db.session.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+            new_ids[table.name].update(zip(old_ids, inserted.scalars()))
+            if table.name == 'voting_sessions':
+                ensure_session_partitions(new_ids[table.name].values())
+        batch.clear()
+
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('format') != EXPORT_FORMAT or header.get('version') != EXPORT_VERSION:
+                raise ValueError(f'{path} is not a version {EXPORT_VERSION} session export')
+
+            unique_id = unique_id or header['unique_id']
+            if VotingSession.query.filter_by(unique_id=unique_id).first():
+                raise ValueError(f'Voting session {unique_id} already exists')
+
+            for line in f:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    flush()
+                    table, columns = tables[item['table']], item['columns']
+                    continue
+                row = _decode_row(table, columns, item)
+                if table.name == 'voting_sessions':
+                    row['unique_id'] = unique_id
+                batch.append(row)
+                if len(batch) >= ARCHIVE_CHUNK_SIZE:
+                    flush()
+            flush()
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if dropped:
+        current_app.logger.warning(f'Left out {dropped} votes referring outside voting session {unique_id}')
+    return VotingSession.query.filter_by(unique_id=unique_id).first(), dropped
+
+
+def delete_sessions(sessions):
+    """Delete sessions and all their rows in one transaction, children first.
+    Returns the number of deleted rows per table."""
+    sessions = list(sessions)
+    if not sessions:
+        return {}
+    session_ids = [session.id for session in sessions]
+    files = [snapshot_path(session) for session in sessions]
+    files += [archive_path(session.archive.archive_file) for session in sessions if session.archive]
+
+    deleted = {}
+    try:
+        # Foreign key order: votes reference voters, questions and teams
+        for model in (Vote, Voter, Question, Team, SessionArchive):
+            deleted[model.__tablename__] = model.query.filter(
+                model.session_id.in_(session_ids)
+            ).delete(synchronize_session=False)
+        deleted[VotingSession.__tablename__] = VotingSession.query.filter(
+            VotingSession.id.in_(session_ids)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for session in sessions:
+        db.session.expunge(session)
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+    return deleted
+
+
+def sessions_to_archive(days):
+    """Ended, not yet archived sessions last updated more than `days` days ago"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    return VotingSession.query.outerjoin(SessionArchive).filter(
+        VotingSession.ended.is_(True),
+        VotingSession.updated_at < cutoff,
+        SessionArchive.id.is_(None)
+    ).order_by(VotingSession.id).all()
+
+
+def archive_ended_sessions(days=None):
+    """Archive every session that ended more than `days` (ARCHIVE_AFTER_DAYS) days ago"""
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    return [archive_session(session) for session in sessions_to_archive(days)]
+
+
+# PostgreSQL range partitioning of votes by session_id
+
+def votes_partitioned():
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(db.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'votes'::regclass)"
+    )).scalar()
+
+
+def create_vote_partition(low, partition_size):
+    """Create the partition of sessions low .. low + partition_size - 1.
+    Returns False while votes of that range sit in votes_default."""
+    # A range cannot be split off while rows for it sit in the default partition
+    in_default = db.session.execute(db.text(
+        "SELECT EXISTS (SELECT 1 FROM votes_default WHERE session_id >= :low AND session_id < :high)"
+    ), {'low': low, 'high': low + partition_size}).scalar()
+    if in_default:
+        current_app.logger.warning(f'Votes for sessions {low}-{low + partition_size - 1} are in votes_default')
+        return False
+    db.session.execute(db.text(
+        f'CREATE TABLE votes_s{low} PARTITION OF votes FOR VALUES FROM ({low}) TO ({low + partition_size})'
+    ))
+    return True
+
+
+def ensure_vote_partitions(partition_size=None, ahead=2, commit=True):
+    """Create range partitions up to `ahead` ranges past the newest session id"""
+    partition_size = partition_size or current_app.config['VOTE_PARTITION_SIZE']
+    max_session_id = db.session.query(db.func.max(VotingSession.id)).scalar() or 0
+    existing = set(db.session.execute(db.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'votes'::regclass"
+    )).scalars())
+
+    created = []
+    for low in range(0, (max_session_id // partition_size + ahead + 1) * partition_size, partition_size):
+        name = f'votes_s{low}'
+        if name not in existing and create_vote_partition(low, partition_size):
+            created.append(name)
+    if commit:
+        db.session.commit()
+    return created
+
+
+def _partition_exists(low):
+    return db.session.execute(db.text('SELECT to_regclass(:name)'), {'name': f'votes_s{low}'}).scalar() is not None
+
+
+def ensure_session_partitions(session_ids):
+    """Create the partitions the votes of new sessions go to, in the creating
+    transaction, so they never land in votes_default. Nothing to do unless
+    votes are partitioned."""
+    if db.engine.dialect.name != 'postgresql':
+        return []
+    partition_size = current_app.config['VOTE_PARTITION_SIZE']
+    lows = {session_id // partition_size * partition_size for session_id in session_ids}
+    missing = sorted(low for low in lows if not _partition_exists(low))
+    if not missing or not votes_partitioned():
+        return []
+
+    # Sessions created at the same time would otherwise race to create the same partition
+    db.session.execute(db.text("SELECT pg_advisory_xact_lock(hashtext('votes_partitions'))"))
+    created = []
+    for low in missing:
+        if not _partition_exists(low) and create_vote_partition(low, partition_size):
+            created.append(f'votes_s{low}')
+    return created
+
+
+def partition_votes(partition_size=None):
+    """Convert the votes table into a table partitioned by session_id range"""
+    if db.engine.dialect.name != 'postgresql':
+        raise RuntimeError('Partitioning votes requires PostgreSQL')
+    if votes_partitioned():
+        return False
+
+    partition_size = partition_size or current_app.config['VOTE_PARTITION_SIZE']
+    sequence = db.session.execute(db.text("SELECT pg_get_serial_sequence('votes', 'id')")).scalar()
+    # Indexes not backing a constraint, recreated on the partitioned table under their names
+    indexes = db.session.execute(db.text(
+        "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = 'votes'::regclass "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)"
+    )).all()
+    statements = [
+        'ALTER TABLE votes RENAME TO votes_unpartitioned',
+        'ALTER TABLE votes_unpartitioned RENAME CONSTRAINT votes_pkey TO votes_unpartitioned_pkey',
+        'ALTER TABLE votes_unpartitioned RENAME CONSTRAINT unique_vote_per_question TO unique_vote_per_question_old',
+        *(f'ALTER INDEX {name} RENAME TO {name}_old' for name, _ in indexes),
+        'CREATE TABLE votes (LIKE votes_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (session_id)',
+        # Unique constraints on a partitioned table must include the partition key;
+        # it goes last so lookups by question keep using the constraint's index
+        'ALTER TABLE votes ADD CONSTRAINT votes_pkey PRIMARY KEY (id, session_id)',
+        'ALTER TABLE votes ADD CONSTRAINT unique_vote_per_question UNIQUE (question_id, voter_id, session_id)',
+        'ALTER TABLE votes ADD FOREIGN KEY (session_id) REFERENCES voting_sessions (id)',
+        'ALTER TABLE votes ADD FOREIGN KEY (question_id) REFERENCES questions (id)',
+        'ALTER TABLE votes ADD FOREIGN KEY (team_id) REFERENCES teams (id)',
+        'ALTER TABLE votes ADD FOREIGN KEY (voter_id) REFERENCES voters (id)',
+        'ALTER TABLE votes ADD FOREIGN KEY (voter_team_id) REFERENCES teams (id)',
+        'CREATE TABLE votes_default PARTITION OF votes DEFAULT',
+    ]
+    if sequence:
+        statements.append(f'ALTER SEQUENCE {sequence} OWNED BY votes.id')
+
+    # One transaction: on failure the original table is left untouched
+    try:
+        for statement in statements:
+            db.session.execute(db.text(statement))
+        ensure_vote_partitions(partition_size, commit=False)
+        db.session.execute(db.text('INSERT INTO votes SELECT * FROM votes_unpartitioned'))
+        # Built once after the copy; indexes on the parent cascade to every partition
+        for _, definition in indexes:
+            db.session.execute(db.text(definition))
+        db.session.execute(db.text('DROP TABLE votes_unpartitioned'))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return True
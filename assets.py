@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline for the voting application.
+The build step minifies, fingerprints and precompresses the files in site/
+into site/dist/ with a manifest. At runtime templates resolve asset URLs
+through the manifest and fingerprinted files are served with immutable
+caching, optionally handing the bytes to the proxy via X-Sendfile or
+X-Accel-Redirect.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+
+from flask import Response, request, send_from_directory
+
+from compression import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ASSET_EXTENSIONS = ('.css', '.js', '.svg', '.png', '.jpg', '.ico', '.woff2')
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg')
+UNVERSIONED_ASSETS = ('sw.js',)  # service workers must keep a stable URL; rendered as a template
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def minify_css(source):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    source = source.replace(';}', '}')
+    return source.strip()
+
+
+# String and template literals, block comments and line comments of a script
+JS_TOKEN = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`)|(/\*.*?\*/)|(//[^\n]*)', re.S)
+
+
+def _squeeze_js(code):
+    code = re.sub(r'[ \t]+', ' ', code)
+    return re.sub(r' ?\n\s*', '\n', code)
+
+
+def minify_js(source):
+    """Strip comments, indentation and blank lines from a script. Line breaks
+    are kept, so automatic semicolon insertion is unaffected; regular
+    expression literals containing quotes or comment markers are not supported."""
+    parts, code = [], []
+    position = 0
+    for match in JS_TOKEN.finditer(source):
+        code.append(source[position:match.start()])
+        literal, block_comment, _ = match.groups()
+        if literal:
+            parts += [_squeeze_js(''.join(code)), literal]
+            code = []
+        elif block_comment:
+            code.append('\n' if '\n' in block_comment else ' ')
+        position = match.end()
+    code.append(source[position:])
+    parts.append(_squeeze_js(''.join(code)))
+    return ''.join(parts).strip()
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def build_assets(site_dir=SITE_DIR, quiet=False):
+    """Write minified, fingerprinted and precompressed assets plus a manifest"""
+    dist_dir = os.path.join(site_dir, DIST_DIRNAME)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    manifest = {}
+    for name in sorted(os.listdir(site_dir)):
+        path = os.path.join(site_dir, name)
+        stem, ext = os.path.splitext(name)
+        if not os.path.isfile(path) or ext not in ASSET_EXTENSIONS or name in UNVERSIONED_ASSETS:
+            continue
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        if ext == '.css':
+            data = minify_css(data.decode('utf-8')).encode('utf-8')
+        elif ext == '.js':
+            data = minify_js(data.decode('utf-8')).encode('utf-8')
+        if not data:
+            continue
+
+        built_name = f'{stem}.{fingerprint(data)}{ext}'
+        built_path = os.path.join(dist_dir, built_name)
+        with open(built_path, 'wb') as f:
+            f.write(data)
+
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            with open(built_path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(built_path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+
+        manifest[name] = built_name
+        if not quiet:
+            print(f"✓ {name} -> {DIST_DIRNAME}/{built_name} ({os.path.getsize(path)} -> {len(data)} bytes)")
+
+    # Drop outputs of earlier builds that are no longer referenced
+    current = set(manifest.values())
+    for name in os.listdir(dist_dir):
+        base = re.sub(r'\.(gz|br)$', '', name)
+        if name != MANIFEST_NAME and base not in current:
+            os.remove(os.path.join(dist_dir, name))
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def asset_version(site_dir, manifest):
+    """Short hash of the current assets, which changes whenever one of them does;
+    the service worker names its cache after it"""
+    if manifest:
+        return fingerprint(json.dumps(manifest, sort_keys=True).encode('utf-8'))
+    # Not built: hash the source files
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(site_dir)):
+        path = os.path.join(site_dir, name)
+        if os.path.isfile(path) and os.path.splitext(name)[1] in ASSET_EXTENSIONS:
+            with open(path, 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + f.read())
+    return digest.hexdigest()[:12]
+
+
+def load_manifest(dist_dir):
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    """Register asset_url() for templates and the fingerprinted asset route"""
+    static_url = app.static_url_path
+    dist_dir = os.path.join(app.static_folder, DIST_DIRNAME)
+    manifest = load_manifest(dist_dir)
+
+    def asset_url(name):
+        """URL of the fingerprinted build of an asset, or the source file when not built"""
+        if name in manifest:
+            return f'{static_url}/{DIST_DIRNAME}/{manifest[name]}'
+        return f'{static_url}/{name}'
+
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.jinja_env.globals['asset_version'] = asset_version(app.static_folder, manifest)
+
+    @app.route(f'{static_url}/{DIST_DIRNAME}/<path:filename>')
+    def fingerprinted_asset(filename):
+        """Serve a built asset, precompressed when possible, with immutable caching"""
+        served_name, encoding = filename, None
+        accepted = accepted_encodings()
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in accepted and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+                served_name, encoding = filename + suffix, candidate
+                break
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accel_prefix = app.config.get('STATIC_ACCEL_REDIRECT_PREFIX')
+
+        if accel_prefix:
+            if not os.path.isfile(os.path.join(dist_dir, served_name)):
+                return Response('Not found', status=404)
+            response = Response(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{served_name}"
+        else:
+            # send_file honours USE_X_SENDFILE and then only sends the header
+            response = send_from_directory(dist_dir, served_name, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+    @app.after_request
+    def revalidate_pages(response):
+        """HTML pages are cheap to revalidate, so they are sent with an ETag and no-cache"""
+        if (response.status_code == 200 and response.mimetype == 'text/html'
+                and not response.is_streamed and request.method in ('GET', 'HEAD')):
+            response.cache_control.no_cache = True
+            response.add_etag()
+            return response.make_conditional(request)
+        return response
+
+    return app
+
+
+def main():
+    """Build the static assets"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build fingerprinted static assets')
+    parser.add_argument('--site-dir', default=SITE_DIR, help='Directory with the static site')
+    parser.add_argument('--quiet', action='store_true', help='Quiet mode')
+    args = parser.parse_args()
+
+    manifest = build_assets(args.site_dir, quiet=args.quiet)
+    if not args.quiet:
+        print(f"✅ Built {len(manifest)} assets into {os.path.join(args.site_dir, DIST_DIRNAME)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
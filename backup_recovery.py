@@ -8,22 +8,45 @@ import os
 import sys
 import subprocess
 import json
+import re
 import shutil
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 
 # Configuration
 BACKUP_DIR = Path("./backups")
 DATA_DIR = Path("./data")
-MAX_BACKUPS = 10  # Keep last 10 backups
+MAX_BACKUPS = 10  # Keep last 10 logical backups
+MAX_BASE_BACKUPS = 2  # Keep last 2 base backups and the WAL needed since the oldest
+CONTAINER_BACKUP_DIR = "/backups"  # BACKUP_DIR as mounted in the db container
+DB_NAME = os.environ.get("POSTGRES_DB", "voting_db")
+DB_USER = os.environ.get("POSTGRES_USER", "postgres")
+DUMP_JOBS = int(os.environ.get("BACKUP_JOBS", min(4, os.cpu_count() or 1)))
+COMPRESSION_LEVEL = int(os.environ.get("BACKUP_COMPRESSION", 6))
+# Run the PostgreSQL tools on this host (PGHOST, PGPASSWORD, ...) instead of in the db container
+LOCAL_MODE = os.environ.get("BACKUP_LOCAL", "false").lower() == "true"
+COUNTED_TABLES = ["voting_sessions", "questions", "teams", "voters", "votes", "question_templates"]
+WAL_ARCHIVE_TIMEOUT = 60  # seconds to wait for the archiver after a WAL switch
+CONTAINER_PGDATA = "/var/lib/postgresql/data/pgdata"  # PGDATA of the db service
+PITR_TIMEOUT = int(os.environ.get("PITR_TIMEOUT", 3600))  # seconds allowed for WAL replay
+# pg_restore -v lines marking a finished TOC item (serial and parallel restores word them differently)
+RESTORE_PROGRESS = re.compile(r"pg_restore: (finished item (?P<id>\d+)|creating |processing data for table)")
 
 def ensure_directories():
     """Create necessary directories"""
     BACKUP_DIR.mkdir(exist_ok=True)
+    wal_archive_dir().mkdir(exist_ok=True)
     DATA_DIR.mkdir(exist_ok=True)
     (DATA_DIR / "postgres").mkdir(exist_ok=True)
     (DATA_DIR / "app").mkdir(exist_ok=True)
 
+def wal_archive_dir():
+    """Directory PostgreSQL's archive_command copies WAL segments to"""
+    return BACKUP_DIR / "wal_archive"
+
+@lru_cache(maxsize=None)
 def get_container_name():
     """Get the PostgreSQL container name"""
     try:
@@ -42,44 +65,148 @@ def get_container_name():
     except subprocess.CalledProcessError:
         raise Exception("Could not find PostgreSQL container")
 
+def pg_command(*args, stdin=False):
+    """Command line running a PostgreSQL tool in the db container, or on this host in local mode"""
+    if LOCAL_MODE:
+        return list(args)
+    return ["docker", "exec", *(["-i"] if stdin else []), get_container_name(), *args]
+
+def tool_path(path):
+    """Path of a file under BACKUP_DIR as seen by the PostgreSQL tools"""
+    if LOCAL_MODE:
+        return str(path)
+    return f"{CONTAINER_BACKUP_DIR}/{Path(path).relative_to(BACKUP_DIR).as_posix()}"
+
+def run_sql(sql, database=DB_NAME):
+    """Run a query with psql and return the result rows as lists of strings"""
+    cmd = pg_command("psql", "-U", DB_USER, "-d", database, "-At", "-F", "\t", "-c", sql)
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return [line.split("\t") for line in result.stdout.splitlines() if line]
+
+def row_counts_sql():
+    return " UNION ALL ".join(f"SELECT '{table}', count(*) FROM {table}" for table in COUNTED_TABLES)
+
+def table_row_counts():
+    """Exact row counts of the application tables"""
+    return {table: int(count) for table, count in run_sql(row_counts_sql())}
+
+class ExportedSnapshot:
+    """A psql session holding a REPEATABLE READ transaction open, so pg_dump --snapshot
+    dumps exactly the state the row counts were taken in"""
+    
+    def __enter__(self):
+        cmd = pg_command("psql", "-U", DB_USER, "-d", DB_NAME, "-q", "-At", "-F", "\t",
+                         "-v", "ON_ERROR_STOP=1", stdin=True)
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            self.process.stdin.write("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY;\n"
+                                     "SELECT pg_export_snapshot();\n"
+                                     f"{row_counts_sql()};\n")
+            self.process.stdin.flush()
+            self.snapshot = self._read_line()
+            self.row_counts = {}
+            for _ in COUNTED_TABLES:
+                table, count = self._read_line().split("\t")
+                self.row_counts[table] = int(count)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+            raise
+        return self
+    
+    def _read_line(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"psql exited with code {self.process.wait()} while exporting a snapshot")
+        return line.rstrip("\n")
+    
+    def __exit__(self, *exc_info):
+        # The snapshot stays valid only while its transaction is open
+        self.process.stdin.write("COMMIT;\n")
+        self.process.stdin.close()
+        self.process.wait()
+        self.process.stdout.close()
+
+def path_size(path):
+    """Size of a file, or of all files below a directory"""
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size
+
+def write_metadata(metadata):
+    """Write the metadata JSON next to the backup it describes"""
+    metadata_path = BACKUP_DIR / f"{metadata['name']}.json"
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return metadata_path
+
+def load_metadata(backup_type=None):
+    """Metadata of all backups (optionally of one type), newest first"""
+    backups = []
+    for metadata_file in BACKUP_DIR.glob("voting_db_*.json"):
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+        metadata.setdefault("type", "sql")
+        metadata.setdefault("name", metadata_file.stem)
+        if backup_type is None or metadata["type"] == backup_type:
+            backups.append(metadata)
+    backups.sort(key=lambda m: m["timestamp"], reverse=True)
+    return backups
+
+def timing_metrics(size, database_size, duration):
+    """Size and speed figures stored with every backup"""
+    return {
+        "size": size,
+        "database_size": database_size,
+        "compression_ratio": round(database_size / size, 2) if size else None,
+        "duration_seconds": round(duration, 2),
+        "throughput_mb_s": round(database_size / duration / 1024 / 1024, 2) if duration else None
+    }
+
 def create_backup():
-    """Create a database backup"""
+    """Create a compressed logical backup with parallel pg_dump jobs"""
     print("🔄 Creating database backup...")
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_filename = f"voting_db_backup_{timestamp}.sql"
-    backup_path = BACKUP_DIR / backup_filename
+    name = f"voting_db_backup_{timestamp}"
+    backup_path = BACKUP_DIR / f"{name}.dir"
     
     try:
-        container_name = get_container_name()
-        
-        # Create SQL dump
-        cmd = [
-            "docker", "exec", container_name,
-            "pg_dump", "-U", "postgres", "-d", "voting_db", "--clean", "--create"
-        ]
-        
-        print(f"📝 Running backup command: {' '.join(cmd)}")
-        
-        with open(backup_path, 'w') as f:
-            result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True, check=True)
+        start = time.monotonic()
+        with ExportedSnapshot() as snapshot:
+            # Directory format dumps tables in parallel and compresses each table file as it is written
+            cmd = pg_command(
+                "pg_dump", "-U", DB_USER, "-d", DB_NAME,
+                "-Fd", "-j", str(DUMP_JOBS), "-Z", str(COMPRESSION_LEVEL),
+                f"--snapshot={snapshot.snapshot}", "-f", tool_path(backup_path)
+            )
+            
+            print(f"📝 Running backup command: {' '.join(cmd)}")
+            subprocess.run(cmd, stderr=subprocess.PIPE, text=True, check=True)
+        duration = time.monotonic() - start
         
-        # Create metadata file
+        database_size = int(run_sql("SELECT pg_database_size(current_database())")[0][0])
         metadata = {
+            "name": name,
+            "type": "logical",
             "timestamp": timestamp,
-            "filename": backup_filename,
-            "size": backup_path.stat().st_size,
+            "filename": backup_path.name,
+            "format": "directory",
+            "jobs": DUMP_JOBS,
+            "compression_level": COMPRESSION_LEVEL,
+            **timing_metrics(path_size(backup_path), database_size, duration),
             "created_at": datetime.now().isoformat(),
-            "container": container_name,
-            "database": "voting_db"
+            "container": "local" if LOCAL_MODE else get_container_name(),
+            "database": DB_NAME,
+            # Counted in the snapshot pg_dump read, so they match the dump exactly
+            "row_counts": snapshot.row_counts
         }
+        write_metadata(metadata)
         
-        metadata_path = BACKUP_DIR / f"voting_db_backup_{timestamp}.json"
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
-        
-        print(f"✅ Backup created successfully: {backup_filename}")
-        print(f"📊 Backup size: {backup_path.stat().st_size / 1024:.2f} KB")
+        print(f"✅ Backup created successfully: {backup_path.name}")
+        print(f"📊 Backup size: {metadata['size'] / 1024:.2f} KB "
+              f"(database {database_size / 1024:.2f} KB) in {metadata['duration_seconds']}s")
         
         # Clean old backups
         cleanup_old_backups()
@@ -95,32 +222,166 @@ def create_backup():
         print(f"❌ Backup error: {e}")
         return None
 
+def create_base_backup():
+    """Create a physical base backup that archived WAL can be replayed on top of"""
+    print("🔄 Creating base backup...")
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"voting_db_base_{timestamp}"
+    backup_path = BACKUP_DIR / name
+    
+    try:
+        # Every WAL segment from here on is needed to roll this backup forward
+        start_wal = run_sql("SELECT pg_walfile_name(pg_current_wal_lsn())")[0][0]
+        
+        cmd = pg_command(
+            "pg_basebackup", "-U", DB_USER, "-D", tool_path(backup_path),
+            "-Ft", "-z", "-Z", str(COMPRESSION_LEVEL), "-Xs", "-c", "fast", "-l", name
+        )
+        print(f"📝 Running backup command: {' '.join(cmd)}")
+        
+        start = time.monotonic()
+        subprocess.run(cmd, stderr=subprocess.PIPE, text=True, check=True)
+        duration = time.monotonic() - start
+        
+        database_size = int(run_sql("SELECT pg_database_size(current_database())")[0][0])
+        metadata = {
+            "name": name,
+            "type": "base",
+            "timestamp": timestamp,
+            "filename": backup_path.name,
+            "format": "tar",
+            "start_wal": start_wal,
+            **timing_metrics(path_size(backup_path), database_size, duration),
+            "created_at": datetime.now().isoformat(),
+            "container": "local" if LOCAL_MODE else get_container_name(),
+            "database": DB_NAME
+        }
+        write_metadata(metadata)
+        
+        print(f"✅ Base backup created successfully: {name}")
+        print(f"📊 Backup size: {metadata['size'] / 1024:.2f} KB in {metadata['duration_seconds']}s")
+        
+        cleanup_old_backups()
+        return backup_path
+        
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Base backup failed: {e}")
+        if e.stderr:
+            print(f"Error details: {e.stderr}")
+        return None
+    except Exception as e:
+        print(f"❌ Base backup error: {e}")
+        return None
+
+def wal_segment_name(path):
+    """WAL segment name of an archived file (without .gz), or None for other files"""
+    name = path.name[:-3] if path.name.endswith(".gz") else path.name
+    return name if len(name) == 24 and all(c in "0123456789ABCDEF" for c in name) else None
+
+def archived_wal_segments(after=None, up_to=None):
+    """Archived WAL files with after < segment <= up_to, in order"""
+    segments = []
+    for path in wal_archive_dir().iterdir():
+        segment = wal_segment_name(path)
+        if segment and (after is None or segment > after) and (up_to is None or segment <= up_to):
+            segments.append(path)
+    return sorted(segments, key=wal_segment_name)
+
+def create_incremental_backup():
+    """Close the current WAL segment and record the WAL archived since the last backup"""
+    print("🔄 Creating incremental (WAL) backup...")
+    
+    bases = load_metadata("base")
+    if not bases:
+        print("❌ No base backup found. Create one first: python backup_recovery.py --backup --base")
+        return None
+    base = bases[0]
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"voting_db_wal_{timestamp}"
+    
+    try:
+        start = time.monotonic()
+        
+        # Switching forces the segment in progress into the archive
+        last_wal = run_sql("SELECT pg_walfile_name(pg_switch_wal())")[0][0]
+        deadline = time.monotonic() + WAL_ARCHIVE_TIMEOUT
+        while True:
+            archived = run_sql("SELECT coalesce(last_archived_wal, '') FROM pg_stat_archiver")[0][0]
+            if archived[:24] >= last_wal:
+                break
+            if time.monotonic() > deadline:
+                print(f"❌ WAL segment {last_wal} was not archived within {WAL_ARCHIVE_TIMEOUT}s, check archive_command")
+                return None
+            time.sleep(1)
+        duration = time.monotonic() - start
+        
+        previous = [m for m in load_metadata("incremental") if m.get("base") == base["name"]]
+        after = previous[0]["last_wal"] if previous else None
+        segments = archived_wal_segments(after=after, up_to=last_wal)
+        if after is None:
+            segments = [s for s in segments if wal_segment_name(s) >= base["start_wal"]]
+        
+        size = sum(path.stat().st_size for path in segments)
+        metadata = {
+            "name": name,
+            "type": "incremental",
+            "timestamp": timestamp,
+            "base": base["name"],
+            "first_wal": wal_segment_name(segments[0]) if segments else None,
+            "last_wal": last_wal,
+            "wal_files": len(segments),
+            "compressed_files": sum(1 for path in segments if path.name.endswith(".gz")),
+            "size": size,
+            "duration_seconds": round(duration, 2),
+            "created_at": datetime.now().isoformat(),
+            "container": "local" if LOCAL_MODE else get_container_name(),
+            "database": DB_NAME
+        }
+        write_metadata(metadata)
+        
+        print(f"✅ Incremental backup recorded: {len(segments)} WAL segments up to {last_wal}")
+        print(f"📊 WAL size: {size / 1024:.2f} KB, on top of base backup {base['name']}")
+        return metadata
+        
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Incremental backup failed: {e}")
+        if e.stderr:
+            print(f"Error details: {e.stderr}")
+        return None
+    except Exception as e:
+        print(f"❌ Incremental backup error: {e}")
+        return None
+
 def list_backups():
     """List available backups"""
     print("\n📋 Available backups:")
     
     backups = []
+    for metadata in load_metadata():
+        if metadata["type"] == "incremental":
+            continue
+        backups.append({
+            'file': BACKUP_DIR / metadata['filename'],
+            'metadata': metadata
+        })
+    
+    # Legacy SQL dumps without metadata
+    described = {backup['file'].name for backup in backups}
     for backup_file in BACKUP_DIR.glob("voting_db_backup_*.sql"):
-        metadata_file = backup_file.with_suffix('.json')
-        
-        if metadata_file.exists():
-            with open(metadata_file) as f:
-                metadata = json.load(f)
-            backups.append({
-                'file': backup_file,
-                'metadata': metadata
-            })
-        else:
-            # Backup without metadata
-            stat = backup_file.stat()
-            backups.append({
-                'file': backup_file,
-                'metadata': {
-                    'timestamp': backup_file.stem.split('_')[-2] + '_' + backup_file.stem.split('_')[-1],
-                    'size': stat.st_size,
-                    'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                }
-            })
+        if backup_file.name in described:
+            continue
+        stat = backup_file.stat()
+        backups.append({
+            'file': backup_file,
+            'metadata': {
+                'type': 'sql',
+                'timestamp': backup_file.stem.split('_')[-2] + '_' + backup_file.stem.split('_')[-1],
+                'size': stat.st_size,
+                'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat()
+            }
+        })
     
     # Sort by timestamp
     backups.sort(key=lambda x: x['metadata']['timestamp'], reverse=True)
@@ -134,16 +395,94 @@ def list_backups():
         size_kb = metadata['size'] / 1024
         created = metadata.get('created_at', 'Unknown')
         
-        print(f"{i:2d}. {backup['file'].name}")
+        print(f"{i:2d}. {backup['file'].name} ({metadata['type']})")
         print(f"    Created: {created}")
         print(f"    Size: {size_kb:.2f} KB")
+        if metadata.get('duration_seconds') is not None:
+            print(f"    Duration: {metadata['duration_seconds']}s")
+        if metadata['type'] == 'base':
+            increments = [m for m in load_metadata("incremental") if m.get("base") == metadata.get("name")]
+            if increments:
+                print(f"    WAL up to: {increments[0]['last_wal']} ({increments[0]['created_at']})")
         print()
     
     return backups
 
-def restore_backup(backup_path=None):
+RESTORE_SECTIONS = ["pre-data", "data", "post-data"]  # indexes and constraints are built after the data
+
+def recreate_database():
+    """Drop and create the database empty, so the restore never meets existing objects"""
+    # Separate calls: neither statement may run inside a transaction block
+    run_sql(f'DROP DATABASE IF EXISTS "{DB_NAME}" WITH (FORCE)', database="postgres")
+    run_sql(f'CREATE DATABASE "{DB_NAME}"', database="postgres")
+
+def restore_dump(backup_path, jobs):
+    """Restore a directory or custom format dump section by section with pg_restore -j"""
+    toc = subprocess.run(pg_command("pg_restore", "-l", tool_path(backup_path)),
+                         capture_output=True, text=True, check=True).stdout
+    total_items = sum(1 for line in toc.splitlines() if line and not line.startswith(";"))
+    total_bytes = path_size(backup_path)
+    done_items, done_bytes = 0, 0
+    start = time.monotonic()
+    
+    # pg_restore --clean drops tables without CASCADE, which fails on the foreign keys
+    # of an existing schema; restoring into a fresh database avoids that
+    recreate_database()
+    for section in RESTORE_SECTIONS:
+        cmd = pg_command(
+            "pg_restore", "-U", DB_USER, "-d", DB_NAME, "-v", "--exit-on-error", "--no-owner",
+            "-j", str(jobs), f"--section={section}", tool_path(backup_path)
+        )
+        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        messages = []
+        for line in process.stderr:
+            messages = (messages + [line.rstrip()])[-20:]
+            item = RESTORE_PROGRESS.match(line)
+            if not item:
+                continue
+            done_items = min(done_items + 1, total_items)
+            if item.group("id") and backup_path.is_dir():
+                # Directory dumps keep each table's data in <dump id>.dat(.gz)
+                for data_file in (backup_path / f"{item.group('id')}.dat.gz", backup_path / f"{item.group('id')}.dat"):
+                    if data_file.exists():
+                        done_bytes += data_file.stat().st_size
+            elapsed = time.monotonic() - start
+            print(f"\r   [{section}] {done_items}/{total_items} items, "
+                  f"{done_bytes / 1024 / 1024:.1f}/{total_bytes / 1024 / 1024:.1f} MB, "
+                  f"{done_bytes / 1024 / 1024 / elapsed if elapsed else 0:.1f} MB/s", end="", flush=True)
+        if process.wait() != 0:
+            print()
+            raise subprocess.CalledProcessError(process.returncode, cmd, stderr="\n".join(messages))
+        print(f"\n   ✓ {section} done after {time.monotonic() - start:.1f}s")
+    
+    return total_bytes, time.monotonic() - start
+
+def verify_row_counts(metadata):
+    """Compare restored row counts with the ones stored with the backup"""
+    expected = metadata.get("row_counts")
+    if not expected:
+        print("⚠️  Backup metadata has no row counts, skipping verification")
+        return True
+    
+    actual = table_row_counts()
+    ok = True
+    print("🔍 Verifying row counts:")
+    for table, count in expected.items():
+        restored = actual.get(table)
+        mark = "✓" if restored == count else "❌"
+        ok = ok and restored == count
+        print(f"   {mark} {table}: {restored} restored, {count} in backup")
+    return ok
+
+def restore_backup(backup_path=None, assume_yes=False, jobs=DUMP_JOBS):
     """Restore database from backup"""
-    if backup_path is None:
+    if backup_path is None and assume_yes:
+        logical = load_metadata("logical")
+        if not logical:
+            print("❌ No logical backups available for restore")
+            return False
+        backup_path = BACKUP_DIR / logical[0]["filename"]
+    elif backup_path is None:
         backups = list_backups()
         if not backups:
             print("❌ No backups available for restore")
@@ -160,34 +499,59 @@ def restore_backup(backup_path=None):
             print("❌ Please enter a valid number")
             return False
     
+    backup_path = Path(backup_path)
+    if not backup_path.exists() and (BACKUP_DIR / backup_path).exists():
+        backup_path = BACKUP_DIR / backup_path
+    if not backup_path.exists():
+        print(f"❌ Backup not found: {backup_path}")
+        return False
+    
+    if backup_path.name.startswith("voting_db_base_"):
+        print("❌ Base backups are restored by replaying WAL: use --restore --pitr TIME")
+        return False
+    
     print(f"🔄 Restoring database from: {backup_path.name}")
     
     # Confirm restore
-    confirm = input("⚠️  This will overwrite the current database. Continue? (yes/no): ")
-    if confirm.lower() != 'yes':
-        print("Restore cancelled.")
-        return False
+    if not assume_yes:
+        confirm = input("⚠️  This will overwrite the current database. Continue? (yes/no): ")
+        if confirm.lower() != 'yes':
+            print("Restore cancelled.")
+            return False
+    
+    metadata_path = backup_path.with_suffix('.json')
+    metadata = json.loads(metadata_path.read_text()) if metadata_path.exists() else {}
     
     try:
-        container_name = get_container_name()
-        
         # Stop the application to prevent conflicts
-        print("🛑 Stopping application...")
-        subprocess.run(["docker-compose", "stop", "voting-app"], check=False)
-        
-        # Restore database
-        cmd = [
-            "docker", "exec", "-i", container_name,
-            "psql", "-U", "postgres", "-d", "postgres"
-        ]
+        if not LOCAL_MODE:
+            print("🛑 Stopping application...")
+            subprocess.run(["docker-compose", "stop", "voting-app"], check=False)
         
         print("📥 Restoring database...")
-        with open(backup_path, 'r') as f:
-            result = subprocess.run(cmd, stdin=f, stderr=subprocess.PIPE, text=True, check=True)
+        if backup_path.suffix == ".sql":
+            # Plain SQL dump of older versions
+            start = time.monotonic()
+            cmd = pg_command("psql", "-U", DB_USER, "-d", "postgres", stdin=True)
+            with open(backup_path, 'r') as f:
+                subprocess.run(cmd, stdin=f, stderr=subprocess.PIPE, text=True, check=True)
+            size, duration = backup_path.stat().st_size, time.monotonic() - start
+        else:
+            size, duration = restore_dump(backup_path, jobs)
+        
+        print(f"📊 Restored {size / 1024 / 1024:.1f} MB of backup in {duration:.1f}s "
+              f"({size / 1024 / 1024 / duration if duration else 0:.1f} MB/s, {jobs} jobs)")
+        
+        verified = verify_row_counts(metadata)
         
         # Restart application
-        print("🚀 Restarting application...")
-        subprocess.run(["docker-compose", "start", "voting-app"], check=False)
+        if not LOCAL_MODE:
+            print("🚀 Restarting application...")
+            subprocess.run(["docker-compose", "start", "voting-app"], check=False)
+        
+        if not verified:
+            print("❌ Restored row counts differ from the backup metadata")
+            return False
         
         print("✅ Database restored successfully!")
         return True
@@ -201,20 +565,142 @@ def restore_backup(backup_path=None):
         print(f"❌ Restore error: {e}")
         return False
 
+def choose_base_backup(target_time, base_name=None):
+    """Newest base backup finished before target_time, or the one named base_name"""
+    for base in load_metadata("base"):
+        if base_name and base["name"] != base_name:
+            continue
+        if datetime.fromisoformat(base["created_at"]) <= target_time:
+            return base
+    return None
+
+def pitr_script(base, target_time, pgdata):
+    """Shell script replacing the data directory with the base backup, set up to replay WAL to target_time"""
+    base_dir = tool_path(BACKUP_DIR / base["filename"])
+    wal_dir = tool_path(wal_archive_dir())
+    moved = f"{pgdata}.before_pitr_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # Archived segments are gzipped by archive_command, older ones may be plain copies
+    restore_command = (f"f={wal_dir}/%f; if [ -f $f.gz ]; then gunzip -c $f.gz > %p; "
+                       f"else cp $f %p; fi")
+    return "\n".join([
+        "set -e",
+        f'mv "{pgdata}" "{moved}"',
+        f'mkdir -p "{pgdata}/pg_wal"',
+        f'chmod 700 "{pgdata}"',
+        f'tar -xzf "{base_dir}/base.tar.gz" -C "{pgdata}"',
+        f'if [ -f "{base_dir}/pg_wal.tar.gz" ]; then tar -xzf "{base_dir}/pg_wal.tar.gz" -C "{pgdata}/pg_wal"; fi',
+        f'touch "{pgdata}/recovery.signal"',
+        f'cat >> "{pgdata}/postgresql.auto.conf" <<\'EOF\'',
+        f"restore_command = '{restore_command}'",
+        f"recovery_target_time = '{target_time.isoformat(sep=' ')}'",
+        "recovery_target_action = 'promote'",
+        "EOF",
+        f'echo "Previous data directory kept at {moved}"',
+    ]) + "\n"
+
+def wait_for_recovery(timeout):
+    """Wait until the server has replayed WAL to the target and been promoted"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if run_sql("SELECT pg_is_in_recovery()")[0][0] == "f":
+                return True
+        except (subprocess.CalledProcessError, IndexError):
+            pass  # still starting up
+        time.sleep(2)
+    return False
+
+def restore_point_in_time(target, base_name=None, assume_yes=False):
+    """Restore a base backup and replay archived WAL up to the target time"""
+    try:
+        target_time = datetime.fromisoformat(target)
+    except ValueError:
+        print(f"❌ Invalid target time {target!r}, use e.g. '2025-06-11 14:30:00'")
+        return False
+    
+    base = choose_base_backup(target_time, base_name)
+    if base is None:
+        print(f"❌ No base backup{' ' + base_name if base_name else ''} finished before {target_time}")
+        return False
+    
+    print(f"🔄 Point-in-time restore to {target_time} from base backup {base['name']}")
+    
+    if not assume_yes:
+        confirm = input("⚠️  This will replace the current database cluster. Continue? (yes/no): ")
+        if confirm.lower() != 'yes':
+            print("Restore cancelled.")
+            return False
+    
+    start = time.monotonic()
+    try:
+        print("🛑 Stopping application and database...")
+        if LOCAL_MODE:
+            pgdata = os.environ["PGDATA"]
+            subprocess.run(["pg_ctl", "-D", pgdata, "stop", "-m", "fast"], check=False)
+            subprocess.run(["sh", "-c", pitr_script(base, target_time, pgdata)], check=True)
+            print("🚀 Starting database in recovery mode...")
+            subprocess.run(["pg_ctl", "-D", pgdata, "-l", str(BACKUP_DIR / "pitr.log"), "start"], check=True)
+        else:
+            subprocess.run(["docker-compose", "stop", "voting-app", "db"], check=False)
+            subprocess.run([
+                "docker-compose", "run", "--rm", "--no-deps", "-T", "--user", "postgres",
+                "--entrypoint", "sh", "db", "-c", pitr_script(base, target_time, CONTAINER_PGDATA)
+            ], check=True)
+            print("🚀 Starting database in recovery mode...")
+            subprocess.run(["docker-compose", "start", "db"], check=True)
+        
+        print("⏳ Replaying archived WAL...")
+        if not wait_for_recovery(PITR_TIMEOUT):
+            print(f"❌ Recovery did not finish within {PITR_TIMEOUT}s, check the PostgreSQL log")
+            return False
+        
+        if not LOCAL_MODE:
+            print("🚀 Restarting application...")
+            subprocess.run(["docker-compose", "start", "voting-app"], check=False)
+        
+        print(f"✅ Database restored to {target_time} in {time.monotonic() - start:.1f}s")
+        return True
+        
+    except (subprocess.CalledProcessError, KeyError) as e:
+        print(f"❌ Point-in-time restore failed: {e}")
+        return False
+
+def remove_backup(backup_path):
+    """Delete a backup file or directory together with its metadata"""
+    print(f"🗑️  Removing old backup: {backup_path.name}")
+    if backup_path.is_dir():
+        shutil.rmtree(backup_path)
+    elif backup_path.exists():
+        backup_path.unlink()
+    
+    metadata_file = backup_path.with_suffix('.json')
+    if metadata_file.exists():
+        metadata_file.unlink()
+
 def cleanup_old_backups():
-    """Remove old backups, keeping only the latest MAX_BACKUPS"""
-    backups = list(BACKUP_DIR.glob("voting_db_backup_*.sql"))
+    """Remove old backups, keeping only the latest MAX_BACKUPS logical and MAX_BASE_BACKUPS base backups"""
+    backups = list(BACKUP_DIR.glob("voting_db_backup_*.sql")) + list(BACKUP_DIR.glob("voting_db_backup_*.dir"))
     backups.sort(key=lambda x: x.stat().st_mtime, reverse=True)
     
-    if len(backups) > MAX_BACKUPS:
-        for backup_file in backups[MAX_BACKUPS:]:
-            metadata_file = backup_file.with_suffix('.json')
-            
-            print(f"🗑️  Removing old backup: {backup_file.name}")
-            backup_file.unlink()
-            
-            if metadata_file.exists():
-                metadata_file.unlink()
+    for backup_path in backups[MAX_BACKUPS:]:
+        remove_backup(backup_path)
+    
+    bases = load_metadata("base")
+    if len(bases) <= MAX_BASE_BACKUPS:
+        return
+    
+    for base in bases[MAX_BASE_BACKUPS:]:
+        remove_backup(BACKUP_DIR / base["filename"])
+        for increment in load_metadata("incremental"):
+            if increment.get("base") == base["name"]:
+                (BACKUP_DIR / f"{increment['name']}.json").unlink()
+    
+    # WAL older than the oldest remaining base backup can never be replayed
+    oldest_wal = bases[MAX_BASE_BACKUPS - 1]["start_wal"]
+    print(f"🗑️  Removing archived WAL before {oldest_wal}")
+    for extension in ([], ["-x", ".gz"]):
+        subprocess.run(pg_command("pg_archivecleanup", *extension, tool_path(wal_archive_dir()), oldest_wal),
+                       capture_output=True, text=True, check=False)
 
 def setup_automatic_backups():
     """Setup automatic backup schedule"""
@@ -326,7 +812,16 @@ def main():
     
     parser = argparse.ArgumentParser(description="NVIAS Voting System Backup & Recovery")
     parser.add_argument("--backup", action="store_true", help="Create a backup")
-    parser.add_argument("--restore", action="store_true", help="Restore from backup")
+    parser.add_argument("--base", action="store_true", help="With --backup: physical base backup for WAL replay")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --backup: archive the current WAL on top of the latest base backup")
+    parser.add_argument("--restore", nargs="?", const="", default=None, metavar="FILE",
+                        help="Restore from backup (FILE, or pick interactively; the latest with --yes)")
+    parser.add_argument("--pitr", metavar="TIME",
+                        help="With --restore: replay archived WAL up to TIME, e.g. '2025-06-11 14:30:00'")
+    parser.add_argument("--base-backup", metavar="NAME", help="With --pitr: base backup to start from")
+    parser.add_argument("--yes", action="store_true", help="Do not ask for confirmation")
+    parser.add_argument("--jobs", type=int, default=DUMP_JOBS, help="Parallel pg_restore jobs")
     parser.add_argument("--list", action="store_true", help="List available backups")
     parser.add_argument("--health", action="store_true", help="Check database health")
     parser.add_argument("--setup-auto", action="store_true", help="Setup automatic backups")
@@ -340,10 +835,16 @@ def main():
         print("🗳️  NVIAS Voting System - Backup & Recovery Tool")
         print("=" * 50)
     
-    if args.backup:
+    if args.backup and args.base:
+        create_base_backup()
+    elif args.backup and args.incremental:
+        create_incremental_backup()
+    elif args.backup:
         create_backup()
-    elif args.restore:
-        restore_backup()
+    elif args.restore is not None and args.pitr:
+        sys.exit(0 if restore_point_in_time(args.pitr, args.base_backup, args.yes) else 1)
+    elif args.restore is not None:
+        sys.exit(0 if restore_backup(args.restore or None, args.yes, args.jobs) else 1)
     elif args.list:
         list_backups()
     elif args.health:
@@ -353,7 +854,11 @@ def main():
     else:
         print("Available commands:")
         print("  --backup      Create a database backup")
+        print("  --backup --base         Create a base backup for WAL replay")
+        print("  --backup --incremental  Archive WAL written since the last backup")
         print("  --restore     Restore from backup")
+        print("  --restore FILE --yes    Restore a backup without prompts (pg_restore -j --jobs)")
+        print("  --restore --pitr TIME   Restore to a point in time from base backup + WAL")
         print("  --list        List available backups")
         print("  --health      Check database health")
         print("  --setup-auto  Setup automatic backups")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark deleting a large voting session.
+Generates a session with the requested number of votes and times the
+set-based delete (archive.delete_sessions) against the ORM cascade delete.
+Runs against DATABASE_URL, or a temporary SQLite file with --sqlite.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+BATCH_SIZE = 50000
+
+
+def create_large_session(unique_id, vote_count, questions=5, teams=20):
+    """Insert a session with vote_count votes using bulk inserts"""
+    from models import db, VotingSession, Question, Team, Vote, Voter
+
+    session = VotingSession(unique_id=unique_id, name=f'Benchmark {unique_id}', started=True, ended=True)
+    db.session.add(session)
+    db.session.flush()
+
+    question_rows = [Question(session_id=session.id, text=f'Question {n}', question_type='rating',
+                              options=['1', '2', '3', '4', '5'], order_index=n) for n in range(questions)]
+    team_rows = [Team(session_id=session.id, name=f'Team {n}') for n in range(teams)]
+    db.session.add_all(question_rows + team_rows)
+    db.session.commit()
+    question_ids = [q.id for q in question_rows]
+    team_ids = [t.id for t in team_rows]
+
+    voter_count = -(-vote_count // questions)
+    first_voter_id = (db.session.query(db.func.max(Voter.id)).scalar() or 0) + 1
+    for start in range(0, voter_count, BATCH_SIZE):
+        db.session.execute(insert(Voter), [
+            {'id': first_voter_id + n, 'session_id': session.id, 'identifier': f'voter-{n}'}
+            for n in range(start, min(start + BATCH_SIZE, voter_count))
+        ])
+
+    for start in range(0, vote_count, BATCH_SIZE):
+        db.session.execute(insert(Vote), [
+            {'session_id': session.id, 'question_id': question_ids[n % questions],
+             'team_id': team_ids[n % teams], 'voter_id': first_voter_id + n // questions,
+             'voter_team_id': team_ids[(n // questions) % teams],
+             'option_selected': str(n % 5 + 1), 'numeric_value': n % 5 + 1}
+            for n in range(start, min(start + BATCH_SIZE, vote_count))
+        ])
+    db.session.commit()
+    return session
+
+
+def time_it(label, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label}: {elapsed:.2f}s")
+    return elapsed
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark voting session deletion")
+    parser.add_argument("--votes", type=int, default=1000000, help="Votes in the benchmark session")
+    parser.add_argument("--orm-votes", type=int, default=50000,
+                        help="Votes in the session deleted through the ORM cascade (0 to skip)")
+    parser.add_argument("--sqlite", action="store_true", help="Use a temporary SQLite database")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+
+    from server import create_app
+    from models import db, VotingSession
+    from archive import delete_sessions
+
+    app = create_app('production')
+    with app.app_context():
+        db.create_all()
+        print(f"🗄️  Database: {db.engine.url.render_as_string(hide_password=True)}")
+
+        print(f"📥 Creating session with {args.votes:,} votes...")
+        session = create_large_session('900001', args.votes)
+        time_it(f"set-based delete of {args.votes:,} votes", lambda: delete_sessions([session]))
+
+        if args.orm_votes:
+            print(f"📥 Creating session with {args.orm_votes:,} votes...")
+            session = create_large_session('900002', args.orm_votes)
+
+            def orm_delete():
+                db.session.delete(db.session.get(VotingSession, session.id))
+                db.session.commit()
+
+            time_it(f"ORM cascade delete of {args.orm_votes:,} votes", orm_delete)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
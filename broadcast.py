@@ -0,0 +1,230 @@
+"""
+Broadcast bus keeping several app containers coherent.
+Views publish "session changed" and "templates changed" events; they are sent
+when the surrounding transaction commits and dropped when it rolls back.
+Votes are only counted after their commit: committing a NOTIFY takes a
+database-wide lock, which would serialise the vote burst, so each worker
+publishes the "votes landed" counts every BROADCAST_VOTES_INTERVAL seconds
+in a transaction of its own.
+On PostgreSQL the events travel as NOTIFY on BROADCAST_CHANNEL and every
+node (this one included) receives them on a listener thread; the in-process
+bus delivers them directly and stands in for tests and single-node setups.
+Subscribers run in their own app context, so they may use the database.
+"""
+
+import json
+import os
+import select
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, text
+
+from models import db, RoutingSession
+from qr import qr_cache
+from snapshot import clear_snapshot_cache
+
+SESSION_CHANGED = 'session_changed'
+VOTES_LANDED = 'votes_landed'
+TEMPLATES_CHANGED = 'templates_changed'
+VOTES_INTERVAL = 2.0  # seconds between the coalesced "votes landed" events of a worker
+LISTEN_TIMEOUT = 5.0  # seconds between checks of an idle listener connection
+RECONNECT_DELAY = 2.0  # doubled after every failed attempt, up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 60.0
+
+
+def publish(name, **payload):
+    """Queue an event on the current database transaction"""
+    db.session.info.setdefault('broadcast_events', []).append((name, payload))
+
+
+def votes_landed(session, votes):
+    """Count votes of a session once they are committed; see MemoryBus.flush_votes"""
+    bus = _bus()
+    if bus is not None and votes:
+        bus.count_votes(session, votes)
+
+
+class MemoryBus:
+    """Delivers events to the subscribers of this process after commit"""
+
+    def __init__(self, app):
+        self.app = app
+        self.subscribers = {}
+        self.votes_interval = app.config.get('BROADCAST_VOTES_INTERVAL', VOTES_INTERVAL)
+        self._landed = {}
+        self._flusher_pid = None
+        self._votes_lock = threading.Lock()
+
+    def subscribe(self, name, callback):
+        self.subscribers.setdefault(name, []).append(callback)
+
+    def start(self):
+        pass
+
+    def send(self, session, events):
+        """Called before commit"""
+
+    def sent(self, events):
+        """Called after commit"""
+        for name, payload in events:
+            self.dispatch(name, payload)
+
+    def dispatch(self, name, payload):
+        for callback in self.subscribers.get(name, []):
+            with self.app.app_context():
+                try:
+                    callback(payload)
+                except Exception as e:
+                    self.app.logger.warning(f"Broadcast subscriber for {name} failed: {e}")
+
+    def count_votes(self, session, votes):
+        with self._votes_lock:
+            self._landed[session] = self._landed.get(session, 0) + votes
+            if self.votes_interval and self._flusher_pid != os.getpid():
+                # Once per process, again after a fork
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_periodically, name='broadcast-votes', daemon=True).start()
+
+    def flush_votes(self):
+        """Publish one "votes landed" event per session with the votes counted
+        since the last flush, in a transaction of its own"""
+        with self._votes_lock:
+            landed, self._landed = self._landed, {}
+        if not landed:
+            return
+        with self.app.app_context():
+            try:
+                for session, votes in landed.items():
+                    publish(VOTES_LANDED, session=session, votes=votes)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.votes_interval)
+            try:
+                self.flush_votes()
+            except Exception as e:
+                self.app.logger.warning(f"Broadcast of landed votes failed: {e}")
+
+
+class PostgresBus(MemoryBus):
+    """NOTIFY in the committing transaction, LISTEN on a thread per worker process"""
+
+    def __init__(self, app, channel):
+        super().__init__(app)
+        self.channel = channel
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def send(self, session, events):
+        for name, payload in events:
+            session.execute(text('SELECT pg_notify(:channel, :message)'), {
+                'channel': self.channel,
+                'message': json.dumps({'event': name, **payload})
+            })
+
+    def sent(self, events):
+        # Delivered by the listener, like the events of the other nodes
+        pass
+
+    def start(self):
+        """Start the listener thread once per process, again after a fork"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, name='broadcast-listener', daemon=True).start()
+
+    def _listen(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                with self.app.app_context():
+                    connection = db.engine.raw_connection()
+                # The listening connection lives outside the pool for good
+                connection.detach()
+                delay = RECONNECT_DELAY
+                try:
+                    self._receive(connection.driver_connection)
+                finally:
+                    connection.close()
+            except Exception as e:
+                self.app.logger.warning(f"Broadcast listener reconnecting in {delay:.0f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _receive(self, dbapi_connection):
+        dbapi_connection.autocommit = True
+        dbapi_connection.cursor().execute(f'LISTEN "{self.channel}"')
+        if hasattr(dbapi_connection, 'poll'):
+            # psycopg2
+            while True:
+                if select.select([dbapi_connection], [], [], LISTEN_TIMEOUT)[0]:
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self.deliver(dbapi_connection.notifies.pop(0).payload)
+        else:
+            # psycopg 3
+            while True:
+                for notify in dbapi_connection.notifies(timeout=LISTEN_TIMEOUT):
+                    self.deliver(notify.payload)
+
+    def deliver(self, message):
+        message = json.loads(message)
+        self.dispatch(message.pop('event'), message)
+
+
+def forget_deleted_qr(payload):
+    if payload.get('change') == 'deleted':
+        qr_cache.forget(payload['session'])
+
+
+def init_broadcast(app):
+    """Create the app's bus and subscribe the local caches to it"""
+    app.config.setdefault('BROADCAST_BACKEND', 'auto')
+    app.config.setdefault('BROADCAST_CHANNEL', 'voting_events')
+    app.config.setdefault('BROADCAST_VOTES_INTERVAL', VOTES_INTERVAL)
+
+    backend = app.config['BROADCAST_BACKEND']
+    if backend == 'auto':
+        backend = 'postgresql' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql') else 'memory'
+    bus = PostgresBus(app, app.config['BROADCAST_CHANNEL']) if backend == 'postgresql' else MemoryBus(app)
+    app.extensions['broadcast'] = bus
+
+    bus.subscribe(SESSION_CHANGED, lambda payload: clear_snapshot_cache())
+    bus.subscribe(SESSION_CHANGED, forget_deleted_qr)
+    # Listener threads belong to the workers, not to a preloading master
+    app.before_request(bus.start)
+    return bus
+
+
+def _bus():
+    return current_app.extensions.get('broadcast') if has_app_context() else None
+
+
+@event.listens_for(RoutingSession, 'before_commit')
+def _send_events(session):
+    events = session.info.get('broadcast_events')
+    bus = _bus()
+    if events and bus is not None:
+        bus.send(session, events)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _deliver_events(session):
+    events = session.info.pop('broadcast_events', None)
+    bus = _bus()
+    if events and bus is not None:
+        bus.sent(events)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('broadcast_events', None)
@@ -0,0 +1,121 @@
+"""
+Cached question template catalogue.
+Templates are read far more often than they are created, so each page of the
+catalogue is queried once per version stamp and then served from memory.
+The stamp is the newest template id: create_question_template announces it
+over the broadcast bus, so every node moves to the same stamp and clients can
+revalidate with an ETag derived from it on any of them. Each node also
+re-reads the stamp every VERSION_TTL seconds, so a missed announcement only
+leaves it stale for that long.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, QuestionTemplate
+from broadcast import TEMPLATES_CHANGED
+
+MAX_PER_PAGE = 200
+CACHED_PAGES = 64
+VERSION_TTL = 30
+
+
+def serialize_template(template):
+    return {
+        'id': template.id,
+        'name': template.name,
+        'description': template.description,
+        'question_type': template.question_type,
+        'options': template.options
+    }
+
+
+def name_prefix_pattern(name):
+    """LIKE pattern for names starting with `name`, its wildcards escaped"""
+    escaped = name.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%'
+
+
+def load_templates(question_type=None, name=None, page=1, per_page=None):
+    """(templates, total) matching the filters, ordered by id. Names match by
+    case-insensitive prefix, which ix_question_templates_name_lower serves."""
+    query = QuestionTemplate.query
+    if question_type:
+        query = query.filter(QuestionTemplate.question_type == question_type)
+    if name:
+        query = query.filter(func.lower(QuestionTemplate.name).like(name_prefix_pattern(name), escape='\\'))
+
+    query = query.order_by(QuestionTemplate.id)
+    if per_page is None:
+        templates = query.all()
+        return [serialize_template(t) for t in templates], len(templates)
+
+    total = query.order_by(None).count()
+    templates = query.offset((page - 1) * per_page).limit(per_page).all()
+    return [serialize_template(t) for t in templates], total
+
+
+class TemplateCatalog:
+    """Pages of the catalogue keyed by (version, filters, page)"""
+
+    def __init__(self, max_pages=CACHED_PAGES, version_ttl=VERSION_TTL):
+        self.max_pages = max_pages
+        self.version_ttl = version_ttl
+        self.version = None
+        self._checked_at = None
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current_version(self):
+        """The stamp, read from the database on first use and again once it is
+        version_ttl seconds old"""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.version_ttl:
+            newest = db.session.query(func.max(QuestionTemplate.id)).scalar() or 0
+            with self._lock:
+                if self.version is None or newest > self.version:
+                    self.version = newest
+                    self._pages.clear()
+                self._checked_at = now
+        return self.version
+
+    def bump(self, version):
+        """Move to a newer stamp and drop the pages of the old one"""
+        with self._lock:
+            if self.version is None or version > self.version:
+                self.version = version
+            self._pages.clear()
+
+    def etag(self):
+        return f'templates-{self.current_version()}'
+
+    def page(self, question_type=None, name=None, page=1, per_page=None):
+        key = (self.current_version(), question_type, name, page, per_page)
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None:
+                self._pages.move_to_end(key)
+                return cached
+
+        cached = load_templates(question_type, name, page, per_page)
+        with self._lock:
+            self._pages[key] = cached
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return cached
+
+
+def template_catalog():
+    return current_app.extensions['template_catalog']
+
+
+def init_template_catalog(app):
+    """Create the app's catalogue cache and keep it in step with the other nodes"""
+    catalog = TemplateCatalog()
+    app.extensions['template_catalog'] = catalog
+    app.extensions['broadcast'].subscribe(TEMPLATES_CHANGED, lambda payload: catalog.bump(payload['version']))
+    return catalog
@@ -0,0 +1,140 @@
+"""
+Response compression for JSON API responses and static site assets.
+Brotli is used when the optional brotli package is installed and the client
+accepts it, gzip otherwise. Small, streamed and already encoded responses
+are passed through untouched.
+Compressed responses carry their ETag with the encoding appended ("abc-gzip").
+The suffix is taken off If-None-Match before the view runs, so every
+conditional path (make_conditional, static files, the template catalogue)
+compares against the tag it computes, and put back on the 304.
+"""
+
+import gzip
+
+from flask import g, request
+from werkzeug.http import parse_etags, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_COMPRESS_MIMETYPES = [
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'application/javascript',
+    'text/javascript',
+    'image/svg+xml'
+]
+
+
+def accepted_encodings():
+    """Encodings accepted by the client, ignoring those with q=0"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        encoding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if encoding:
+            accepted.add(encoding.lower())
+    return accepted
+
+
+def choose_encoding(accepted):
+    """Pick the best encoding supported on both sides"""
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def strip_encoding_suffixes(header, accepted):
+    """If-None-Match without the encoding suffixes compress_response adds, for
+    encodings the client still accepts, and the encoding found per bare tag"""
+    etags = parse_etags(header)
+    if etags.star_tag:
+        return header, {}
+    tags = []
+    encodings = {}
+    for tag in etags.as_set(include_weak=True):
+        bare, _, encoding = tag.rpartition('-')
+        if bare and encoding in accepted and encoding in ('br', 'gzip'):
+            encodings[bare] = encoding
+            tag = bare
+        tags.append(quote_etag(tag))
+    return ', '.join(tags), encodings
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+
+
+def init_compression(app):
+    """Compress eligible responses in an after_request hook, and let conditional
+    requests for them match in a before_request hook"""
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+    app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_COMPRESS_MIMETYPES)
+
+    @app.before_request
+    def match_compressed_etags():
+        header = request.headers.get('If-None-Match')
+        if not app.config['COMPRESS_ENABLED'] or not header:
+            return
+        header, g.compressed_etags = strip_encoding_suffixes(header, accepted_encodings())
+        if g.compressed_etags:
+            request.environ['HTTP_IF_NONE_MATCH'] = header
+            request.__dict__.pop('if_none_match', None)
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+
+        if response.status_code == 304:
+            # Answer with the tag the client holds for its compressed copy
+            etag, weak = response.get_etag()
+            encoding = g.get('compressed_etags', {}).get(etag)
+            if encoding:
+                response.set_etag(f'{etag}-{encoding}', weak=weak)
+                response.vary.add('Accept-Encoding')
+            return response
+
+        if (response.status_code != 200
+                or response.is_streamed and not response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or 'X-Sendfile' in response.headers
+                or 'X-Accel-Redirect' in response.headers
+                or response.mimetype not in config['COMPRESS_MIMETYPES']):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = choose_encoding(accepted_encodings())
+        if encoding is None:
+            return response
+
+        # Static files are sent as a passthrough file wrapper; read them so they can be compressed
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(compress(data, encoding, config))
+        response.headers['Content-Encoding'] = encoding
+        if response.headers.get('ETag'):
+            # Keep validators distinct per representation
+            etag, weak = response.get_etag()
+            response.set_etag(f'{etag}-{encoding}', weak=weak)
+        return response
+
+    return app
@@ -4,12 +4,13 @@ Create Flask-Migrate migrations
 """
 
 from flask_migrate import init, migrate, upgrade
-from server import create_app
+from server import create_app, init_migrations
 import os
 
 def main():
     """Initialize Flask-Migrate and create initial migration"""
     app = create_app()
+    init_migrations(app)
     
     with app.app_context():
         # Initialize migrations if not already done
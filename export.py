@@ -0,0 +1,178 @@
+"""
+Streaming export of raw votes for the voting application.
+Rows are read with a server-side cursor and written out chunk by chunk,
+so exporting a large session runs in constant memory.
+"""
+
+import csv
+import io
+import json
+
+from sqlalchemy.orm import aliased
+
+from models import db, Question, Team, Vote
+
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    'vote_id', 'question_id', 'question_text', 'team_id', 'team_name',
+    'voter_id', 'voter_team_id', 'voter_team_name', 'option_selected',
+    'numeric_value', 'text_value', 'timestamp'
+]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+def iter_vote_rows(session_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield export rows as tuples in EXPORT_COLUMNS order"""
+    voter_team = aliased(Team)
+    query = db.session.query(
+        Vote.id, Vote.question_id, Question.text, Vote.team_id, Team.name,
+        Vote.voter_id, Vote.voter_team_id, voter_team.name, Vote.option_selected,
+        Vote.numeric_value, Vote.text_value, Vote.timestamp
+    ).join(
+        Question, Vote.question_id == Question.id
+    ).join(
+        Team, Vote.team_id == Team.id
+    ).outerjoin(
+        voter_team, Vote.voter_team_id == voter_team.id
+    ).filter(
+        Vote.session_id == session_id
+    ).order_by(Vote.id).execution_options(yield_per=chunk_size)
+
+    for row in query:
+        yield tuple(row)
+
+
+def _iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(session_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the export as CSV text, one chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for chunk in _iter_chunks(iter_vote_rows(session_id, chunk_size), chunk_size):
+        writer.writerows(
+            row[:-1] + (row[-1].isoformat() if row[-1] else None,) for row in chunk
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_jsonl(session_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the export as JSON lines, one chunk of rows at a time"""
+    for chunk in _iter_chunks(iter_vote_rows(session_id, chunk_size), chunk_size):
+        lines = []
+        for row in chunk:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record['timestamp'] = row[-1].isoformat() if row[-1] else None
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield '\n'.join(lines) + '\n'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after each row group"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('vote_id', pa.int64()),
+        ('question_id', pa.int64()),
+        ('question_text', pa.string()),
+        ('team_id', pa.int64()),
+        ('team_name', pa.string()),
+        ('voter_id', pa.int64()),
+        ('voter_team_id', pa.int64()),
+        ('voter_team_name', pa.string()),
+        ('option_selected', pa.string()),
+        ('numeric_value', pa.float64()),
+        ('text_value', pa.string()),
+        ('timestamp', pa.timestamp('us'))
+    ])
+
+
+def parquet_available():
+    """Parquet export needs the optional pyarrow package"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def stream_parquet(session_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the export as Parquet bytes, writing one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    try:
+        for chunk in _iter_chunks(iter_vote_rows(session_id, chunk_size), chunk_size):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+
+def stream_export(session_id, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Return a chunk generator for the requested export format"""
+    if export_format == 'csv':
+        return stream_csv(session_id, chunk_size)
+    if export_format == 'jsonl':
+        return stream_jsonl(session_id, chunk_size)
+    if export_format == 'parquet':
+        return stream_parquet(session_id, chunk_size)
+    raise ValueError(f'Unsupported export format: {export_format}')
@@ -0,0 +1,27 @@
+"""
+gunicorn settings for the voting app.
+The app is built once in the master (preload_app) and forked; every worker
+then drops the inherited connection pool, opens its own and loads the hot
+caches in post_fork, before it accepts its first request.
+Run with: gunicorn -c gunicorn.conf.py
+"""
+
+import os
+
+wsgi_app = 'server:create_app()'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def post_fork(server, worker):
+    from server import prepare_worker
+
+    # The preloaded app; without preload_app this loads it here instead of in init_process
+    app = worker.app.wsgi()
+    try:
+        seconds = prepare_worker(app)
+        server.log.info(f"Worker {worker.pid} ready in {seconds:.2f}s")
+    except Exception as e:
+        # A cold cache is no reason to keep the worker from serving
+        server.log.warning(f"Worker {worker.pid} warm-up failed: {e}")
@@ -0,0 +1,180 @@
+"""
+Idempotency-Key support for vote submission endpoints.
+The first request with a key is executed and its response stored; retries
+with the same key get the stored response back instead of inserting the
+ballot again. Responses live in the idempotency_keys table with a small
+in-process LRU in front of it.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotencyKey
+
+MAX_KEY_LENGTH = 100
+MEMORY_CACHE_SIZE = 10000
+PURGE_INTERVAL = 60  # seconds between purges of expired keys per process
+RESERVATION_TIMEOUT = 60  # seconds after which an unfinished request is considered abandoned
+
+
+class ResponseCache:
+    """Thread-safe LRU of stored responses with expiry"""
+
+    def __init__(self, max_size=MEMORY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry['expires_at'] < time.monotonic():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, entry, ttl):
+        with self._lock:
+            self._entries[cache_key] = dict(entry, expires_at=time.monotonic() + ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+_last_purge = 0.0
+
+
+def _ttl():
+    return current_app.config.get('IDEMPOTENCY_TTL', 24 * 3600)
+
+
+def _replay(entry):
+    response = current_app.response_class(
+        entry['body'], status=entry['status_code'], content_type=entry['content_type']
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _conflict(message, status_code):
+    response = jsonify({'error': message})
+    response.status_code = status_code
+    if status_code == 409:
+        response.headers['Retry-After'] = '1'
+    return response
+
+
+def _is_stale(stored):
+    """Expired keys and reservations left behind by a crashed request can be reused"""
+    age = (datetime.utcnow() - stored.created_at).total_seconds()
+    return age > _ttl() or (stored.status_code is None and age > RESERVATION_TIMEOUT)
+
+
+def purge_expired_keys(force=False):
+    """Delete stored keys older than IDEMPOTENCY_TTL, at most once per PURGE_INTERVAL"""
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < PURGE_INTERVAL:
+        return 0
+    _last_purge = now
+
+    cutoff = datetime.utcnow() - timedelta(seconds=_ttl())
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def idempotent(view):
+    """Make a POST view safe to retry with an Idempotency-Key header"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _conflict(f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters', 400)
+
+        scope = request.path
+        cache_key = (scope, key)
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        entry = response_cache.get(cache_key)
+        if entry is None:
+            stored = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+            if stored is not None and _is_stale(stored):
+                db.session.delete(stored)
+                db.session.commit()
+                stored = None
+            if stored is not None:
+                if stored.status_code is None:
+                    return _conflict('A request with this Idempotency-Key is still being processed', 409)
+                entry = {
+                    'request_hash': stored.request_hash,
+                    'status_code': stored.status_code,
+                    'body': stored.response_body,
+                    'content_type': stored.content_type
+                }
+                response_cache.put(cache_key, entry, _ttl())
+
+        if entry is not None:
+            if entry['request_hash'] != request_hash:
+                return _conflict('Idempotency-Key was already used with a different request', 422)
+            return _replay(entry)
+
+        # Reserve the key so concurrent retries cannot both run the view
+        reservation = IdempotencyKey(scope=scope, key=key, request_hash=request_hash)
+        db.session.add(reservation)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return _conflict('A request with this Idempotency-Key is still being processed', 409)
+        reservation_id = reservation.id
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=reservation_id).delete()
+            db.session.commit()
+            raise
+
+        reservation = db.session.get(IdempotencyKey, reservation_id)
+        if response.status_code >= 500 or response.status_code == 429:
+            # Failures are not final, let the client retry them for real
+            db.session.delete(reservation)
+            db.session.commit()
+            return response
+
+        entry = {
+            'request_hash': request_hash,
+            'status_code': response.status_code,
+            'body': response.get_data(as_text=True),
+            'content_type': response.content_type
+        }
+        reservation.status_code = entry['status_code']
+        reservation.response_body = entry['body']
+        reservation.content_type = entry['content_type']
+        db.session.commit()
+        response_cache.put(cache_key, entry, _ttl())
+
+        purge_expired_keys()
+        return response
+
+    return wrapper
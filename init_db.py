@@ -2,10 +2,14 @@
 """
 Database initialization script for the voting application.
 Run this script to create all database tables and add sample data.
+The schema version stamp makes repeated runs (every container start) a
+single query when nothing changed.
 """
 
+import hashlib
 import os
 import sys
+import time
 from datetime import datetime
 import argparse
 from sqlalchemy import inspect, text
@@ -15,12 +19,48 @@ from sqlalchemy.exc import SQLAlchemyError, OperationalError
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from server import create_app
-from models import db, VotingSession, Question, Team, Vote, Voter, QuestionTemplate
+from models import db, JSONText, VotingSession, Question, Team, Vote, Voter, QuestionTemplate, SchemaVersion
+
+SAMPLE_TEMPLATES = [
+    ("Rating Scale 1-5", "Rate from 1 (worst) to 5 (best)", "rating", ['1', '2', '3', '4', '5']),
+    ("Yes/No Question", "Simple yes or no answer", "multiple_choice", ['Yes', 'No']),
+    ("Multiple Choice", "Choose one option from multiple choices", "multiple_choice",
+     ['Option A', 'Option B', 'Option C', 'Option D']),
+    ("Team Selection", "Select a team (for Naše firmy competitions)", "team_selection", []),
+]
+
+
+def schema_fingerprint():
+    """Hash of the tables, columns and indexes the models define, with column
+    types as the database's dialect spells them"""
+    dialect = db.engine.dialect
+    parts = []
+    for table in sorted(db.metadata.tables.values(), key=lambda t: t.name):
+        columns = ','.join(f'{c.name} {c.type.compile(dialect=dialect)} {c.nullable}' for c in table.columns)
+        indexes = ','.join(sorted(index.name for index in table.indexes))
+        parts.append(f'{table.name}({columns})[{indexes}]')
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def stored_schema_version():
+    """The stamp written by the last successful initialization, None if there is none"""
+    try:
+        return db.session.execute(text('SELECT version FROM schema_version')).scalar()
+    except SQLAlchemyError:
+        # Table missing: the database predates the stamp or is empty
+        db.session.rollback()
+        return None
+
+
+def write_schema_version():
+    db.session.execute(db.delete(SchemaVersion))
+    db.session.add(SchemaVersion(version=schema_fingerprint()))
+    db.session.commit()
 
 
-def check_database_connection():
+def check_database_connection(app=None):
     """Check if database connection is working"""
-    app = create_app()
+    app = app or create_app()
 
     with app.app_context():
         try:
@@ -36,9 +76,9 @@ def check_database_connection():
             return False
 
 
-def check_tables_exist():
+def check_tables_exist(app=None):
     """Check which tables already exist in the database"""
-    app = create_app()
+    app = app or create_app()
 
     with app.app_context():
         try:
@@ -46,7 +86,7 @@ def check_tables_exist():
             existing_tables = inspector.get_table_names()
 
             # Expected tables from our models
-            expected_tables = ['voting_sessions', 'questions', 'teams', 'votes', 'voters', 'question_templates']
+            expected_tables = sorted(db.metadata.tables)
 
             print(f"Existing tables: {existing_tables}")
 
@@ -68,9 +108,9 @@ def check_tables_exist():
             return [], []
 
 
-def create_tables_if_needed(force_recreate=False):
+def create_tables_if_needed(force_recreate=False, app=None):
     """Create database tables if they don't exist"""
-    app = create_app()
+    app = app or create_app()
 
     with app.app_context():
         try:
@@ -80,7 +120,7 @@ def create_tables_if_needed(force_recreate=False):
                 db.create_all()
                 print("✓ All tables recreated successfully")
             else:
-                existing_tables, missing_tables = check_tables_exist()
+                existing_tables, missing_tables = check_tables_exist(app)
 
                 if missing_tables:
                     print(f"Creating missing tables: {missing_tables}")
@@ -99,70 +139,132 @@ def create_tables_if_needed(force_recreate=False):
             return False
 
 
-def init_database(force_recreate=False):
+def existing_indexes():
+    """Index names per existing table. SQLite reflection skips expression
+    indexes, so they are read from sqlite_master there."""
+    inspector = inspect(db.engine)
+    existing = {table: set() for table in inspector.get_table_names()}
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            for table, name in connection.execute(text("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'")):
+                existing.setdefault(table, set()).add(name)
+    else:
+        for table in existing:
+            existing[table] = {index['name'] for index in inspector.get_indexes(table)}
+    return existing
+
+
+def create_missing_indexes():
+    """Create model indexes that existing tables lack; create_all() only indexes new tables"""
+    existing = existing_indexes()
+    created = []
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if table.name in existing and index.name not in existing[table.name]:
+                index.create(db.engine)
+                created.append(index.name)
+    return created
+
+
+def missing_columns():
+    """Model columns the existing tables lack; create_all() never alters a
+    table, so these need a migration before the stamp can be written"""
+    inspector = inspect(db.engine)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in existing)
+    return missing
+
+
+def convert_json_columns():
+    """Turn JSON columns still stored as text into JSONB (PostgreSQL).
+    Returns the converted columns; the caller commits."""
+    if db.engine.dialect.name != 'postgresql':
+        return []
+
+    converted = []
+    for table in db.metadata.sorted_tables:
+        for column in table.columns:
+            if not isinstance(column.type, JSONText):
+                continue
+            data_type = db.session.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+            ), {'table': table.name, 'column': column.name}).scalar()
+            if data_type == 'text':
+                db.session.execute(text(
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} "
+                    f"TYPE JSONB USING NULLIF({column.name}, '')::jsonb"
+                ))
+                converted.append(f'{table.name}.{column.name}')
+    return converted
+
+
+def create_sample_templates():
+    """Add the sample question templates that do not exist yet; the caller commits"""
+    existing = set(db.session.execute(db.select(QuestionTemplate.name)).scalars())
+    added = 0
+    for name, description, question_type, options in SAMPLE_TEMPLATES:
+        if name in existing:
+            continue
+        db.session.add(QuestionTemplate(name=name, description=description,
+                                        question_type=question_type, options=options))
+        print(f"Added template: {name}")
+        added += 1
+    return added
+
+
+def init_database(force_recreate=False, app=None):
     """Initialize the database with tables and sample data"""
     print("=== Database Initialization ===")
+    start = time.perf_counter()
+    app = app or create_app()
 
     # Check database connection first
-    if not check_database_connection():
+    if not check_database_connection(app):
         print("Cannot proceed without database connection")
         return False
 
+    if not force_recreate:
+        with app.app_context():
+            if stored_schema_version() == schema_fingerprint():
+                print(f"✓ Schema is up to date, nothing to do ({time.perf_counter() - start:.2f}s)")
+                return True
+
     # Create tables if needed
-    if not create_tables_if_needed(force_recreate):
+    if not create_tables_if_needed(force_recreate, app):
         print("Failed to create tables")
         return False
 
-    app = create_app()
-
     with app.app_context():
         try:
-            # Create sample question templates if they don't exist
-            templates = [
-                QuestionTemplate(
-                    name="Rating Scale 1-5",
-                    description="Rate from 1 (worst) to 5 (best)",
-                    question_type="rating",
-                    options=['1', '2', '3', '4', '5']
-                ),
-                QuestionTemplate(
-                    name="Yes/No Question",
-                    description="Simple yes or no answer",
-                    question_type="multiple_choice",
-                    options=['Yes', 'No']
-                ),
-                QuestionTemplate(
-                    name="Multiple Choice",
-                    description="Choose one option from multiple choices",
-                    question_type="multiple_choice",
-                    options=['Option A', 'Option B', 'Option C', 'Option D']
-                ),
-                QuestionTemplate(
-                    name="Team Selection",
-                    description="Select a team (for Naše firmy competitions)",
-                    question_type="team_selection",
-                    options=[]
-                )
-            ]
-
-            templates_added = 0
-            for template in templates:
-                existing = QuestionTemplate.query.filter_by(name=template.name).first()
-                if not existing:
-                    db.session.add(template)
-                    templates_added += 1
-                    print(f"Added template: {template.name}")
-                else:
-                    print(f"Template already exists: {template.name}")
+            created = create_missing_indexes()
+            if created:
+                print(f"✓ Created indexes: {', '.join(created)}")
+
+            converted = convert_json_columns()
+            if converted:
+                db.session.commit()
+                print(f"✓ Converted to JSONB: {', '.join(converted)}")
 
+            missing = missing_columns()
+            if missing:
+                print(f"✗ Columns missing from existing tables: {', '.join(missing)}")
+                print("  Apply migrations (flask db upgrade) and run this script again")
+                return False
+
+            # Create sample question templates if they don't exist
+            templates_added = create_sample_templates()
             if templates_added > 0:
                 db.session.commit()
                 print(f"✓ {templates_added} new templates added")
             else:
                 print("✓ All templates already exist")
 
+            write_schema_version()
             print_database_statistics()
-            print("✓ Database initialization completed successfully!")
+            print(f"✓ Database initialization completed successfully in {time.perf_counter() - start:.2f}s!")
             return True
 
         except SQLAlchemyError as e:
@@ -189,11 +291,11 @@ def print_database_statistics():
         print(f"✗ Error getting database statistics: {e}")
 
 
-def create_sample_nase_firmy_session():
+def create_sample_nase_firmy_session(app=None):
     """Create a sample 'Naše firmy' voting session for testing"""
     print("=== Creating Sample Session ===")
 
-    app = create_app()
+    app = app or create_app()
 
     with app.app_context():
         try:
@@ -270,16 +372,20 @@ def main():
                         help='Show database statistics only')
 
     args = parser.parse_args()
+    app = create_app()
 
     if args.check_only:
         print("=== Database Check ===")
-        check_database_connection()
-        check_tables_exist()
+        if check_database_connection(app):
+            with app.app_context():
+                version = stored_schema_version()
+            print(f"Schema version: {version or 'none'} "
+                  f"({'up to date' if version == schema_fingerprint() else 'initialization needed'})")
+        check_tables_exist(app)
         return
 
     if args.stats:
-        if check_database_connection():
-            app = create_app()
+        if check_database_connection(app):
             with app.app_context():
                 print_database_statistics()
         return
@@ -291,13 +397,13 @@ def main():
             return
 
     # Initialize database
-    if not init_database(force_recreate=args.force_recreate):
+    if not init_database(force_recreate=args.force_recreate, app=app):
         print("Database initialization failed")
         sys.exit(1)
 
     # Create sample session if requested
     if args.sample:
-        if not create_sample_nase_firmy_session():
+        if not create_sample_nase_firmy_session(app):
             print("Sample session creation failed")
             sys.exit(1)
 
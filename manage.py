@@ -7,6 +7,7 @@ import click
 from flask.cli import with_appcontext
 from server import create_app
 from models import db, QuestionTemplate
+from broadcast import publish, TEMPLATES_CHANGED
 import os
 
 @click.group()
@@ -60,6 +61,9 @@ def create_template(name, description, question_type, options):
         )
         
         db.session.add(template)
+        db.session.flush()
+        # Running servers drop their cached catalogue (PostgreSQL broadcast bus)
+        publish(TEMPLATES_CHANGED, version=template.id)
         db.session.commit()
         
         click.echo(f'✅ Template "{name}" created with ID {template.id}')
@@ -93,6 +97,204 @@ def run(host, port, debug):
     app = create_app()
     app.run(host=host, port=port, debug=debug)
 
+@cli.command()
+@click.argument('voting_id')
+@click.option('--format', 'export_format', default='csv',
+              type=click.Choice(['csv', 'jsonl', 'parquet']),
+              help='Export format')
+@click.option('--output', '-o', default=None, help='Output file (defaults to votes_<id>.<format>)')
+def export(voting_id, export_format, output):
+    """Export raw votes of a voting session"""
+    from export import parquet_available, stream_export
+    from models import VotingSession
+    
+    app = create_app()
+    with app.app_context():
+        session = VotingSession.query.filter_by(unique_id=voting_id).first()
+        if not session:
+            click.echo(f'❌ Voting session {voting_id} not found')
+            return
+        
+        if export_format == 'parquet' and not parquet_available():
+            click.echo('❌ Parquet export requires the pyarrow package')
+            return
+        
+        output = output or f'votes_{voting_id}.{export_format}'
+        mode = 'wb' if export_format == 'parquet' else 'w'
+        encoding = None if export_format == 'parquet' else 'utf-8'
+        
+        with open(output, mode, encoding=encoding, newline='' if encoding else None) as f:
+            for chunk in stream_export(session.id, export_format):
+                f.write(chunk)
+        
+        click.echo(f'✅ Votes exported to {output}')
+
+@cli.command()
+@click.option('--days', default=None, type=int, help='Archive sessions ended more than DAYS ago (default ARCHIVE_AFTER_DAYS)')
+@click.option('--dry-run', is_flag=True, help='Only list the sessions that would be archived')
+@click.option('--restore', 'restore_id', default=None, help='Move an archived session back into the hot tables')
+def archive(days, dry_run, restore_id):
+    """Archive votes of old ended sessions into compressed files"""
+    from archive import archive_session, ensure_vote_partitions, restore_session, sessions_to_archive, votes_partitioned
+    from models import VotingSession
+    
+    app = create_app()
+    with app.app_context():
+        if restore_id:
+            session = VotingSession.query.filter_by(unique_id=restore_id).first()
+            if not session or session.archive is None:
+                click.echo(f'❌ Voting session {restore_id} is not archived')
+                return
+            restore_session(session)
+            click.echo(f'✅ Voting session {restore_id} restored')
+            return
+        
+        days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+        sessions = sessions_to_archive(days)
+        if not sessions:
+            click.echo(f'No sessions ended more than {days} days ago to archive.')
+        
+        for session in sessions:
+            if dry_run:
+                click.echo(f'Would archive {session.unique_id} ({session.name})')
+                continue
+            record = archive_session(session)
+            click.echo(f'✅ Archived {session.unique_id}: {record.vote_count} votes, '
+                       f'{record.voter_count} voters -> {record.archive_file}')
+        
+        if not dry_run and votes_partitioned():
+            created = ensure_vote_partitions()
+            if created:
+                click.echo(f'✅ Created vote partitions: {", ".join(created)}')
+
+@cli.command()
+@click.argument('voting_id')
+@click.option('--output', '-o', default=None, help='Output file (defaults to session_<id>.jsonl.gz)')
+def export_session(voting_id, output):
+    """Export a voting session with all its data for import elsewhere"""
+    import time
+    from archive import export_session as write_session_export
+    from models import VotingSession
+    
+    app = create_app()
+    with app.app_context():
+        session = VotingSession.query.filter_by(unique_id=voting_id).first()
+        if not session:
+            click.echo(f'❌ Voting session {voting_id} not found')
+            return
+        
+        output = output or f'session_{voting_id}.jsonl.gz'
+        start = time.perf_counter()
+        counts = write_session_export(session, output)
+        elapsed = time.perf_counter() - start
+        click.echo(', '.join(f'{count} {table}' for table, count in counts.items()))
+        click.echo(f'✅ Voting session {voting_id} exported to {output} in {elapsed:.2f}s')
+
+@cli.command()
+@click.argument('path')
+@click.option('--unique-id', default=None, help='Import under another voting id')
+def import_session(path, unique_id):
+    """Import a voting session exported with export-session"""
+    import time
+    from archive import import_session as read_session_export
+    
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        try:
+            session, dropped = read_session_export(path, unique_id)
+        except ValueError as e:
+            click.echo(f'❌ {e}')
+            return
+        elapsed = time.perf_counter() - start
+        if dropped:
+            click.echo(f'Left out {dropped} votes for questions, teams or voters of other sessions')
+        click.echo(f'✅ Voting session {session.unique_id} imported in {elapsed:.2f}s')
+
+@cli.command()
+@click.argument('plan')
+def create_sessions(plan):
+    """Create one voting session per room of a CSV or JSON room plan"""
+    import time
+    from provisioning import create_sessions as create_session_rows, read_room_plan, session_spec_error
+    
+    specs = read_room_plan(plan)
+    if not specs:
+        click.echo(f'❌ No rooms in {plan}')
+        return
+    for idx, spec in enumerate(specs):
+        error = session_spec_error(spec)
+        if error:
+            click.echo(f'❌ Room {idx + 1}: {error}')
+            return
+    
+    app = create_app()
+    with app.app_context():
+        app_url = app.config['APP_URL']
+        start = time.perf_counter()
+        unique_ids = create_session_rows(specs)
+        elapsed = time.perf_counter() - start
+        for unique_id, spec in zip(unique_ids, specs):
+            click.echo(f'{spec["name"]}: {app_url}/hlasovani/{unique_id}  (QR: {app_url}/presentation/{unique_id})')
+        click.echo(f'✅ Created {len(unique_ids)} voting sessions in {elapsed:.2f}s')
+
+@cli.command()
+@click.argument('voting_ids', nargs=-1)
+@click.option('--ended-before-days', default=None, type=int, help='Also delete sessions ended more than N days ago')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation')
+def delete_sessions(voting_ids, ended_before_days, yes):
+    """Delete voting sessions with all their data in one transaction"""
+    import time
+    from datetime import datetime, timedelta
+    from archive import delete_sessions as delete_session_rows
+    from models import VotingSession
+    
+    app = create_app()
+    with app.app_context():
+        sessions = VotingSession.query.filter(VotingSession.unique_id.in_(voting_ids)).all() if voting_ids else []
+        missing = set(voting_ids) - {s.unique_id for s in sessions}
+        if missing:
+            click.echo(f'❌ Voting sessions not found: {", ".join(sorted(missing))}')
+            return
+        
+        if ended_before_days is not None:
+            cutoff = datetime.utcnow() - timedelta(days=ended_before_days)
+            sessions += VotingSession.query.filter(
+                VotingSession.ended.is_(True),
+                VotingSession.updated_at < cutoff,
+                VotingSession.unique_id.notin_(voting_ids)
+            ).all()
+        
+        if not sessions:
+            click.echo('No sessions to delete.')
+            return
+        
+        click.echo(f'Sessions to delete: {", ".join(s.unique_id for s in sessions)}')
+        if not yes and not click.confirm('Delete them with all votes? This cannot be undone.'):
+            return
+        
+        start = time.perf_counter()
+        deleted = delete_session_rows(sessions)
+        elapsed = time.perf_counter() - start
+        click.echo(', '.join(f'{count} {table}' for table, count in deleted.items()))
+        click.echo(f'✅ Deleted {len(sessions)} sessions in {elapsed:.2f}s')
+
+@cli.command()
+@click.option('--size', default=None, type=int, help='Sessions per partition (default VOTE_PARTITION_SIZE)')
+def partition_votes(size):
+    """Partition the votes table by session id range (PostgreSQL)"""
+    from archive import partition_votes as convert_votes_table
+    
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            click.echo('❌ Partitioning requires PostgreSQL')
+            return
+        if convert_votes_table(size):
+            click.echo('✅ Votes table partitioned by session id')
+        else:
+            click.echo('Votes table is already partitioned.')
+
 @cli.command()
 def reset_db():
     """Reset the database (WARNING: This will delete all data!)"""
@@ -116,7 +318,7 @@ def check_health():
             # Check tables exist
             inspector = db.inspect(db.engine)
             tables = inspector.get_table_names()
-            expected_tables = ['voting_sessions', 'questions', 'teams', 'votes', 'voters', 'question_templates']
+            expected_tables = ['voting_sessions', 'questions', 'teams', 'votes', 'voters', 'question_templates', 'idempotency_keys', 'session_archives', 'schema_version']
             missing_tables = [t for t in expected_tables if t not in tables]
             
             if missing_tables:
@@ -1,8 +1,44 @@
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import Select
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 import json
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """Sends plain SELECTs to the read replica while a view has opted in (see replica.py)"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and isinstance(clause, Select) and not self._flushing
+                and has_app_context() and g.get('db_replica')):
+            return current_app.extensions['replica_engine']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class JSONText(TypeDecorator):
+    """JSON kept as text, or as native JSONB on PostgreSQL where the driver decodes it.
+    Values are decoded once when a row is loaded and held on the instance."""
+    
+    impl = db.Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(JSONB(none_as_null=True))
+        return dialect.type_descriptor(db.Text())
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return json.dumps(value)
+    
+    def process_result_value(self, value, dialect):
+        if dialect.name == 'postgresql':
+            return value
+        return json.loads(value) if value else None
 
 class QuestionTemplate(db.Model):
     __tablename__ = 'question_templates'
@@ -10,20 +46,25 @@ class QuestionTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    question_type = db.Column(db.String(50), nullable=False)  # 'multiple_choice', 'rating', 'yes_no', 'ranking', 'team_selection'
-    options_json = db.Column(db.Text)  # JSON string of available options
+    question_type = db.Column(db.String(50), nullable=False, index=True)  # 'multiple_choice', 'rating', 'yes_no', 'ranking', 'team_selection'
+    options_json = db.Column(JSONText)  # List of available options
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Prefix search on the name (catalog.load_templates); text_pattern_ops lets
+    # PostgreSQL answer LIKE 'prefix%' from the index under any collation
+    __table_args__ = (db.Index('ix_question_templates_name_lower', db.func.lower(name).label('name_lower'),
+                               postgresql_ops={'name_lower': 'text_pattern_ops'}),)
+    
     # Relationships
     questions = db.relationship('Question', backref='template', lazy=True)
     
     @property
     def options(self):
-        return json.loads(self.options_json) if self.options_json else []
+        return self.options_json or []
     
     @options.setter
     def options(self, value):
-        self.options_json = json.dumps(value)
+        self.options_json = value
 
 class VotingSession(db.Model):
     __tablename__ = 'voting_sessions'
@@ -51,7 +92,7 @@ class Question(db.Model):
     template_id = db.Column(db.Integer, db.ForeignKey('question_templates.id'), nullable=True)
     text = db.Column(db.Text, nullable=False)
     question_type = db.Column(db.String(50), nullable=False)
-    options_json = db.Column(db.Text)
+    options_json = db.Column(JSONText)
     order_index = db.Column(db.Integer, default=0)
     
     # Relationships
@@ -59,11 +100,11 @@ class Question(db.Model):
     
     @property
     def options(self):
-        return json.loads(self.options_json) if self.options_json else []
+        return self.options_json or []
     
     @options.setter
     def options(self, value):
-        self.options_json = json.dumps(value)
+        self.options_json = value
 
 class Team(db.Model):
     __tablename__ = 'teams'
@@ -96,9 +137,9 @@ class Vote(db.Model):
     __tablename__ = 'votes'
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('voting_sessions.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)
-    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)  # Team being voted FOR
+    session_id = db.Column(db.Integer, db.ForeignKey('voting_sessions.id'), nullable=False, index=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)  # indexed by unique_vote_per_question
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False, index=True)  # Team being voted FOR
     voter_id = db.Column(db.Integer, db.ForeignKey('voters.id'), nullable=False)
     voter_team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=True)  # Team that the voter represents
     option_selected = db.Column(db.String(200))  # Selected option text/value
@@ -108,3 +149,36 @@ class Vote(db.Model):
     
     # Unique constraint to prevent duplicate votes (one vote per question per voter)
     __table_args__ = (db.UniqueConstraint('question_id', 'voter_id', name='unique_vote_per_question'),)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False)
+    scope = db.Column(db.String(200), nullable=False)  # Request path the key was used on
+    request_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the request body
+    status_code = db.Column(db.Integer)  # NULL while the original request is still running
+    response_body = db.Column(db.Text)
+    content_type = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (db.UniqueConstraint('scope', 'key', name='unique_idempotency_key'),)
+
+class SessionArchive(db.Model):
+    __tablename__ = 'session_archives'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('voting_sessions.id'), nullable=False, unique=True)
+    archive_file = db.Column(db.String(500), nullable=False)  # Compressed voters/votes, relative to ARCHIVE_DIR
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+    voter_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    session = db.relationship('VotingSession', backref=db.backref('archive', uselist=False, cascade='all, delete-orphan'))
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.String(64), primary_key=True)  # Fingerprint of the models, written by init_db.py
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
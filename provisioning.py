@@ -0,0 +1,163 @@
+"""
+Creating voting sessions in bulk.
+Events with many parallel rooms create all their sessions in one transaction:
+the unique ids and primary keys are allocated up front, and sessions,
+questions and teams are each written with one multi-row INSERT, whatever the
+number of rooms. Recurring events clone an earlier session's structure with
+INSERT ... SELECT, so its rows never travel through the app.
+"""
+
+import csv
+import json
+import random
+
+from sqlalchemy import false, func, insert, literal, select, text, update
+
+from models import db, VotingSession, Question, Team
+from archive import ensure_session_partitions
+
+MAX_BATCH_SIZE = 500
+PLAN_LIST_SEPARATOR = ';'
+
+
+def allocate_unique_ids(count):
+    """`count` distinct 6-digit session ids that are not taken yet"""
+    allocated = set()
+    while len(allocated) < count:
+        candidates = {str(random.randint(100000, 999999)) for _ in range(2 * (count - len(allocated)))}
+        candidates -= allocated
+        taken = set(db.session.execute(
+            select(VotingSession.unique_id).where(VotingSession.unique_id.in_(candidates))
+        ).scalars())
+        allocated.update(list(candidates - taken)[:count - len(allocated)])
+    return list(allocated)
+
+
+def allocate_primary_keys(model, count):
+    """Ids for `count` new rows, so children can reference them without a RETURNING
+    round trip per row: drawn from the table's sequence on PostgreSQL, after the
+    current maximum elsewhere, under a write lock held until the caller commits"""
+    table = model.__tablename__
+    if db.engine.dialect.name == 'postgresql':
+        return list(db.session.execute(text(
+            "SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"
+        ), {'table': table, 'count': count}).scalars())
+    # A write takes the table's write lock (SQLite locks the database) until commit,
+    # so a concurrent batch waits here instead of reading the same maximum
+    db.session.execute(update(model).where(false()).values(id=model.id))
+    first = (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+    return list(range(first, first + count))
+
+
+def session_spec_error(data):
+    """What is wrong with one session of a batch, None when it can be created"""
+    if not isinstance(data, dict) or not data.get('name'):
+        return 'Missing required field: name'
+    questions = data.get('questions', [])
+    teams = data.get('teams', [])
+    if not isinstance(questions, list) or not all(isinstance(q, dict) and q.get('text') for q in questions):
+        return 'Every question needs a text'
+    if not isinstance(teams, list) or not all(isinstance(t, dict) and t.get('name') for t in teams):
+        return 'Every team needs a name'
+    return None
+
+
+def create_sessions(specs):
+    """Create sessions described like POST /api/v1/voting payloads in one transaction.
+    Returns their unique ids in the order of specs."""
+    specs = list(specs)
+    if not specs:
+        return []
+
+    try:
+        unique_ids = allocate_unique_ids(len(specs))
+        session_ids = allocate_primary_keys(VotingSession, len(specs))
+        db.session.execute(insert(VotingSession), [
+            {'id': session_id, 'unique_id': unique_id, 'name': spec['name'],
+             'description': spec.get('description', '')}
+            for session_id, unique_id, spec in zip(session_ids, unique_ids, specs)
+        ])
+        ensure_session_partitions(session_ids)
+
+        questions = [
+            {'session_id': session_id, 'template_id': q.get('template_id'), 'text': q['text'],
+             'question_type': q.get('question_type', 'multiple_choice'),
+             'options_json': q.get('options', []), 'order_index': idx}
+            for session_id, spec in zip(session_ids, specs)
+            for idx, q in enumerate(spec.get('questions', []))
+        ]
+        teams = [
+            {'session_id': session_id, 'name': t['name'], 'external_id': t.get('external_id'),
+             'description': t.get('description')}
+            for session_id, spec in zip(session_ids, specs)
+            for t in spec.get('teams', [])
+        ]
+        if questions:
+            db.session.execute(insert(Question), questions)
+        if teams:
+            db.session.execute(insert(Team), teams)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return unique_ids
+
+
+# Columns copied by clone_session, besides session_id
+CLONED_COLUMNS = {
+    Question: ('template_id', 'text', 'question_type', 'options_json', 'order_index'),
+    Team: ('name', 'external_id', 'description')
+}
+
+
+def clone_session(source, name=None, description=None):
+    """Copy the questions and teams of a session, but no voters or votes, into a
+    new session. Returns its unique id."""
+    try:
+        unique_id = allocate_unique_ids(1)[0]
+        session_id = allocate_primary_keys(VotingSession, 1)[0]
+        db.session.execute(insert(VotingSession).values(
+            id=session_id, unique_id=unique_id, name=name or source.name,
+            description=source.description if description is None else description
+        ))
+        ensure_session_partitions([session_id])
+        for model, columns in CLONED_COLUMNS.items():
+            table = model.__table__
+            db.session.execute(insert(table).from_select(
+                ['session_id', *columns],
+                select(literal(session_id, db.Integer), *(table.c[column] for column in columns))
+                .where(table.c.session_id == source.id).order_by(table.c.id)
+            ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return unique_id
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(PLAN_LIST_SEPARATOR) if item.strip()]
+
+
+def read_room_plan(path):
+    """Session specs from a JSON file (a list, or {"sessions": [...]}) or a CSV file
+    with name, description, questions, question_type and teams columns, where
+    questions and teams are separated by semicolons"""
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            plan = json.load(f)
+        return plan['sessions'] if isinstance(plan, dict) else plan
+
+    specs = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            question_type = (row.get('question_type') or '').strip() or 'multiple_choice'
+            specs.append({
+                'name': (row.get('name') or '').strip(),
+                'description': (row.get('description') or '').strip(),
+                'questions': [{'text': text, 'question_type': question_type} for text in _split(row.get('questions'))],
+                'teams': [{'name': name} for name in _split(row.get('teams'))]
+            })
+    return specs
@@ -0,0 +1,140 @@
+"""
+Server-rendered QR codes for the presentation page.
+A code depends only on APP_URL, the session id, the format and the size, so
+each one is generated once and kept in a small in-process LRU cache; the
+responses are immutable and the projector's browser never asks again.
+The QR matrix comes from the optional qrcode package; SVG and PNG are
+written here so neither Pillow nor pypng is needed.
+"""
+
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+QR_FORMATS = {'svg': 'image/svg+xml', 'png': 'image/png'}
+DEFAULT_SIZE = 512
+MIN_SIZE = 64
+MAX_SIZE = 2048
+BORDER = 4  # quiet zone in modules, as required by the QR spec
+CACHE_SIZE = 256
+
+
+def qr_available():
+    """QR codes need the optional qrcode package"""
+    return qrcode is not None
+
+
+def qr_matrix(data):
+    """Rows of booleans (True = dark module), quiet zone included"""
+    code = qrcode.QRCode(border=BORDER, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    code.add_data(data)
+    code.make(fit=True)
+    return code.get_matrix()
+
+
+def dark_runs(row):
+    """(start, length) of each run of dark modules in a row"""
+    start = None
+    for x, dark in enumerate(row + [False]):
+        if dark and start is None:
+            start = x
+        elif not dark and start is not None:
+            yield start, x - start
+            start = None
+
+
+def render_svg(matrix, size):
+    modules = len(matrix)
+    path = ''.join(
+        f'M{x} {y}h{length}v1h-{length}z'
+        for y, row in enumerate(matrix) for x, length in dark_runs(row)
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path d="{path}" fill="#000"/></svg>'
+    ).encode()
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def render_png(matrix, size):
+    """1-bit greyscale PNG; size is rounded down to whole pixels per module"""
+    scale = max(1, size // len(matrix))
+    width = len(matrix) * scale
+    raw = bytearray()
+    for row in matrix:
+        # Light modules are white (bit set), each module scale pixels wide
+        bits = ''.join(('0' if dark else '1') * scale for dark in row)
+        bits += '1' * (-len(bits) % 8)
+        line = b'\x00' + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+        raw += line * scale
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, width, 1, 0, 0, 0, 0))
+        + png_chunk(b'IDAT', zlib.compress(bytes(raw), 9))
+        + png_chunk(b'IEND', b'')
+    )
+
+
+RENDERERS = {'svg': render_svg, 'png': render_png}
+
+
+class QRCache:
+    """Least recently used QR images keyed by (app_url, session id, format, size)"""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+
+    def forget(self, unique_id):
+        """Drop every image of a session, e.g. once it is deleted"""
+        with self._lock:
+            for key in [key for key in self._images if key[1] == unique_id]:
+                del self._images[key]
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+
+qr_cache = QRCache()
+
+
+def qr_image(app_url, unique_id, fmt, size):
+    """The QR code of a session's voting page, generated on first use"""
+    key = (app_url, unique_id, fmt, size)
+    image = qr_cache.get(key)
+    if image is None:
+        image = RENDERERS[fmt](qr_matrix(f'{app_url}/hlasovani/{unique_id}'), size)
+        qr_cache.put(key, image)
+    return image
+
+
+def cached_qr_image(app_url, unique_id, fmt, size):
+    """The image if it was already generated, without touching the database"""
+    return qr_cache.get((app_url, unique_id, fmt, size))
@@ -0,0 +1,194 @@
+"""
+Token-bucket rate limiting with priority lanes.
+Vote submissions and voting page loads are limited per client IP and voting
+session, and the vote lane as a whole is capped so a reload storm cannot
+occupy every gunicorn worker. Everything else (the admin lane: creating,
+starting and stopping sessions, results) is never throttled. Buckets live in
+a small SQLite file so all workers on the host share them; excess requests
+get 429 with Retry-After instead of queueing until they time out.
+"""
+
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from flask import current_app, jsonify, request
+
+# Endpoints limited per client and session; all other endpoints are the admin lane
+ENDPOINT_LANES = {
+    'site.submit_vote_frontend': 'vote',
+    'api.submit_vote': 'vote',
+    'site.voting_site_menu': 'page',
+    'site.get_voting_data_for_frontend': 'page'
+}
+SESSION_ARGS = ('voteid', 'voting_id', 'id')
+IDLE_BUCKET_SECONDS = 3600  # buckets untouched this long are full again and can be dropped
+CLEANUP_INTERVAL = 60
+
+
+def parse_limit(value):
+    """Parse 'rate/burst' (tokens per second / bucket size) into floats"""
+    rate, _, burst = str(value).partition('/')
+    rate = float(rate)
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+
+def refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """Buckets of a single process, used in tests and with RATE_LIMIT_STORAGE=memory"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, now=None, cost=1.0):
+        """Take cost tokens from a bucket; returns seconds to wait, 0 when allowed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = refill(tokens, updated, now, rate, burst)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+    def refund(self, key, burst, cost=1.0):
+        """Give back tokens taken by consume() for a request that was denied elsewhere"""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(burst, tokens + cost), updated)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file shared by all worker processes on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+
+    def _connection(self):
+        # Connections are per thread and are not reused across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key, rate, burst, now=None, cost=1.0):
+        """Take cost tokens from a bucket; returns seconds to wait, 0 when allowed"""
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = refill(row[0], row[1], now, rate, burst) if row else burst
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if not wait:
+                tokens -= cost
+            conn.execute(
+                'INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now)
+            )
+            if now - self._last_cleanup > CLEANUP_INTERVAL:
+                self._last_cleanup = now
+                conn.execute('DELETE FROM buckets WHERE updated < ?', (now - IDLE_BUCKET_SECONDS,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def refund(self, key, burst, cost=1.0):
+        """Give back tokens taken by consume() for a request that was denied elsewhere"""
+        self._connection().execute('UPDATE buckets SET tokens = MIN(?, tokens + ?) WHERE key = ?',
+                                   (burst, cost, key))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM buckets')
+
+
+def create_store(storage):
+    if storage == 'memory':
+        return MemoryBucketStore()
+    return SQLiteBucketStore(storage)
+
+
+def client_address(app):
+    """Client IP; behind a trusted proxy the address it appended to X-Forwarded-For"""
+    if app.config.get('RATE_LIMIT_TRUST_PROXY'):
+        return request.access_route[-1]
+    return request.remote_addr
+
+
+def too_many_requests(wait):
+    response = jsonify({'error': 'Too many requests, please retry shortly'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    return response
+
+
+def init_rate_limiting(app):
+    """Register the before_request admission check"""
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+    app.config.setdefault('RATE_LIMIT_STORAGE', os.path.join(tempfile.gettempdir(), 'voting_ratelimit.sqlite3'))
+    app.config.setdefault('RATE_LIMIT_VOTE', '5/50')
+    app.config.setdefault('RATE_LIMIT_PAGE', '10/100')
+    app.config.setdefault('RATE_LIMIT_VOTE_LANE', '100/200')
+    app.config.setdefault('RATE_LIMIT_TRUST_PROXY', False)
+
+    store = create_store(app.config['RATE_LIMIT_STORAGE'])
+    app.extensions['rate_limit_store'] = store
+
+    @app.before_request
+    def admit_request():
+        lane = ENDPOINT_LANES.get(request.endpoint)
+        if lane is None or not app.config['RATE_LIMIT_ENABLED']:
+            return None
+
+        view_args = request.view_args or {}
+        session_id = next((view_args[arg] for arg in SESSION_ARGS if arg in view_args), '')
+        client_key = f'{lane}:{client_address(app)}:{session_id}'
+
+        try:
+            lane_limit = parse_limit(app.config['RATE_LIMIT_VOTE_LANE'])
+            if lane == 'vote':
+                # Overall cap on vote traffic keeps workers free for the admin lane;
+                # checked first so a full lane does not cost the client a token
+                wait = store.consume('vote-lane', *lane_limit)
+                if wait:
+                    return too_many_requests(wait)
+            wait = store.consume(client_key, *parse_limit(app.config[f'RATE_LIMIT_{lane.upper()}']))
+            if wait and lane == 'vote':
+                # Nor may one client's rejected burst drain the lane for everyone else
+                store.refund('vote-lane', lane_limit[1])
+        except sqlite3.Error as e:
+            # A busy or broken limiter store must not take voting down
+            current_app.logger.warning(f"Rate limiter unavailable: {e}")
+            return None
+
+        if wait:
+            return too_many_requests(wait)
+        return None
+
+    return app
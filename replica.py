@@ -0,0 +1,101 @@
+"""
+Read-replica routing for read-only endpoints.
+With REPLICA_DATABASE_URI (REPLICA_DATABASE_URL) set, views decorated with
+@read_replica run their SELECTs on the replica; writes and everything else
+stay on the primary. The replica is only used while its
+replay lag is within REPLICA_MAX_STALENESS, and a session changed within
+that window (started, stopped, teams edited) is always read from the
+primary so results right after stop_voting are never stale.
+"""
+
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, VotingSession
+
+SESSION_ARGS = ('voting_id', 'voteid', 'id')
+LAG_CHECK_INTERVAL = 1.0  # seconds a measured lag is reused per process
+
+# 0 when the replica has replayed everything it received (or is not in recovery
+# at all). NULL while its WAL receiver is not streaming: it then receives
+# nothing, so having replayed all it received says nothing about freshness.
+LAG_QUERY = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def init_replica(app):
+    """Create the replica engine; the app's session routes to it (models.RoutingSession)"""
+    url = app.config.get('REPLICA_DATABASE_URI')
+    if url:
+        options = {'pool_pre_ping': True, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+        app.extensions['replica_engine'] = create_engine(url, **options)
+    return app
+
+
+def replica_configured():
+    return 'replica_engine' in current_app.extensions
+
+
+def measure_lag(engine):
+    """Replay lag of the replica in seconds, None when it cannot be measured or
+    is disconnected from the primary"""
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    try:
+        with engine.connect() as connection:
+            lag = connection.execute(db.text(LAG_QUERY)).scalar()
+    except SQLAlchemyError as e:
+        current_app.logger.warning(f"Read replica unavailable: {e}")
+        return None
+    return None if lag is None else float(lag)
+
+
+def replica_lag():
+    """Measured lag, refreshed at most every LAG_CHECK_INTERVAL seconds"""
+    cached = current_app.extensions.get('replica_lag')
+    now = time.monotonic()
+    if cached is None or now - cached[0] > LAG_CHECK_INTERVAL:
+        cached = (now, measure_lag(current_app.extensions['replica_engine']))
+        current_app.extensions['replica_lag'] = cached
+    return cached[1]
+
+
+def replica_usable(unique_id=None):
+    """Whether reads for this request (and session) may come from the replica"""
+    if not replica_configured():
+        return False
+    max_staleness = current_app.config['REPLICA_MAX_STALENESS']
+    lag = replica_lag()
+    if lag is None or lag > max_staleness:
+        return False
+    if unique_id is not None:
+        # Primary key lookup on the primary: recently changed sessions need fresh reads
+        updated_at = db.session.query(VotingSession.updated_at).filter_by(unique_id=unique_id).scalar()
+        if updated_at is not None and updated_at > datetime.utcnow() - timedelta(seconds=max_staleness):
+            return False
+    return True
+
+
+def read_replica(view):
+    """Run a read-only view's SELECTs on the replica when it is fresh enough"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        unique_id = next((kwargs[arg] for arg in SESSION_ARGS if arg in kwargs), None)
+        previous = g.get('db_replica', False)
+        g.db_replica = replica_usable(unique_id)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.db_replica = previous
+
+    return wrapper
@@ -1,13 +1,84 @@
-from flask import Flask, render_template, request, jsonify, make_response, redirect
-from flask_migrate import Migrate
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, make_response, redirect
 from flask_cors import CORS
+from sqlalchemy.orm import selectinload
+import click
 import os
+import time
+import weakref
 from datetime import datetime
 
 # Import configurations and models
 from config import config
 from models import db, VotingSession, Question, Team, Vote, Voter, QuestionTemplate
-from api_blueprint import api_bp
+from api_blueprint import api_bp, vote_counts_by_team_and_question, freeze_results
+from assets import init_assets
+from compression import init_compression
+from json_provider import init_json_provider
+from idempotency import idempotent
+from ratelimit import init_rate_limiting
+from replica import init_replica, read_replica
+from broadcast import init_broadcast, publish, votes_landed, SESSION_CHANGED
+from catalog import init_template_catalog
+from snapshot import load_snapshot
+from archive import ensure_session_partitions
+from qr import QR_FORMATS, DEFAULT_SIZE, MIN_SIZE, MAX_SIZE, qr_available, qr_image, cached_qr_image
+
+# Pages and frontend endpoints; the app itself only exists once create_app() runs
+site_bp = Blueprint('site', __name__, cli_group=None)
+
+def init_migrations(app):
+    """Set up Flask-Migrate; it pulls in Alembic, so web workers skip it"""
+    from flask_migrate import Migrate
+    return Migrate(app, db)
+
+def database_engines(app):
+    """The app's engines, including the read replica's (call in an app context)"""
+    engines = list(db.engines.values())
+    if 'replica_engine' in app.extensions:
+        engines.append(app.extensions['replica_engine'])
+    return engines
+
+def dispose_engines_after_fork(app):
+    """Give forked workers (gunicorn --preload) their own connection pools"""
+    app_ref = weakref.ref(app)
+    
+    def after_fork():
+        forked_app = app_ref()
+        if forked_app is None:
+            return
+        with forked_app.app_context():
+            for engine in database_engines(forked_app):
+                # close=False leaves the parent's connections alone
+                engine.dispose(close=False)
+    
+    os.register_at_fork(after_in_child=after_fork)
+
+PAGE_TEMPLATES = ['admin.html', 'login.html', 'qr.html', 'results.html', 'voting.html']
+
+def prepare_worker(app):
+    """Get a freshly forked worker ready for traffic: its own pool, opened
+    connections, compiled page templates, the snapshots of recently ended
+    sessions and the broadcast listener. Returns the seconds it took."""
+    start = time.perf_counter()
+    with app.app_context():
+        for engine in database_engines(app):
+            engine.dispose(close=False)
+        
+        connections = [db.engine.connect() for _ in range(app.config.get('POOL_WARM_CONNECTIONS', 2))]
+        for connection in connections:
+            connection.close()
+        
+        for name in PAGE_TEMPLATES:
+            app.jinja_env.get_template(name)
+        
+        recent = VotingSession.query.filter(VotingSession.ended.is_(True)).order_by(
+            VotingSession.updated_at.desc()
+        ).limit(app.config.get('WARM_SNAPSHOTS', 16)).all()
+        for session in recent:
+            load_snapshot(session)
+        db.session.remove()
+    app.extensions['broadcast'].start()
+    return time.perf_counter() - start
 
 def create_app(config_name=None):
     """Application factory pattern"""
@@ -19,23 +90,41 @@ def create_app(config_name=None):
     
     # Initialize extensions
     db.init_app(app)
-    migrate = Migrate(app, db)
+    init_replica(app)
+    init_broadcast(app)
+    init_template_catalog(app)
+    if click.get_current_context(silent=True) is not None:
+        # flask db ... and the other command line tools
+        init_migrations(app)
+    dispose_engines_after_fork(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
+    init_json_provider(app)
+    init_rate_limiting(app)
+    # Registered before compression so pages are ETagged after they are compressed
+    init_assets(app)
+    init_compression(app)
     
     # Register blueprints
     app.register_blueprint(api_bp)
+    app.register_blueprint(site_bp)
     
     return app
 
-app = create_app()
+def __getattr__(name):
+    """`from server import app` keeps working, building the app on first use"""
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Default route - redirect to admin
-@app.route('/')
+@site_bp.route('/')
 def home():
     """Home page - redirect to admin interface"""
     return render_template('admin.html')
 
-@app.route('/health')
+@site_bp.route('/health')
 def health_check_legacy():
     """Legacy health check endpoint"""
     return jsonify({
@@ -45,7 +134,7 @@ def health_check_legacy():
     })
 
 # Admin functionality (legacy support)
-@app.route('/create_voting', methods=['POST', 'GET']) 
+@site_bp.route('/create_voting', methods=['POST', 'GET']) 
 def create_voting():
     """Legacy endpoint - now uses database"""
     try:
@@ -62,6 +151,7 @@ def create_voting():
         )
         db.session.add(session)
         db.session.flush()
+        ensure_session_partitions([session.id])
         
         # Check if this is a "Naše firmy" template based on question names
         nase_firmy_categories = ['MASKA', 'KOLA', 'SKELET', 'PLAKAT', 'MARKETING']
@@ -101,10 +191,14 @@ def create_voting():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/get_votings', methods=['GET'])
+@site_bp.route('/get_votings', methods=['GET'])
 def get_votings():
     """Get all voting sessions - updated for database"""
-    sessions = VotingSession.query.all()
+    sessions = VotingSession.query.options(
+        selectinload(VotingSession.teams),
+        selectinload(VotingSession.questions)
+    ).all()
+    vote_counts = vote_counts_by_team_and_question([s.id for s in sessions])
     result = {}
     
     for session in sessions:
@@ -112,7 +206,7 @@ def get_votings():
         for team in session.teams:
             team_questions = {}
             for question in session.questions:
-                votes = Vote.query.filter_by(team_id=team.id, question_id=question.id).count()
+                votes = vote_counts.get((team.id, question.id), 0)
                 team_questions[str(question.order_index + 1)] = votes
             teams_data.append({team.name: [team_questions]})
         
@@ -127,19 +221,23 @@ def get_votings():
     
     return jsonify(result)
 
-@app.route('/get_voting/<votingid>', methods=['GET'])
+@site_bp.route('/get_voting/<votingid>', methods=['GET'])
 def get_voting(votingid):
     """Get specific voting session"""
-    session = VotingSession.query.filter_by(unique_id=votingid).first()
+    session = VotingSession.query.options(
+        selectinload(VotingSession.teams),
+        selectinload(VotingSession.questions)
+    ).filter_by(unique_id=votingid).first()
     if not session:
         return jsonify({'error': 'Voting session not found'}), 404
     
     # Build legacy format response
+    vote_counts = vote_counts_by_team_and_question([session.id])
     teams_data = []
     for team in session.teams:
         team_questions = {}
         for question in session.questions:
-            votes = Vote.query.filter_by(team_id=team.id, question_id=question.id).count()
+            votes = vote_counts.get((team.id, question.id), 0)
             team_questions[str(question.order_index + 1)] = votes
         teams_data.append({team.name: [team_questions]})
     
@@ -154,7 +252,7 @@ def get_voting(votingid):
     
     return jsonify(voting_data)
 
-@app.route('/admin', methods=['POST', 'GET']) 
+@site_bp.route('/admin', methods=['POST', 'GET']) 
 def process_login():
     """Process admin login"""
     data = request.form.to_dict(flat=False)
@@ -163,7 +261,7 @@ def process_login():
     resp.set_cookie('password', str(data["pass"][0]), httponly=False)
     return resp
 
-@app.route('/start_voting/<voting_id>', methods=['POST'])
+@site_bp.route('/start_voting/<voting_id>', methods=['POST'])
 def start_voting(voting_id):
     """Start voting session"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
@@ -172,11 +270,12 @@ def start_voting(voting_id):
     
     session.started = True
     session.updated_at = datetime.utcnow()
+    publish(SESSION_CHANGED, session=voting_id, change='started')
     db.session.commit()
     
     return jsonify({"message": f"Voting {voting_id} has started!"})
 
-@app.route('/stop_voting/<voting_id>', methods=['POST'])
+@site_bp.route('/stop_voting/<voting_id>', methods=['POST'])
 def stop_voting(voting_id):
     """Stop voting session"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
@@ -185,23 +284,25 @@ def stop_voting(voting_id):
     
     session.ended = True
     session.updated_at = datetime.utcnow()
+    publish(SESSION_CHANGED, session=voting_id, change='stopped')
     db.session.commit()
+    freeze_results(session)
     
     return jsonify({"message": f"Voting {voting_id} has been stopped!"})
 
-@app.route('/login')
+@site_bp.route('/login')
 def admin_login():
     """Admin login page"""
     return render_template('login.html')
 
-@app.route('/api/config')
+@site_bp.route('/api/config')
 def get_app_config():
     """Get application configuration for frontend"""
     return jsonify({
-        'app_url': app.config.get('APP_URL', request.host_url.rstrip('/'))
+        'app_url': current_app.config.get('APP_URL', request.host_url.rstrip('/'))
     })
 
-@app.route('/presentation/<id>')
+@site_bp.route('/presentation/<id>')
 def projected_site(id):
     """QR code presentation page"""
     session = VotingSession.query.filter_by(unique_id=id).first()
@@ -210,7 +311,31 @@ def projected_site(id):
     
     return render_template('qr.html', voting_id=id, session_name=session.name)
 
-@app.route('/hlasovani/<voteid>')
+@site_bp.route('/presentation/<id>/qr.<fmt>')
+def presentation_qr(id, fmt):
+    """QR code of the voting page as SVG or PNG, ?size= in pixels"""
+    if fmt not in QR_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(QR_FORMATS)}'}), 404
+    if not qr_available():
+        return jsonify({'error': 'QR codes require the qrcode package'}), 501
+    size = request.args.get('size', DEFAULT_SIZE, type=int)
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        return jsonify({'error': f'size must be between {MIN_SIZE} and {MAX_SIZE}'}), 400
+    
+    app_url = current_app.config.get('APP_URL', request.host_url.rstrip('/'))
+    image = cached_qr_image(app_url, id, fmt, size)
+    if image is None:
+        if not VotingSession.query.filter_by(unique_id=id).first():
+            return jsonify({'error': 'Voting session not found'}), 404
+        image = qr_image(app_url, id, fmt, size)
+    
+    response = current_app.response_class(image, mimetype=QR_FORMATS[fmt])
+    # The URL names everything the image depends on but APP_URL, which only changes on redeploy
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@site_bp.route('/hlasovani/<voteid>')
 def voting_site_menu(voteid):
     """Voting page for users"""
     session = VotingSession.query.filter_by(unique_id=voteid).first()
@@ -222,16 +347,30 @@ def voting_site_menu(voteid):
     
     return render_template('voting.html')
 
-@app.route('/vysledky')
+@site_bp.route('/sw.js')
+def service_worker():
+    """Service worker for the offline voting page, served from the root scope.
+    It is rendered with the current asset URLs and version, so every deploy
+    that changes an asset installs a new worker with a fresh cache."""
+    response = make_response(render_template('sw.js'))
+    response.mimetype = 'application/javascript'
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+@site_bp.route('/vysledky')
 def results_page():
     """Results visualization page"""
     return render_template('results.html')
 
 # API endpoint to get voting data for frontend
-@app.route('/api/voting-data/<voteid>')
+@site_bp.route('/api/voting-data/<voteid>')
 def get_voting_data_for_frontend(voteid):
     """Get voting session data for the frontend voting interface"""
-    session = VotingSession.query.filter_by(unique_id=voteid).first()
+    session = VotingSession.query.options(
+        selectinload(VotingSession.questions),
+        selectinload(VotingSession.teams)
+    ).filter_by(unique_id=voteid).first()
     if not session:
         return jsonify({'error': 'Voting session not found'}), 404
     
@@ -260,24 +399,30 @@ def get_voting_data_for_frontend(voteid):
     })
 
 # API endpoint to get voting statistics for QR code page
-@app.route('/api/v1/voting-stats/<voting_id>')
+@site_bp.route('/api/v1/voting-stats/<voting_id>')
+@read_replica
 def get_voting_statistics(voting_id):
     """Get real-time voting statistics"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
     if not session:
         return jsonify({'error': 'Voting session not found'}), 404
     
-    # Count total votes
-    total_votes = Vote.query.filter_by(session_id=session.id).count()
-    
-    # Count unique voters
-    unique_voters = Voter.query.filter_by(session_id=session.id).count()
+    if session.archive is not None:
+        # The votes and voters of archived sessions were counted when they were moved out
+        total_votes = session.archive.vote_count
+        unique_voters = session.archive.voter_count
+    else:
+        # Count total votes
+        total_votes = Vote.query.filter_by(session_id=session.id).count()
+        
+        # Count unique voters
+        unique_voters = Voter.query.filter_by(session_id=session.id).count()
     
     return jsonify({
         'session_id': voting_id,
         'session_name': session.name,
-        'team_count': len(session.teams),
-        'question_count': len(session.questions),
+        'team_count': Team.query.filter_by(session_id=session.id).count(),
+        'question_count': Question.query.filter_by(session_id=session.id).count(),
         'vote_count': total_votes,
         'voter_count': unique_voters,
         'started': session.started,
@@ -285,7 +430,8 @@ def get_voting_statistics(voting_id):
     })
 
 # API endpoint to get detailed voting results
-@app.route('/api/v1/voting/<voting_id>/results')
+@site_bp.route('/api/v1/voting/<voting_id>/results')
+@read_replica
 def get_detailed_voting_results(voting_id):
     """Get detailed voting results for results page"""
     session = VotingSession.query.filter_by(unique_id=voting_id).first()
@@ -384,7 +530,8 @@ def get_detailed_voting_results(voting_id):
     })
 
 # API endpoint to submit votes from frontend
-@app.route('/api/submit-vote/<voteid>', methods=['POST'])
+@site_bp.route('/api/submit-vote/<voteid>', methods=['POST'])
+@idempotent
 def submit_vote_frontend(voteid):
     """Submit vote from frontend"""
     session = VotingSession.query.filter_by(unique_id=voteid).first()
@@ -397,10 +544,22 @@ def submit_vote_frontend(voteid):
     data = request.get_json()
     
     try:
-        # Create voter identifier from IP, user agent, and timestamp
-        # This ensures each voting session gets a unique voter entry
-        import time
-        voter_identifier = f"{request.remote_addr}_{hash(request.headers.get('User-Agent', ''))}_session_{int(time.time())}"
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            # Retries with the same key are answered by @idempotent, so the key identifies the ballot
+            voter_identifier = f"ballot_{idempotency_key[:90]}"
+            ballot_voter = Voter.query.filter_by(session_id=session.id, identifier=voter_identifier).first()
+            if ballot_voter is not None:
+                # Committed by an attempt that died before its response was stored
+                votes_submitted = Vote.query.filter_by(voter_id=ballot_voter.id).count()
+                return jsonify({
+                    'message': f'{votes_submitted} votes submitted successfully',
+                    'votes_submitted': votes_submitted
+                }), 201
+        else:
+            # Create voter identifier from IP, user agent, and timestamp
+            # This ensures each voting session gets a unique voter entry
+            voter_identifier = f"{request.remote_addr}_{hash(request.headers.get('User-Agent', ''))}_session_{int(time.time())}"
         
         # Create new voter for this voting session
         voter = Voter(
@@ -436,6 +595,7 @@ def submit_vote_frontend(voteid):
         
         voter.last_vote_at = datetime.utcnow()
         db.session.commit()
+        votes_landed(voteid, votes_submitted)
         
         return jsonify({
             'message': f'{votes_submitted} votes submitted successfully',
@@ -447,7 +607,7 @@ def submit_vote_frontend(voteid):
         return jsonify({'error': str(e)}), 500
 
 # Database initialization
-@app.cli.command()
+@site_bp.cli.command()
 def init_db():
     """Initialize the database with tables and sample data"""
     db.create_all()
@@ -492,4 +652,4 @@ if __name__ == '__main__':
     print(f"Environment: {os.environ.get('FLASK_ENV', 'production')}")
     print(f"Debug mode: {debug_mode}")
     
-    app.run(host=host, port=port, debug=debug_mode)
+    create_app().run(host=host, port=port, debug=debug_mode)
@@ -0,0 +1,115 @@
+/* ===== NVIAS VOTING SYSTEM - SERVICE WORKER =====
+   Keeps the voting page and its session bundle available when the venue
+   Wi-Fi drops, and delivers queued ballots once connectivity returns.
+   Rendered by the server: the cache is named after the current asset
+   version, so a deploy replaces the cached assets. */
+
+const VOTE_QUEUE_URL = '{{ asset_url('vote-queue.js') }}';
+const CACHE_NAME = 'nvias-voting-{{ asset_version }}';
+
+importScripts(VOTE_QUEUE_URL);
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then(cache => cache.add(VOTE_QUEUE_URL))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(key => key !== CACHE_NAME).map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+async function networkFirst(request) {
+  const cache = await caches.open(CACHE_NAME);
+  try {
+    const response = await fetch(request);
+    if (response.ok) {
+      cache.put(request, response.clone());
+    }
+    return response;
+  } catch (error) {
+    const cached = await cache.match(request);
+    if (cached) {
+      return cached;
+    }
+    throw error;
+  }
+}
+
+async function cacheFirst(request) {
+  const cache = await caches.open(CACHE_NAME);
+  const cached = await cache.match(request);
+  if (cached) {
+    return cached;
+  }
+  const response = await fetch(request);
+  if (response.ok || response.type === 'opaque') {
+    cache.put(request, response.clone());
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event) {
+  const cache = await caches.open(CACHE_NAME);
+  const cached = await cache.match(event.request);
+  const refreshed = fetch(event.request).then(response => {
+    if (response.ok) {
+      cache.put(event.request, response.clone());
+    }
+    return response;
+  });
+  if (cached) {
+    // Answer from the cache now and keep the worker alive until the copy is updated
+    event.waitUntil(refreshed.catch(() => {}));
+    return cached;
+  }
+  return refreshed;
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+
+  const url = new URL(request.url);
+
+  if (url.origin === self.location.origin) {
+    if (url.pathname.startsWith('/hlasovani/') || url.pathname.startsWith('/api/voting-data/')) {
+      // Voting page and session bundle: fresh when online, cached when not
+      event.respondWith(networkFirst(request));
+    } else if (url.pathname.startsWith('/static/dist/')) {
+      // Fingerprinted builds never change under their URL
+      event.respondWith(cacheFirst(request));
+    } else if (url.pathname.startsWith('/static/')) {
+      // Unfingerprinted files may change with any deploy
+      event.respondWith(staleWhileRevalidate(event));
+    }
+  } else if (request.destination === 'style' || request.destination === 'font') {
+    // Fonts and icon stylesheets from CDNs
+    event.respondWith(cacheFirst(request));
+  }
+});
+
+self.addEventListener('sync', event => {
+  if (event.tag === VoteQueue.SYNC_TAG) {
+    // Rejecting makes the browser schedule another sync attempt
+    event.waitUntil(VoteQueue.flush().then(async () => {
+      if ((await VoteQueue.all()).length) {
+        throw new Error('Ballots are still queued');
+      }
+    }));
+  }
+});
+
+self.addEventListener('message', event => {
+  if (event.data === 'flush-votes') {
+    event.waitUntil(VoteQueue.flush());
+  }
+});
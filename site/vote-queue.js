@@ -0,0 +1,113 @@
+/* ===== NVIAS VOTING SYSTEM - OFFLINE BALLOT QUEUE =====
+   Shared by voting.html and the service worker (sw.js). Ballots that cannot
+   be delivered are kept in IndexedDB and re-sent with the same
+   Idempotency-Key, so the server records each ballot only once. */
+
+const VoteQueue = (() => {
+  const DB_NAME = 'nvias-voting';
+  const STORE = 'ballots';
+  const SYNC_TAG = 'vote-queue';
+  const MAX_JITTER_MS = 3000;
+
+  function openDb() {
+    return new Promise((resolve, reject) => {
+      const request = indexedDB.open(DB_NAME, 1);
+      request.onupgradeneeded = () => request.result.createObjectStore(STORE, { keyPath: 'key' });
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+
+  async function withStore(mode, callback) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE, mode);
+      const request = callback(tx.objectStore(STORE));
+      tx.oncomplete = () => { db.close(); resolve(request.result); };
+      tx.onerror = () => { db.close(); reject(tx.error); };
+    });
+  }
+
+  function newKey() {
+    if (self.crypto && crypto.randomUUID) {
+      return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+  }
+
+  function add(ballot) {
+    return withStore('readwrite', store => store.put({ ...ballot, queuedAt: Date.now(), attempts: 0 }));
+  }
+
+  function all() {
+    return withStore('readonly', store => store.getAll());
+  }
+
+  function remove(key) {
+    return withStore('readwrite', store => store.delete(key));
+  }
+
+  function send(ballot) {
+    return fetch(`/api/submit-vote/${ballot.votingId}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': ballot.key
+      },
+      body: JSON.stringify({ votes: ballot.votes })
+    });
+  }
+
+  // Network errors, timeouts, overload and server errors are worth retrying
+  function isRetryable(response) {
+    return response.status >= 500 || response.status === 408 || response.status === 429;
+  }
+
+  async function flush({ jitter = true } = {}) {
+    const ballots = await all();
+    if (!ballots.length) {
+      return 0;
+    }
+
+    // Spread retries from many phones reconnecting at once
+    if (jitter) {
+      await new Promise(resolve => setTimeout(resolve, Math.random() * MAX_JITTER_MS));
+    }
+
+    let delivered = 0;
+    for (const ballot of ballots) {
+      let response;
+      try {
+        response = await send(ballot);
+      } catch (error) {
+        break; // still offline, keep everything queued
+      }
+      if (isRetryable(response)) {
+        await withStore('readwrite', store => store.put({ ...ballot, attempts: ballot.attempts + 1 }));
+        break;
+      }
+      // Delivered, or rejected for good (e.g. the session has ended)
+      await remove(ballot.key);
+      if (response.ok) {
+        delivered += 1;
+      }
+    }
+    return delivered;
+  }
+
+  async function requestSync() {
+    if (self.registration && self.registration.sync) {
+      return self.registration.sync.register(SYNC_TAG);
+    }
+    if (self.navigator && navigator.serviceWorker) {
+      const registration = await navigator.serviceWorker.ready;
+      if (registration.sync) {
+        return registration.sync.register(SYNC_TAG);
+      }
+    }
+  }
+
+  return { SYNC_TAG, newKey, add, all, remove, send, flush, isRetryable, requestSync };
+})();
+
+self.VoteQueue = VoteQueue;
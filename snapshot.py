@@ -0,0 +1,300 @@
+"""
+Columnar results snapshots for ended voting sessions.
+When a session is stopped its votes are frozen into NumPy arrays and saved
+as a compressed .npz file, so results and statistics can be computed with
+vectorised operations instead of ORM loops.
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+from flask import current_app
+
+from models import db, Question, Team, Vote, Voter
+
+SNAPSHOT_VERSION = 1
+NO_OPTION = 'no_option'
+
+
+class ResultsSnapshot:
+    """Immutable columnar copy of a session's votes"""
+
+    def __init__(self, question_ids, question_texts, question_types, team_ids, team_names,
+                 option_labels, question_idx, team_idx, voter_team_idx, option_idx,
+                 numeric_value, total_voters):
+        self.question_ids = question_ids
+        self.question_texts = question_texts
+        self.question_types = question_types
+        self.team_ids = team_ids
+        self.team_names = team_names
+        self.option_labels = option_labels
+        self.question_idx = question_idx
+        self.team_idx = team_idx
+        self.voter_team_idx = voter_team_idx  # -1 when the voter did not pick a team
+        self.option_idx = option_idx
+        self.numeric_value = numeric_value  # NaN when the vote has no numeric value
+        self.total_voters = int(total_voters)
+
+        for array in self.__dict__.values():
+            if isinstance(array, np.ndarray):
+                array.setflags(write=False)
+
+    @classmethod
+    def build(cls, session):
+        """Build a snapshot from the database rows of a voting session"""
+        questions = Question.query.filter_by(session_id=session.id).order_by(Question.id).all()
+        teams = Team.query.filter_by(session_id=session.id).order_by(Team.id).all()
+
+        question_positions = {q.id: i for i, q in enumerate(questions)}
+        team_positions = {t.id: i for i, t in enumerate(teams)}
+        option_positions = {}
+
+        rows = db.session.query(
+            Vote.question_id, Vote.team_id, Vote.voter_team_id,
+            Vote.option_selected, Vote.numeric_value
+        ).filter(Vote.session_id == session.id).order_by(Vote.id).all()
+
+        question_idx = np.empty(len(rows), dtype=np.int32)
+        team_idx = np.empty(len(rows), dtype=np.int32)
+        voter_team_idx = np.empty(len(rows), dtype=np.int32)
+        option_idx = np.empty(len(rows), dtype=np.int32)
+        numeric_value = np.empty(len(rows), dtype=np.float64)
+
+        # Votes naming a question or team of another session are left out
+        kept = 0
+        for question_id, team_id, voter_team_id, option, value in rows:
+            if question_id not in question_positions or team_id not in team_positions:
+                continue
+            question_idx[kept] = question_positions[question_id]
+            team_idx[kept] = team_positions[team_id]
+            voter_team_idx[kept] = team_positions.get(voter_team_id, -1)
+            option_idx[kept] = option_positions.setdefault(option or NO_OPTION, len(option_positions))
+            numeric_value[kept] = np.nan if value is None else value
+            kept += 1
+
+        return cls(
+            question_ids=np.array([q.id for q in questions], dtype=np.int64),
+            question_texts=np.array([q.text for q in questions], dtype=str),
+            question_types=np.array([q.question_type for q in questions], dtype=str),
+            team_ids=np.array([t.id for t in teams], dtype=np.int64),
+            team_names=np.array([t.name for t in teams], dtype=str),
+            option_labels=np.array(list(option_positions), dtype=str),
+            question_idx=question_idx[:kept],
+            team_idx=team_idx[:kept],
+            voter_team_idx=voter_team_idx[:kept],
+            option_idx=option_idx[:kept],
+            numeric_value=numeric_value[:kept],
+            total_voters=Voter.query.filter_by(session_id=session.id).count()
+        )
+
+    def save(self, path):
+        """Write the snapshot atomically as a compressed .npz file"""
+        tmp_path = f'{path}.tmp.npz'
+        np.savez_compressed(
+            tmp_path,
+            version=np.array(SNAPSHOT_VERSION),
+            question_ids=self.question_ids,
+            question_texts=self.question_texts,
+            question_types=self.question_types,
+            team_ids=self.team_ids,
+            team_names=self.team_names,
+            option_labels=self.option_labels,
+            question_idx=self.question_idx,
+            team_idx=self.team_idx,
+            voter_team_idx=self.voter_team_idx,
+            option_idx=self.option_idx,
+            numeric_value=self.numeric_value,
+            total_voters=np.array(self.total_voters)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a snapshot written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != SNAPSHOT_VERSION:
+                raise ValueError(f'Unsupported snapshot version in {path}')
+            return cls(**{key: data[key] for key in data.files if key != 'version'})
+
+    @property
+    def vote_count(self):
+        return len(self.question_idx)
+
+    def _counts(self, *indices, sizes):
+        """Count votes over a combination of index arrays"""
+        if not all(sizes):
+            return np.zeros(sizes, dtype=np.int64)
+        flat = np.ravel_multi_index(indices, sizes)
+        return np.bincount(flat, minlength=int(np.prod(sizes))).reshape(sizes)
+
+    def results(self):
+        """Per-question team results in the format of the results endpoint"""
+        n_questions, n_teams, n_options = len(self.question_ids), len(self.team_ids), len(self.option_labels)
+
+        vote_counts = self._counts(self.question_idx, self.team_idx, sizes=(n_questions, n_teams))
+        rating_sums = np.zeros((n_questions, n_teams))
+        np.add.at(rating_sums, (self.question_idx, self.team_idx), np.nan_to_num(self.numeric_value))
+        option_counts = self._counts(self.question_idx, self.team_idx, self.option_idx,
+                                     sizes=(n_questions, n_teams, max(n_options, 1)))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages = np.where(vote_counts > 0, rating_sums / vote_counts, 0)
+
+        results = []
+        for q in range(n_questions):
+            question_results = {
+                'question_id': int(self.question_ids[q]),
+                'question_text': str(self.question_texts[q]),
+                'question_type': str(self.question_types[q]),
+                'teams': {}
+            }
+            for t in range(n_teams):
+                if self.question_types[q] == 'rating':
+                    team_result = {
+                        'vote_count': int(vote_counts[q, t]),
+                        'average_rating': round(float(averages[q, t]), 2)
+                    }
+                else:
+                    counts = option_counts[q, t]
+                    team_result = {
+                        'vote_count': int(vote_counts[q, t]),
+                        'option_counts': {str(self.option_labels[o]): int(counts[o])
+                                          for o in np.flatnonzero(counts)}
+                    }
+                question_results['teams'][str(self.team_names[t])] = team_result
+            results.append(question_results)
+        return results
+
+    def crosstab(self, question_position):
+        """voter_team x voted_team vote counts for one question, plus votes without a voter team"""
+        n_teams = len(self.team_ids)
+        mask = self.question_idx == question_position
+        voter_team = self.voter_team_idx[mask]
+        voted_team = self.team_idx[mask]
+        known = voter_team >= 0
+
+        matrix = self._counts(voter_team[known], voted_team[known], sizes=(n_teams, n_teams))
+        unknown = np.bincount(voted_team[~known], minlength=n_teams)
+        return matrix, unknown
+
+    def team_selection_winner(self, question_position):
+        """The most voted team of a question in the format of the Naše firmy
+        results, None when nobody voted"""
+        mask = self.question_idx == question_position
+        voted_team = self.team_idx[mask]
+        if not len(voted_team):
+            return None
+        voter_team = self.voter_team_idx[mask]
+
+        counts = np.bincount(voted_team, minlength=len(self.team_ids))
+        # Ties go to the team that was voted for first, as in the live results
+        teams, first_vote = np.unique(voted_team, return_index=True)
+        in_vote_order = teams[np.argsort(first_vote)]
+        winner = in_vote_order[np.argmax(counts[in_vote_order])]
+        voters = voter_team[(voted_team == winner) & (voter_team >= 0)]
+        return {
+            'winning_team': str(self.team_names[winner]),
+            'votes_received': int(counts[winner]),
+            'voting_teams': [str(self.team_names[t]) for t in np.unique(voters)],
+            'self_votes': int(np.count_nonzero(voters == winner))
+        }
+
+    def statistics(self):
+        """Rating statistics per question and team, with a per voter-team breakdown"""
+        n_teams = len(self.team_ids)
+        statistics = []
+
+        for q in range(len(self.question_ids)):
+            mask = (self.question_idx == q) & ~np.isnan(self.numeric_value)
+            team_idx = self.team_idx[mask]
+            values = self.numeric_value[mask]
+            voter_team_idx = self.voter_team_idx[mask]
+
+            counts = np.bincount(team_idx, minlength=n_teams)
+            sums = np.bincount(team_idx, weights=values, minlength=n_teams)
+            squares = np.bincount(team_idx, weights=values ** 2, minlength=n_teams)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = np.where(counts > 0, sums / counts, np.nan)
+                stds = np.sqrt(np.maximum(np.where(counts > 0, squares / counts, np.nan) - means ** 2, 0))
+
+            known = voter_team_idx >= 0
+            pair_counts = self._counts(voter_team_idx[known], team_idx[known], sizes=(n_teams, n_teams))
+            pair_sums = np.zeros((n_teams, n_teams))
+            np.add.at(pair_sums, (voter_team_idx[known], team_idx[known]), values[known])
+
+            teams = {}
+            for t in range(n_teams):
+                if not counts[t]:
+                    continue
+                team_values = values[team_idx == t]
+                by_voter_team = {
+                    str(self.team_names[v]): round(float(pair_sums[v, t] / pair_counts[v, t]), 2)
+                    for v in np.flatnonzero(pair_counts[:, t])
+                }
+                teams[str(self.team_names[t])] = {
+                    'count': int(counts[t]),
+                    'mean': round(float(means[t]), 2),
+                    'std': round(float(stds[t]), 2),
+                    'min': float(team_values.min()),
+                    'max': float(team_values.max()),
+                    'by_voter_team': by_voter_team
+                }
+
+            statistics.append({
+                'question_id': int(self.question_ids[q]),
+                'question_text': str(self.question_texts[q]),
+                'question_type': str(self.question_types[q]),
+                'teams': teams
+            })
+        return statistics
+
+
+def snapshot_path(session):
+    """Location of the snapshot file for a voting session"""
+    return os.path.join(current_app.config['SNAPSHOT_DIR'], f'session_{session.id}_{session.unique_id}.npz')
+
+
+def save_snapshot(session):
+    """Build and persist the snapshot of an ended session"""
+    os.makedirs(current_app.config['SNAPSHOT_DIR'], exist_ok=True)
+    snapshot = ResultsSnapshot.build(session)
+    snapshot.save(snapshot_path(session))
+    return snapshot
+
+
+def delete_snapshot(session):
+    """Remove a stale snapshot, e.g. after the session's teams change"""
+    path = snapshot_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@lru_cache(maxsize=32)
+def _load_cached(path, mtime):
+    return ResultsSnapshot.load(path)
+
+
+def clear_snapshot_cache():
+    """Forget loaded snapshots, e.g. when another node changed a session"""
+    _load_cached.cache_clear()
+
+
+def load_snapshot(session):
+    """Return the persisted snapshot of an ended session, or None"""
+    if not session.ended:
+        return None
+    path = snapshot_path(session)
+    try:
+        return _load_cached(path, os.stat(path).st_mtime_ns)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_snapshot(session):
+    """Persisted snapshot for ended sessions, built on the fly otherwise"""
+    snapshot = load_snapshot(session)
+    if snapshot is None:
+        snapshot = ResultsSnapshot.build(session)
+    return snapshot
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the PostgreSQL client tools used by backup_recovery.py.
+Installed under the tool names by install_pg_stub(); every call is logged and
+answered from a small JSON state file, so backups and restores can be
+exercised without a PostgreSQL server.
+"""
+
+import gzip
+import io
+import json
+import os
+import re
+import stat
+import sys
+import tarfile
+
+TOOLS = ['pg_dump', 'pg_restore', 'pg_basebackup', 'pg_archivecleanup', 'pg_ctl', 'psql']
+
+
+def dump_id(table_index):
+    return 3000 + table_index
+
+
+def wal_name(n):
+    return f'00000001{0:08X}{n:08X}'
+
+
+def install_pg_stub(directory, counts=None, database_size=1048576):
+    """Install the stub tools into directory/bin and return (bin_dir, log_path, state_path)"""
+    bin_dir = os.path.join(directory, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(f'#!{sys.executable}\nimport sys\nsys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n'
+                    f'import pg_stub\npg_stub.main({tool!r})\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    log_path = os.path.join(directory, 'calls.jsonl')
+    state_path = os.path.join(directory, 'state.json')
+    with open(state_path, 'w') as f:
+        json.dump({'counts': counts or {}, 'database_size': database_size, 'wal': 1}, f)
+    return bin_dir, log_path, state_path
+
+
+def read_calls(log_path):
+    with open(log_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def _add_file(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def main(tool):
+    args = sys.argv[1:]
+    with open(os.environ['PG_STUB_LOG'], 'a') as f:
+        f.write(json.dumps([tool] + args) + '\n')
+    with open(os.environ['PG_STUB_STATE']) as f:
+        state = json.load(f)
+
+    def arg(flag):
+        return args[args.index(flag) + 1]
+
+    if tool == 'pg_dump':
+        out = arg('-f')
+        os.makedirs(out)
+        with open(os.path.join(out, 'toc.dat'), 'wb') as f:
+            f.write(b'PGDMP' + b'\0' * 64)
+        for n, table in enumerate(state['counts']):
+            with gzip.open(os.path.join(out, f'{dump_id(n)}.dat.gz'), 'wb') as f:
+                f.write(b'row\n' * state['counts'][table])
+
+    elif tool == 'pg_restore' and '-l' in args:
+        for n, table in enumerate(state['counts']):
+            print(f'{dump_id(n) - 1000}; 1259 1 TABLE public {table} voting_user')
+            print(f'{dump_id(n)}; 0 1 TABLE DATA public {table} voting_user')
+            print(f'{dump_id(n) + 1000}; 1259 2 INDEX public {table}_pkey voting_user')
+
+    elif tool == 'pg_restore':
+        # Progress lines as pg_restore -v -j prints them
+        section = next(a.split('=', 1)[1] for a in args if a.startswith('--section='))
+        kind = {'pre-data': ('TABLE', -1000), 'data': ('TABLE DATA', 0), 'post-data': ('INDEX', 1000)}[section]
+        for n, table in enumerate(state['counts']):
+            print(f'pg_restore: launching item {dump_id(n) + kind[1]} {kind[0]} public {table}', file=sys.stderr)
+            print(f'pg_restore: finished item {dump_id(n) + kind[1]} {kind[0]} public {table}', file=sys.stderr)
+
+    elif tool == 'pg_basebackup':
+        out = arg('-D')
+        os.makedirs(out)
+        with tarfile.open(os.path.join(out, 'base.tar.gz'), 'w:gz') as tar:
+            _add_file(tar, 'PG_VERSION', b'15\n')
+            _add_file(tar, 'backup_label', f'START WAL LOCATION: 0/0 (file {wal_name(state["wal"])})\n'.encode())
+        with tarfile.open(os.path.join(out, 'pg_wal.tar.gz'), 'w:gz') as tar:
+            _add_file(tar, wal_name(state['wal']), b'\0' * 16)
+
+    elif tool == 'psql' and '-c' not in args and '-q' in args:
+        # Interactive session: answer each statement as it arrives
+        for sql in sys.stdin:
+            if 'pg_export_snapshot' in sql:
+                print('00000003-0000001B-1')
+            elif 'count(*)' in sql:
+                for table in re.findall(r"SELECT '(\w+)'", sql):
+                    print(f"{table}\t{state['counts'].get(table, 0)}")
+            sys.stdout.flush()
+
+    elif tool == 'psql':
+        sql = arg('-c') if '-c' in args else sys.stdin.read()
+        if 'count(*)' in sql:
+            for table in re.findall(r"SELECT '(\w+)'", sql):
+                print(f"{table}\t{state['counts'].get(table, 0)}")
+        elif 'pg_database_size' in sql:
+            print(state['database_size'])
+        elif 'pg_switch_wal' in sql:
+            # The stub archiver compresses the finished segment right away
+            print(wal_name(state['wal']))
+            with gzip.open(os.path.join(os.environ['PG_STUB_WAL_ARCHIVE'], wal_name(state['wal']) + '.gz'), 'wb') as f:
+                f.write(b'\0' * 16)
+            state['wal'] += 1
+        elif 'pg_current_wal_lsn' in sql:
+            print(wal_name(state['wal']))
+        elif 'pg_stat_archiver' in sql:
+            print(wal_name(state['wal'] - 1))
+        elif 'pg_is_in_recovery' in sql:
+            print('f')
+
+    with open(os.environ['PG_STUB_STATE'], 'w') as f:
+        json.dump(state, f)
+
+
+if __name__ == '__main__':
+    main(os.path.basename(sys.argv[0]))
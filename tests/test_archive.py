@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test archiving ended sessions out of the hot tables
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db, VotingSession, Question, Team, Vote, Voter, SessionArchive
+from archive import (archive_ended_sessions, archive_path, archive_session, export_session, import_session,
+                     restore_session, sessions_to_archive)
+from test_snapshot import add_foreign_vote, create_mixed_session
+
+
+def nase_firmy_results(client):
+    results = client.get('/api/v1/voting/654321/results/nase-firmy').get_json()['results']
+    for result in results.values():
+        result['voting_teams'] = sorted(result['voting_teams'])
+    return results
+
+
+def test_archive_and_restore():
+    """Archived sessions keep their results and can be restored"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+    app.config['ARCHIVE_DIR'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        client = app.test_client()
+        # Counted from the rows while the session runs
+        live_nase_firmy = nase_firmy_results(client)
+        client.post('/api/v1/voting/654321/stop')
+        live = client.get('/api/v1/voting/654321/results').get_json()
+        live_stats = client.get('/api/v1/voting-stats/654321').get_json()
+        assert live_nase_firmy['MASKA']['votes_received'] == 6
+
+        # Recently ended sessions are left alone
+        assert sessions_to_archive(30) == []
+        session.updated_at = datetime.utcnow() - timedelta(days=31)
+        db.session.commit()
+
+        archived = archive_ended_sessions(30)
+        assert [record.vote_count for record in archived] == [36]
+        assert Vote.query.count() == 0
+        assert Voter.query.count() == 0
+        assert os.path.exists(archive_path(archived[0].archive_file))
+
+        assert client.get('/api/v1/voting/654321/results').get_json() == live
+        assert client.get('/api/v1/voting-stats/654321').get_json() == live_stats
+        assert nase_firmy_results(client) == live_nase_firmy
+        listing = client.get('/api/v1/voting').get_json()
+        assert listing[0]['archived'] is True
+        assert listing[0]['vote_count'] == 36
+        assert client.get('/api/v1/voting/654321/export').status_code == 410
+        assert client.post('/api/v1/voting/654321/teams', json={'teams': []}).status_code == 409
+
+        restore_session(session)
+        assert SessionArchive.query.count() == 0
+        assert Vote.query.count() == 36
+        assert Voter.query.count() == 12
+        assert Vote.query.first().timestamp is not None
+        assert client.get('/api/v1/voting').get_json()[0]['archived'] is False
+        assert client.get('/api/v1/voting/654321/export').status_code == 200
+
+
+def test_export_and_import_session():
+    """Exported sessions import under new ids with all references remapped"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+    app.config['ARCHIVE_DIR'] = tempfile.mkdtemp()
+    path = os.path.join(tempfile.mkdtemp(), 'session.jsonl.gz')
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        client = app.test_client()
+        client.post('/api/v1/voting/654321/stop')
+        live = client.get('/api/v1/voting/654321/results').get_json()
+
+        counts = export_session(session, path)
+        assert counts == {'voting_sessions': 1, 'questions': 3, 'teams': 3, 'voters': 12, 'votes': 36}
+
+        # Archived sessions export the same rows
+        archive_session(session)
+        assert export_session(session, path) == counts
+
+        try:
+            import_session(path)
+            assert False, 'importing over an existing session must fail'
+        except ValueError:
+            pass
+
+        copy, dropped = import_session(path, unique_id='111222')
+        assert dropped == 0
+        assert copy.id != session.id and copy.ended
+        assert Vote.query.filter_by(session_id=copy.id).count() == 36
+        assert Voter.query.filter_by(session_id=copy.id).count() == 12
+        copy_teams = {t.id for t in Team.query.filter_by(session_id=copy.id)}
+        copy_questions = {q.id for q in Question.query.filter_by(session_id=copy.id)}
+        for vote in Vote.query.filter_by(session_id=copy.id):
+            assert vote.team_id in copy_teams and vote.question_id in copy_questions
+            assert vote.voter_team_id is None or vote.voter_team_id in copy_teams
+
+        results = client.get('/api/v1/voting/111222/results').get_json()
+        strip = lambda data: [dict(q, question_id=None) for q in data['results']]
+        assert strip(results) == strip(live) and results['total_voters'] == 12
+        assert VotingSession.query.count() == 2
+
+
+def test_import_drops_votes_outside_the_session():
+    """Votes naming another session's team are left out, other voter teams become None"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+    path = os.path.join(tempfile.mkdtemp(), 'session.jsonl.gz')
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        add_foreign_vote(session)
+        stranger = Team.query.filter_by(name='Stranger').one()
+        Vote.query.filter_by(session_id=session.id).order_by(Vote.id).first().voter_team_id = stranger.id
+        db.session.commit()
+
+        assert export_session(session, path)['votes'] == 37
+        copy, dropped = import_session(path, unique_id='111222')
+        assert dropped == 1
+        assert Vote.query.filter_by(session_id=copy.id).count() == 36
+        assert Vote.query.filter_by(session_id=copy.id, voter_team_id=None).count() == 3
+
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    print("Testing session archival...")
+    test_archive_and_restore()
+    print("✓ Session archival working")
+    test_export_and_import_session()
+    test_import_drops_votes_outside_the_session()
+    print("✓ Session export and import working")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test the static asset pipeline: build, fingerprinted URLs and cache headers
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, render_template_string
+
+from assets import SITE_DIR, asset_version, build_assets, init_assets, minify_css, minify_js
+
+
+def build_site_copy():
+    """Build the assets of a copy of site/ so the repository stays clean"""
+    site_dir = os.path.join(tempfile.mkdtemp(), 'site')
+    shutil.copytree(SITE_DIR, site_dir, ignore=shutil.ignore_patterns('dist'))
+    manifest = build_assets(site_dir, quiet=True)
+    return site_dir, manifest
+
+
+def create_asset_app(site_dir, **config):
+    app = Flask(__name__, static_folder=site_dir, static_url_path='/static')
+    app.config.update(config)
+    init_assets(app)
+    return app
+
+
+def test_build_assets():
+    """Stylesheets and scripts are minified, fingerprinted and precompressed"""
+    site_dir, manifest = build_site_copy()
+
+    assert 'styles.css' in manifest
+    assert 'voting.css' not in manifest  # empty files are skipped
+    assert 'vote-queue.js' in manifest
+    assert 'sw.js' not in manifest  # the service worker keeps a stable URL
+    built = os.path.join(site_dir, 'dist', manifest['styles.css'])
+    assert os.path.getsize(built) < os.path.getsize(os.path.join(site_dir, 'styles.css'))
+    with open(built + '.gz', 'rb') as f, open(built, 'rb') as original:
+        assert gzip.decompress(f.read()) == original.read()
+
+    # Rebuilding unchanged sources gives the same names
+    assert build_assets(site_dir, quiet=True) == manifest
+
+    assert minify_css('a  { color: red ; }\n/* note */ b > i { margin: 0 }') == 'a{color:red}b>i{margin:0}'
+    built = os.path.join(site_dir, 'dist', manifest['vote-queue.js'])
+    assert os.path.getsize(built) < os.path.getsize(os.path.join(site_dir, 'vote-queue.js'))
+    # Literals are kept as they are, line breaks stay for semicolon insertion
+    assert minify_js("/* head */\nconst a = 'x // y';  // note\n\n    let t = `a\n  b`;\n") == \
+        "const a = 'x // y';\nlet t = `a\n  b`;"
+
+
+def test_fingerprinted_assets_are_immutable():
+    """Built assets are served precompressed with long-lived caching"""
+    site_dir, manifest = build_site_copy()
+    app = create_asset_app(site_dir)
+    client = app.test_client()
+
+    with app.test_request_context():
+        url = render_template_string("{{ asset_url('styles.css') }}")
+        assert url == f"/static/dist/{manifest['styles.css']}"
+        assert render_template_string("{{ asset_url('missing.css') }}") == '/static/missing.css'
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    response.close()
+
+    response = client.get(url)
+    assert 'Content-Encoding' not in response.headers
+    response.close()
+
+    assert client.get('/static/dist/unknown.css').status_code == 404
+
+
+def test_proxy_offload():
+    """X-Accel-Redirect and X-Sendfile hand the bytes to the proxy"""
+    site_dir, manifest = build_site_copy()
+    url = f"/static/dist/{manifest['styles.css']}"
+
+    accel = create_asset_app(site_dir, STATIC_ACCEL_REDIRECT_PREFIX='/_protected_static/').test_client()
+    response = accel.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['X-Accel-Redirect'] == f"/_protected_static/{manifest['styles.css']}.gz"
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.data == b''
+
+    sendfile = create_asset_app(site_dir, USE_X_SENDFILE=True).test_client()
+    response = sendfile.get(url)
+    assert response.headers['X-Sendfile'].endswith(manifest['styles.css'])
+
+
+def test_pages_revalidate_with_etag():
+    """HTML pages carry an ETag so reloads are answered with 304"""
+    from server import app
+
+    client = app.test_client()
+    response = client.get('/login')
+    assert response.status_code == 200
+    assert 'no-cache' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    response = client.get('/login', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_service_worker_follows_the_assets():
+    """The service worker names its cache after the asset version and loads the current queue script"""
+    site_dir, manifest = build_site_copy()
+    version = asset_version(site_dir, manifest)
+    with open(os.path.join(site_dir, 'vote-queue.js'), 'a') as f:
+        f.write('\nself.changed = true;\n')
+    assert asset_version(site_dir, build_assets(site_dir, quiet=True)) != version
+
+    from server import app
+
+    response = app.test_client().get('/sw.js')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/javascript'
+    assert 'no-cache' in response.headers['Cache-Control']
+    script = response.get_data(as_text=True)
+    assert f"const CACHE_NAME = 'nvias-voting-{app.jinja_env.globals['asset_version']}';" in script
+    with app.test_request_context():
+        queue_url = render_template_string("{{ asset_url('vote-queue.js') }}")
+    assert f"const VOTE_QUEUE_URL = '{queue_url}';" in script
+    assert '{{' not in script
+
+
+if __name__ == '__main__':
+    print("Testing static asset pipeline...")
+    test_build_assets()
+    test_fingerprinted_assets_are_immutable()
+    test_proxy_offload()
+    test_pages_revalidate_with_etag()
+    test_service_worker_follows_the_assets()
+    print("✓ Static asset pipeline working")
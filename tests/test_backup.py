@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test backup_recovery.py against the PostgreSQL tool stand-in
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import backup_recovery
+from pg_stub import install_pg_stub, read_calls
+
+COUNTS = {'voting_sessions': 3, 'questions': 9, 'teams': 12, 'voters': 40, 'votes': 360, 'question_templates': 5}
+
+
+def use_stub(monkeypatch):
+    directory = tempfile.mkdtemp()
+    bin_dir, log_path, state_path = install_pg_stub(directory, counts=COUNTS)
+    backup_dir = Path(directory) / 'backups'
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('PG_STUB_LOG', log_path)
+    monkeypatch.setenv('PG_STUB_STATE', state_path)
+    monkeypatch.setenv('PG_STUB_WAL_ARCHIVE', str(backup_dir / 'wal_archive'))
+    monkeypatch.setattr(backup_recovery, 'LOCAL_MODE', True)
+    monkeypatch.setattr(backup_recovery, 'BACKUP_DIR', backup_dir)
+    monkeypatch.setattr(backup_recovery, 'DATA_DIR', Path(directory) / 'data')
+    backup_recovery.ensure_directories()
+    return backup_dir, log_path
+
+
+def test_logical_backup(monkeypatch):
+    """Directory-format parallel dump with metrics and row counts in the metadata"""
+    backup_dir, log_path = use_stub(monkeypatch)
+    monkeypatch.setattr(backup_recovery, 'MAX_BACKUPS', 2)
+
+    paths = []
+    for _ in range(3):
+        paths.append(backup_recovery.create_backup())
+        # Backups are named by the second they were taken in
+        os.utime(paths[-1], (len(paths), len(paths)))
+        monkeypatch.setattr(backup_recovery, 'datetime', FakeDatetime.advance())
+
+    dump = [call for call in read_calls(log_path) if call[0] == 'pg_dump'][0]
+    assert '-Fd' in dump and dump[dump.index('-j') + 1] == str(backup_recovery.DUMP_JOBS)
+    # The dump reads the snapshot the row counts were taken in
+    assert '--snapshot=00000003-0000001B-1' in dump
+
+    metadata = json.loads(paths[-1].with_suffix('.json').read_text())
+    assert metadata['type'] == 'logical'
+    assert metadata['row_counts'] == COUNTS
+    assert metadata['size'] > 0 and metadata['database_size'] == 1048576
+    assert metadata['duration_seconds'] >= 0
+
+    # Only MAX_BACKUPS dumps are kept
+    assert sorted(p.name for p in backup_dir.glob('*.dir')) == sorted(p.name for p in paths[1:])
+    assert len(backup_recovery.list_backups()) == 2
+
+
+def test_incremental_backup(monkeypatch):
+    """Incremental backups record the WAL archived since the previous one"""
+    backup_dir, log_path = use_stub(monkeypatch)
+
+    assert backup_recovery.create_incremental_backup() is None  # needs a base backup first
+    assert backup_recovery.create_base_backup() is not None
+    base = backup_recovery.load_metadata('base')[0]
+    assert base['start_wal'] == '000000010000000000000001'
+
+    monkeypatch.setattr(backup_recovery, 'datetime', FakeDatetime.advance())
+    first = backup_recovery.create_incremental_backup()
+    monkeypatch.setattr(backup_recovery, 'datetime', FakeDatetime.advance())
+    second = backup_recovery.create_incremental_backup()
+
+    assert (first['first_wal'], first['last_wal'], first['wal_files']) == ('000000010000000000000001', '000000010000000000000001', 1)
+    assert (second['first_wal'], second['last_wal'], second['wal_files']) == ('000000010000000000000002', '000000010000000000000002', 1)
+    assert second['compressed_files'] == 1 and second['base'] == base['name']
+
+
+def test_point_in_time_restore(monkeypatch):
+    """PITR puts the base backup in place and configures WAL replay to the target"""
+    backup_dir, log_path = use_stub(monkeypatch)
+    pgdata = Path(tempfile.mkdtemp()) / 'pgdata'
+    pgdata.mkdir()
+    (pgdata / 'old_marker').write_text('old cluster')
+    monkeypatch.setenv('PGDATA', str(pgdata))
+
+    early = backup_recovery.datetime.now() - backup_recovery.timedelta(hours=1)
+    backup_recovery.create_base_backup()
+    backup_recovery.create_incremental_backup()
+    target = (backup_recovery.datetime.now() + backup_recovery.timedelta(hours=1)).isoformat(sep=' ')
+
+    assert backup_recovery.restore_point_in_time(early.isoformat(), assume_yes=True) is False
+    assert backup_recovery.restore_point_in_time('yesterday', assume_yes=True) is False
+    assert backup_recovery.restore_point_in_time(target, assume_yes=True) is True
+
+    assert (pgdata / 'PG_VERSION').read_text() == '15\n'
+    assert (pgdata / 'recovery.signal').exists()
+    assert (pgdata / 'pg_wal' / '000000010000000000000001').exists()
+    moved = [p for p in pgdata.parent.iterdir() if p.name.startswith('pgdata.before_pitr_')]
+    assert (moved[0] / 'old_marker').read_text() == 'old cluster'
+
+    settings = dict(line.split(' = ', 1) for line in (pgdata / 'postgresql.auto.conf').read_text().splitlines())
+    assert settings['recovery_target_time'] == f"'{target}'"
+    assert settings['recovery_target_action'] == "'promote'"
+
+    # The restore_command fetches and decompresses archived segments
+    restored = pgdata / 'RECOVERYXLOG'
+    restore_command = settings['restore_command'].strip("'")
+    restore_command = restore_command.replace('%f', '000000010000000000000001').replace('%p', str(restored))
+    subprocess.run(['sh', '-c', restore_command], check=True)
+    assert restored.read_bytes() == b'\0' * 16
+
+    pg_ctl = [call for call in read_calls(log_path) if call[0] == 'pg_ctl']
+    assert 'stop' in pg_ctl[0] and 'start' in pg_ctl[1]
+
+
+def test_restore_non_interactive(monkeypatch, capsys):
+    """--restore FILE --yes restores in sections with pg_restore -j and checks row counts"""
+    backup_dir, log_path = use_stub(monkeypatch)
+    path = backup_recovery.create_backup()
+
+    monkeypatch.setattr(sys, 'argv', ['backup_recovery.py', '--restore', path.name, '--yes', '--jobs', '3'])
+    monkeypatch.setattr('builtins.input', lambda prompt='': pytest.fail('restore asked for input'))
+    with pytest.raises(SystemExit) as exit_info:
+        backup_recovery.main()
+    assert exit_info.value.code == 0
+
+    restores = [call for call in read_calls(log_path) if call[0] == 'pg_restore' and '-l' not in call]
+    assert [call[call.index('-j') + 1] for call in restores] == ['3', '3', '3']
+    assert [[a for a in call if a.startswith('--section')] for call in restores] == [
+        ['--section=pre-data'], ['--section=data'], ['--section=post-data']]
+    # The database is recreated empty first instead of dropping objects with --clean
+    assert not any('--clean' in call for call in restores)
+    admin = [call[-1].split(' ')[0] for call in read_calls(log_path)
+             if call[0] == 'psql' and call[call.index('-d') + 1] == 'postgres']
+    assert admin == ['DROP', 'CREATE']
+    output = capsys.readouterr().out
+    assert '18/18 items' in output and 'MB/s' in output
+    assert 'votes: 360 restored, 360 in backup' in output
+
+    # Rows lost during the restore fail the verification
+    state_path = os.environ['PG_STUB_STATE']
+    state = json.loads(Path(state_path).read_text())
+    state['counts']['votes'] = 300
+    Path(state_path).write_text(json.dumps(state))
+    assert backup_recovery.restore_backup(path, assume_yes=True) is False
+
+
+class FakeDatetime(backup_recovery.datetime):
+    """datetime whose now() moves a second further on every advance()"""
+    offset = 0
+
+    @classmethod
+    def advance(cls):
+        cls.offset += 1
+        return cls
+
+    @classmethod
+    def now(cls, tz=None):
+        from datetime import datetime, timedelta
+        return datetime.now(tz) + timedelta(seconds=cls.offset)
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
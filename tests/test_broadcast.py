@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test the session event broadcast bus
+"""
+
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db
+from broadcast import PostgresBus, SESSION_CHANGED, VOTES_LANDED
+from test_snapshot import create_mixed_session
+
+
+def test_events_are_delivered_after_commit():
+    """Session events reach subscribers once committed, never on rollback; votes are coalesced"""
+    app = create_app('testing')
+    received = []
+    bus = app.extensions['broadcast']
+    bus.subscribe(SESSION_CHANGED, lambda payload: received.append((SESSION_CHANGED, payload)))
+    bus.subscribe(VOTES_LANDED, lambda payload: received.append((VOTES_LANDED, payload)))
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        question, team = session.questions[0], session.teams[0]
+        client = app.test_client()
+
+        client.post('/api/v1/voting/654321/start')
+        for voter in ('bus-voter', 'other-voter'):
+            client.post('/api/v1/voting/654321/vote', json={
+                'question_id': question.id, 'team_id': team.id, 'voter_identifier': voter, 'numeric_value': 4
+            })
+        # Nothing is sent per vote; the worker announces the count later in one transaction
+        assert received == [(SESSION_CHANGED, {'session': '654321', 'change': 'started'})]
+        bus.flush_votes()
+        bus.flush_votes()
+        # Removing a team with votes is rolled back, so nothing is announced
+        assert client.post('/api/v1/voting/654321/teams', json={'teams': []}).status_code == 409
+        client.post('/stop_voting/654321')
+
+    assert received == [
+        (SESSION_CHANGED, {'session': '654321', 'change': 'started'}),
+        (VOTES_LANDED, {'session': '654321', 'votes': 2}),
+        (SESSION_CHANGED, {'session': '654321', 'change': 'stopped'}),
+    ]
+
+
+def test_postgres_bus_notifies_in_transaction():
+    """NOTIFY goes out with the transaction; listener messages are dispatched locally"""
+    app = create_app('testing')
+    bus = PostgresBus(app, 'voting_events')
+    executed = []
+
+    class FakeSession:
+        def execute(self, statement, params):
+            executed.append((str(statement), params))
+
+    bus.send(FakeSession(), [(SESSION_CHANGED, {'session': '654321', 'change': 'started'})])
+    assert executed[0][0] == 'SELECT pg_notify(:channel, :message)'
+    assert executed[0][1]['channel'] == 'voting_events'
+    message = executed[0][1]['message']
+    assert json.loads(message) == {'event': SESSION_CHANGED, 'session': '654321', 'change': 'started'}
+
+    received = []
+    bus.subscribe(SESSION_CHANGED, received.append)
+    bus.deliver(message)
+    assert received == [{'session': '654321', 'change': 'started'}]
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test and benchmark response compression and JSON encoding on results endpoints
+"""
+
+import gzip
+import json
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from server import create_app
+from models import db, VotingSession, Question, Team, Vote, Voter
+from json_provider import OrjsonProvider
+
+
+def create_large_session(team_count=40, question_count=5, voter_count=200):
+    """Create a started session where every voter rates one team per question"""
+    session = VotingSession(unique_id='777777', name='Compression test', started=True)
+    db.session.add(session)
+    db.session.flush()
+
+    questions = [Question(session_id=session.id, text=f'Question {i}', question_type='rating',
+                          options=['1', '2', '3', '4', '5'], order_index=i) for i in range(question_count)]
+    teams = [Team(session_id=session.id, name=f'Team {i}') for i in range(team_count)]
+    db.session.add_all(questions + teams)
+    db.session.flush()
+
+    voters = [Voter(session_id=session.id, identifier=f'voter-{n}') for n in range(voter_count)]
+    db.session.add_all(voters)
+    db.session.flush()
+
+    db.session.add_all([
+        Vote(session_id=session.id, question_id=q.id, team_id=teams[(n + i) % team_count].id,
+             voter_id=voter.id, voter_team_id=teams[n % team_count].id, numeric_value=(n + i) % 5 + 1)
+        for n, voter in enumerate(voters) for i, q in enumerate(questions)
+    ])
+    db.session.commit()
+
+
+def test_results_endpoints_are_compressed():
+    """Large JSON responses are gzip encoded when the client accepts it"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        create_large_session()
+        client = app.test_client()
+
+        print("\n  Endpoint                              identity      gzip   saved")
+        for url in ['/api/v1/voting/777777/results', '/api/v1/voting/777777/crosstab',
+                    '/api/v1/voting/777777/statistics']:
+            plain = client.get(url)
+            compressed = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+
+            assert 'Content-Encoding' not in plain.headers
+            assert compressed.headers['Content-Encoding'] == 'gzip'
+            assert 'Accept-Encoding' in compressed.headers['Vary']
+            assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+            saved = 1 - len(compressed.data) / len(plain.data)
+            print(f"  {url:<36} {len(plain.data):>8} B {len(compressed.data):>7} B {saved:>6.0%}")
+            assert len(compressed.data) < len(plain.data)
+
+        # Below the size threshold responses stay uncompressed
+        small = client.get('/api/v1/health', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+
+        # Clients refusing gzip get identity
+        refused = client.get('/api/v1/voting/777777/results', headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in refused.headers
+
+        # Streamed exports are never buffered for compression
+        export = client.get('/api/v1/voting/777777/export', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in export.headers
+
+        db.drop_all()
+
+
+def test_static_assets_are_compressed():
+    """Static site files are compressed like API responses"""
+    app = create_app('testing')
+    client = app.test_client()
+
+    plain = client.get('/static/styles.css')
+    compressed = client.get('/static/styles.css', headers={'Accept-Encoding': 'gzip'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    print(f"\n  styles.css: {len(plain.data)} B -> {len(compressed.data)} B")
+    plain.close()
+    compressed.close()
+
+
+def test_orjson_provider_matches_default_output():
+    """orjson encoding produces the same documents as the default provider"""
+    pytest.importorskip('orjson')
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        create_large_session()
+        payload = app.test_client().get('/api/v1/voting/777777/results').get_json()
+
+        default_provider = DefaultJSONProvider(app)
+        orjson_provider = OrjsonProvider(app)
+        assert json.loads(orjson_provider.dumps(payload)) == json.loads(default_provider.dumps(payload))
+        orjson_response = orjson_provider.response(payload)
+        assert orjson_response.mimetype == 'application/json'
+        assert json.loads(orjson_response.get_data()) == payload
+
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    print("Testing response compression...")
+    test_results_endpoints_are_compressed()
+    test_static_assets_are_compressed()
+    test_orjson_provider_matches_default_output()
+    print("✓ Response compression working")
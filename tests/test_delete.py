@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test bulk deletion of voting sessions and in-place team updates
+"""
+
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db, VotingSession, Question, Team, Vote, Voter
+from snapshot import snapshot_path
+from test_snapshot import create_mixed_session
+
+
+def test_delete_sessions():
+    """Deleting sessions removes every dependent row and the snapshot"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        other = VotingSession(unique_id='111111', name='Keep me')
+        empty = VotingSession(unique_id='222222', name='Empty')
+        db.session.add_all([other, empty])
+        db.session.commit()
+        client = app.test_client()
+        client.post('/api/v1/voting/654321/stop')
+        path = snapshot_path(session)
+        assert os.path.exists(path)
+
+        response = client.delete('/api/v1/voting/654321')
+        assert response.status_code == 200
+        assert response.get_json()['deleted'] == {
+            'votes': 36, 'voters': 12, 'questions': 3, 'teams': 3,
+            'session_archives': 0, 'voting_sessions': 1
+        }
+        assert not os.path.exists(path)
+        assert Vote.query.count() == Voter.query.count() == Question.query.count() == Team.query.count() == 0
+        assert client.delete('/api/v1/voting/654321').status_code == 404
+
+        assert client.post('/api/v1/voting:delete', json={'ids': ['222222', '333333']}).status_code == 404
+        response = client.post('/api/v1/voting:delete', json={'ids': ['222222']})
+        assert response.status_code == 200
+        assert [s.unique_id for s in VotingSession.query.all()] == ['111111']
+        assert client.post('/api/v1/voting:delete', json={}).status_code == 400
+
+
+def test_update_teams_keeps_voted_teams():
+    """Teams are updated in place; teams with votes cannot be removed"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        create_mixed_session()
+        client = app.test_client()
+        alpha_id = Team.query.filter_by(name='Alpha').first().id
+
+        teams = [{'name': 'Alpha'}, {'name': 'Beta', 'description': 'Renamed later'}, {'name': 'Gamma'}, {'name': 'Delta'}]
+        assert client.post('/api/v1/voting/654321/teams', json={'teams': teams}).status_code == 200
+        assert Team.query.count() == 4
+        assert Team.query.filter_by(name='Alpha').first().id == alpha_id
+        assert Team.query.filter_by(name='Beta').first().description == 'Renamed later'
+
+        # Delta has no votes and can go, Gamma has votes and must stay
+        response = client.post('/api/v1/voting/654321/teams', json={'teams': teams[:2]})
+        assert response.status_code == 409
+        assert 'Gamma' in response.get_json()['error']
+        assert Team.query.count() == 4
+
+        assert client.post('/api/v1/voting/654321/teams', json={'teams': teams[:3]}).status_code == 200
+        assert sorted(t.name for t in Team.query.all()) == ['Alpha', 'Beta', 'Gamma']
+
+
+if __name__ == '__main__':
+    print("Testing session deletion...")
+    test_delete_sessions()
+    test_update_teams_keeps_voted_teams()
+    print("✓ Session deletion working")
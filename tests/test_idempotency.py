@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test Idempotency-Key handling of the vote submission endpoint
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db, VotingSession, Question, Team, Vote, Voter, IdempotencyKey
+from idempotency import response_cache
+
+
+def create_started_session():
+    session = VotingSession(unique_id='424242', name='Idempotency test', started=True)
+    db.session.add(session)
+    db.session.flush()
+    question = Question(session_id=session.id, text='Quality', question_type='rating',
+                        options=['1', '2', '3', '4', '5'], order_index=0)
+    team = Team(session_id=session.id, name='Alpha')
+    db.session.add_all([question, team])
+    db.session.commit()
+    return question, team
+
+
+def test_retry_with_same_key_is_replayed():
+    """A retried submission returns the first response and stores one vote"""
+    app = create_app('testing')
+    response_cache.clear()
+
+    with app.app_context():
+        db.create_all()
+        question, team = create_started_session()
+        client = app.test_client()
+        url = '/api/v1/voting/424242/vote'
+        ballot = {'question_id': question.id, 'team_id': team.id,
+                  'voter_identifier': 'phone-1', 'option_selected': '5'}
+        headers = {'Idempotency-Key': 'ballot-1'}
+
+        first = client.post(url, json=ballot, headers=headers)
+        assert first.status_code == 201
+        assert 'Idempotent-Replayed' not in first.headers
+
+        retry = client.post(url, json=ballot, headers=headers)
+        assert retry.status_code == 201
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert retry.get_json() == first.get_json()
+        assert Vote.query.count() == 1
+
+        # The stored response survives a restart of the in-memory front
+        response_cache.clear()
+        retry = client.post(url, json=ballot, headers=headers)
+        assert retry.status_code == 201
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert IdempotencyKey.query.count() == 1
+
+        # Reusing a key for a different ballot is rejected
+        changed = client.post(url, json=dict(ballot, option_selected='1'), headers=headers)
+        assert changed.status_code == 422
+
+        # Without a key the endpoint behaves as before
+        duplicate = client.post(url, json=ballot)
+        assert duplicate.status_code == 400
+        assert Vote.query.count() == 1
+
+        assert client.post(url, json=ballot, headers={'Idempotency-Key': 'x' * 101}).status_code == 400
+
+
+def test_errors_and_in_progress_keys():
+    """Final errors are replayed, a key still being processed answers 409"""
+    app = create_app('testing')
+    response_cache.clear()
+
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+
+        response = client.post('/api/v1/voting/000000/vote', json={}, headers={'Idempotency-Key': 'missing'})
+        assert response.status_code == 404
+        assert IdempotencyKey.query.filter_by(key='missing').first().status_code == 404
+
+        stale = IdempotencyKey(scope='/api/v1/voting/000000/vote', key='crashed', request_hash='0' * 64)
+        db.session.add(stale)
+        db.session.commit()
+        response = client.post('/api/v1/voting/000000/vote', json={}, headers={'Idempotency-Key': 'crashed'})
+        assert response.status_code == 409
+        assert response.headers['Retry-After'] == '1'
+
+
+def test_ballot_committed_without_stored_response():
+    """A retry after the ballot committed but its response was lost is not counted twice"""
+    app = create_app('testing')
+    response_cache.clear()
+
+    with app.app_context():
+        db.create_all()
+        question, team = create_started_session()
+        client = app.test_client()
+        url = '/api/submit-vote/424242'
+        ballot = {'votes': [{'question_id': question.id, 'team_id': team.id, 'numeric_value': 5}]}
+        headers = {'Idempotency-Key': 'ballot-2'}
+
+        first = client.post(url, json=ballot, headers=headers)
+        assert first.status_code == 201
+
+        # The worker died between the ballot and the response commit; the reservation went stale
+        IdempotencyKey.query.delete()
+        db.session.commit()
+        response_cache.clear()
+
+        retry = client.post(url, json=ballot, headers=headers)
+        assert retry.status_code == 201
+        assert retry.get_json() == first.get_json()
+        assert Voter.query.count() == 1
+        assert Vote.query.count() == 1
+
+
+if __name__ == '__main__':
+    print("Testing idempotent vote submission...")
+    test_retry_with_same_key_is_replayed()
+    test_errors_and_in_progress_keys()
+    test_ballot_committed_without_stored_response()
+    print("✓ Idempotency keys working")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for server.py: importing it must not build an app or an
+engine, so gunicorn workers (and --preload masters) boot quickly
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_SECONDS = float(os.environ.get('IMPORT_BUDGET_SECONDS', 2.0))
+
+CHECK = """
+import sys
+import server
+from models import db
+assert 'app' not in vars(server), 'server.py built an app at import'
+assert not db._app_engines, 'an engine was created at import'
+assert 'flask_migrate' not in sys.modules, 'Flask-Migrate imported by the web app'
+"""
+
+
+def import_times(module):
+    """Cumulative import time in seconds per module from python -X importtime"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_server_import_has_no_side_effects():
+    subprocess.run([sys.executable, '-c', CHECK], cwd=ROOT, check=True)
+
+
+def test_server_import_time():
+    seconds = import_times('server')['server']
+    print(f"import server: {seconds:.3f}s")
+    assert seconds < IMPORT_BUDGET_SECONDS
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, '-q', '-s']))
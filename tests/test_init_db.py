@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test that init_db.py skips all work when the schema stamp is current,
+and the JSON options columns it migrates
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import init_db
+from server import create_app
+from models import db, Question, QuestionTemplate, VotingSession
+
+
+def test_init_database_is_idempotent(monkeypatch):
+    """The second run finds the stamp and neither creates tables nor seeds templates"""
+    app = create_app('testing')
+
+    assert init_db.init_database(app=app) is True
+    with app.app_context():
+        assert QuestionTemplate.query.count() == len(init_db.SAMPLE_TEMPLATES)
+        assert init_db.stored_schema_version() == init_db.schema_fingerprint()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('schema work on an up to date database')
+
+    monkeypatch.setattr(init_db, 'create_tables_if_needed', fail)
+    monkeypatch.setattr(init_db, 'create_sample_templates', fail)
+    assert init_db.init_database(app=app) is True
+
+    # A stale stamp runs the full initialization again
+    with app.app_context():
+        db.session.execute(db.text("UPDATE schema_version SET version = 'old'"))
+        # An index added to a model after its table was created
+        db.session.execute(db.text('DROP INDEX ix_question_templates_name_lower'))
+        db.session.commit()
+    monkeypatch.undo()
+    assert init_db.init_database(app=app) is True
+    with app.app_context():
+        assert init_db.stored_schema_version() == init_db.schema_fingerprint()
+        assert 'ix_question_templates_name_lower' in init_db.existing_indexes()['question_templates']
+        assert QuestionTemplate.query.count() == len(init_db.SAMPLE_TEMPLATES)
+
+    # A column added to a model needs a migration; the stamp stays stale until then
+    with app.app_context():
+        db.session.execute(db.text("UPDATE schema_version SET version = 'old'"))
+        db.session.execute(db.text('ALTER TABLE question_templates DROP COLUMN description'))
+        db.session.commit()
+    assert init_db.init_database(app=app) is False
+    with app.app_context():
+        assert init_db.missing_columns() == ['question_templates.description']
+        assert init_db.stored_schema_version() == 'old'
+        db.drop_all()
+
+
+def test_options_are_decoded_once():
+    """Options are parsed when the row loads, kept on the instance and replaced by the setter"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        session = VotingSession(unique_id='777777', name='Options')
+        db.session.add(session)
+        db.session.flush()
+        question = Question(session_id=session.id, text='Rate', question_type='rating', options=['1', '2', '3'])
+        legacy = Question(session_id=session.id, text='Legacy', question_type='rating')
+        db.session.add_all([question, legacy])
+        db.session.commit()
+        db.session.execute(db.text("UPDATE questions SET options_json = '' WHERE id = :id"), {'id': legacy.id})
+        db.session.commit()
+        db.session.expire_all()
+
+        stored = db.session.execute(db.text('SELECT options_json FROM questions WHERE id = :id'),
+                                    {'id': question.id}).scalar()
+        assert stored == '["1", "2", "3"]'
+        assert question.options == ['1', '2', '3']
+        assert question.options is question.options
+        assert legacy.options == []
+
+        question.options = ['Yes', 'No']
+        assert question.options == ['Yes', 'No']
+        db.session.commit()
+        db.session.expire_all()
+        assert question.options == ['Yes', 'No']
+
+        # Nothing to convert outside PostgreSQL
+        assert init_db.convert_json_columns() == []
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test creating voting sessions in bulk from the API and a room plan
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from server import create_app
+from models import db, VotingSession
+from provisioning import read_room_plan
+
+
+def room(n, teams=3):
+    return {
+        'name': f'Room {n}',
+        'questions': [{'text': 'MASKA', 'question_type': 'team_selection'},
+                      {'text': 'Rate', 'question_type': 'rating', 'options': ['1', '2', '3']}],
+        'teams': [{'name': f'Team {n}-{t}', 'external_id': f'team_{n}_{t}'} for t in range(teams)]
+    }
+
+
+def test_batch_create(tmp_path):
+    """A batch creates every session with its questions and teams in a fixed number of statements"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = client.post('/api/v1/voting:batch', json={'sessions': [room(n) for n in range(60)]})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        assert response.status_code == 201
+        created = response.get_json()['sessions']
+        assert len(created) == 60 == len({s['id'] for s in created})
+        assert created[7]['name'] == 'Room 7'
+        assert created[7]['voting_url'] == f"/hlasovani/{created[7]['id']}"
+        # One INSERT each for sessions, questions and teams
+        assert sum(s.lstrip().upper().startswith('INSERT') for s in statements) == 3
+
+        detail = client.get(f"/api/v1/voting/{created[7]['id']}").get_json()
+        assert [q['text'] for q in detail['questions']] == ['MASKA', 'Rate']
+        assert detail['questions'][1]['options'] == ['1', '2', '3']
+        assert [t['external_id'] for t in detail['teams']] == ['team_7_0', 'team_7_1', 'team_7_2']
+
+        # Nothing is created when one session is invalid
+        response = client.post('/api/v1/voting:batch', json={'sessions': [room(100), {'teams': []}]})
+        assert response.status_code == 400
+        assert response.get_json()['error'].startswith('Session 1:')
+        assert VotingSession.query.count() == 60
+
+        plan = tmp_path / 'rooms.csv'
+        plan.write_text('name,description,questions,question_type,teams\n'
+                        'Hall A,Morning,MASKA;KOLA,team_selection,Alpha;Beta\n', encoding='utf-8')
+        assert read_room_plan(str(plan)) == [{
+            'name': 'Hall A', 'description': 'Morning',
+            'questions': [{'text': 'MASKA', 'question_type': 'team_selection'},
+                          {'text': 'KOLA', 'question_type': 'team_selection'}],
+            'teams': [{'name': 'Alpha'}, {'name': 'Beta'}]
+        }]
+
+        db.drop_all()
+
+
+def test_clone_session():
+    """A clone copies questions and teams in one INSERT ... SELECT each, without votes"""
+    from test_snapshot import create_mixed_session
+
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        source = create_mixed_session()
+        client = app.test_client()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = client.post('/api/v1/voting/654321/clone', json={'name': 'Next year'})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        assert response.status_code == 201
+        assert sum('INSERT INTO questions' in s and 'SELECT' in s for s in statements) == 1
+        assert sum('INSERT INTO teams' in s and 'SELECT' in s for s in statements) == 1
+
+        original = client.get('/api/v1/voting/654321').get_json()
+        clone = client.get(f"/api/v1/voting/{response.get_json()['id']}").get_json()
+        assert clone['name'] == 'Next year'
+        assert clone['description'] == original['description']
+        assert not clone['started'] and not clone['ended']
+
+        def structure(session):
+            return ([(q['text'], q['question_type'], q['options'], q['order_index']) for q in session['questions']],
+                    [(t['name'], t['external_id'], t['description']) for t in session['teams']])
+
+        assert structure(clone) == structure(original)
+        assert client.get(f"/api/v1/voting-stats/{clone['id']}").get_json()['vote_count'] == 0
+        assert source.votes
+
+        assert client.post('/api/v1/voting/999999/clone').status_code == 404
+
+        db.drop_all()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the server-rendered QR codes of the presentation page
+"""
+
+import os
+import sys
+import zlib
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db
+from qr import qr_available, qr_cache, qr_matrix, render_png
+from test_snapshot import create_mixed_session
+
+
+def test_png_encoding():
+    """The hand-written PNG is sized in whole modules and decodes to the matrix"""
+    matrix = [[True, False], [False, True]]
+    png = render_png(matrix, 5)
+
+    assert png.startswith(b'\x89PNG\r\n\x1a\n')
+    assert int.from_bytes(png[16:20], 'big') == 4  # two pixels per module
+    idat_length = int.from_bytes(png[33:37], 'big')
+    rows = zlib.decompress(png[41:41 + idat_length])
+    # Filter byte then one byte of 1-bit pixels per row, white = 1
+    assert rows == b'\x00\x3f\x00\x3f\x00\xcf\x00\xcf'
+
+
+def test_presentation_qr_endpoints():
+    """QR codes are generated once, cached and served as immutable images"""
+    if not qr_available():
+        print("⏭️  qrcode not installed, skipping QR endpoint test")
+        return
+
+    app = create_app('testing')
+    qr_cache.clear()
+
+    with app.app_context():
+        db.create_all()
+        create_mixed_session()
+        client = app.test_client()
+
+        response = client.get('/presentation/654321/qr.svg')
+        assert response.status_code == 200
+        assert response.mimetype == 'image/svg+xml'
+        assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+        assert b'width="512"' in response.data
+        modules = len(qr_matrix(f"{app.config['APP_URL']}/hlasovani/654321"))
+        assert f'viewBox="0 0 {modules} {modules}"'.encode() in response.data
+
+        revalidated = client.get('/presentation/654321/qr.svg',
+                                 headers={'If-None-Match': response.headers['ETag']})
+        assert revalidated.status_code == 304
+
+        # The compressed representation revalidates with its suffixed tag
+        compressed = client.get('/presentation/654321/qr.svg', headers={'Accept-Encoding': 'gzip'})
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert compressed.headers['ETag'] == response.headers['ETag'][:-1] + '-gzip"'
+        revalidated = client.get('/presentation/654321/qr.svg', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+        assert revalidated.status_code == 304
+        assert revalidated.headers['ETag'] == compressed.headers['ETag']
+        # but not for a client that no longer accepts gzip
+        assert client.get('/presentation/654321/qr.svg',
+                          headers={'If-None-Match': compressed.headers['ETag']}).status_code == 200
+
+        png = client.get('/presentation/654321/qr.png?size=300')
+        assert png.mimetype == 'image/png'
+        assert int.from_bytes(png.data[16:20], 'big') == 300 // modules * modules
+
+        assert client.get('/presentation/654321/qr.png?size=10').status_code == 400
+        assert client.get('/presentation/654321/qr.gif').status_code == 404
+        assert client.get('/presentation/999999/qr.svg').status_code == 404
+
+        # Cached images are not generated again, and are dropped with the session
+        assert (app.config['APP_URL'], '654321', 'png', 300) in qr_cache._images
+        client.delete('/api/v1/voting/654321')
+        assert client.get('/presentation/654321/qr.svg').status_code == 404
+
+        db.drop_all()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test that session listing and detail endpoints use a bounded number of queries
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from server import create_app
+from models import db, VotingSession, Question, Team, Vote, Voter
+
+
+def create_sessions(count, teams_per_session=4, questions_per_session=3):
+    """Create sessions where every voter votes once per question"""
+    offset = VotingSession.query.count()
+    for n in range(offset, offset + count):
+        session = VotingSession(unique_id=str(100000 + n), name=f"Session {n}")
+        db.session.add(session)
+        db.session.flush()
+
+        questions = [Question(session_id=session.id, text=f"Q{i}", question_type='rating',
+                              options=['1', '2', '3'], order_index=i)
+                     for i in range(questions_per_session)]
+        teams = [Team(session_id=session.id, name=f"Team {i}") for i in range(teams_per_session)]
+        db.session.add_all(questions + teams)
+        db.session.flush()
+
+        for team in teams:
+            voter = Voter(session_id=session.id, identifier=f"voter-{session.id}-{team.id}")
+            db.session.add(voter)
+            db.session.flush()
+            for question in questions:
+                db.session.add(Vote(session_id=session.id, question_id=question.id, team_id=teams[0].id,
+                                    voter_id=voter.id, voter_team_id=team.id, numeric_value=2))
+    db.session.commit()
+
+
+def count_queries(client, url):
+    """Return (response, number of SQL statements executed) for a GET request"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response, len(statements)
+
+
+def test_listing_query_count_is_bounded():
+    """Listing sessions costs the same number of queries for 5 or 50 sessions"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        create_sessions(5)
+        client = app.test_client()
+
+        response, small_count = count_queries(client, '/api/v1/voting')
+        assert response.status_code == 200
+
+        create_sessions(45)
+        response, large_count = count_queries(client, '/api/v1/voting')
+        data = response.get_json()
+
+        print(f"  Queries for 5 sessions: {small_count}, for 50 sessions: {large_count}")
+        assert len(data) == 50
+        assert large_count == small_count
+        assert large_count <= 2
+        assert all(s['vote_count'] == 12 and s['team_count'] == 4 and s['question_count'] == 3 for s in data)
+
+        db.drop_all()
+
+
+def test_detail_query_count_is_bounded():
+    """Session detail loads questions and teams eagerly"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        create_sessions(1, teams_per_session=20, questions_per_session=10)
+        client = app.test_client()
+
+        response, detail_count = count_queries(client, '/api/v1/voting/100000')
+        data = response.get_json()
+
+        assert response.status_code == 200
+        assert len(data['teams']) == 20 and len(data['questions']) == 10
+        assert detail_count <= 3
+
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    print("Testing query counts...")
+    test_listing_query_count_is_bounded()
+    test_detail_query_count_is_bounded()
+    print("✓ Query counts are bounded")
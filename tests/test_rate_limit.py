@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test token-bucket rate limiting of the vote endpoints
+"""
+
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db, VotingSession
+from ratelimit import MemoryBucketStore, SQLiteBucketStore, parse_limit
+
+
+def test_token_bucket():
+    """A bucket allows its burst, then refills at the configured rate"""
+    assert parse_limit('5/50') == (5.0, 50.0)
+    assert parse_limit('2') == (2.0, 2.0)
+
+    for store in (MemoryBucketStore(), SQLiteBucketStore(os.path.join(tempfile.mkdtemp(), 'buckets.sqlite3'))):
+        assert all(store.consume('client', 1.0, 3.0, now=100.0) == 0 for _ in range(3))
+        assert store.consume('client', 1.0, 3.0, now=100.0) == 1.0
+        assert store.consume('client', 1.0, 3.0, now=100.5) == 0.5
+        assert store.consume('client', 1.0, 3.0, now=101.0) == 0
+        assert store.consume('other', 1.0, 3.0, now=101.0) == 0
+
+
+def test_buckets_shared_between_workers():
+    """Stores opened on the same file see each other's tokens"""
+    path = os.path.join(tempfile.mkdtemp(), 'buckets.sqlite3')
+    first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+    assert first.consume('client', 1.0, 2.0, now=10.0) == 0
+    assert second.consume('client', 1.0, 2.0, now=10.0) == 0
+    assert first.consume('client', 1.0, 2.0, now=10.0) > 0
+    second.refund('client', 2.0)
+    assert first.consume('client', 1.0, 2.0, now=10.0) == 0
+
+
+def test_vote_lane_limited_admin_lane_not():
+    """Excess votes get 429 with Retry-After while admin calls still go through"""
+    app = create_app('testing')
+    app.config['RATE_LIMIT_VOTE'] = '1/3'
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(VotingSession(unique_id='515151', name='Rate limit test', started=True))
+        db.session.commit()
+        client = app.test_client()
+
+        statuses = [client.post('/api/v1/voting/515151/vote', json={}).status_code for _ in range(5)]
+        assert statuses[:3] == [400, 400, 400]
+        assert statuses[3:] == [429, 429]
+        response = client.post('/api/v1/voting/515151/vote', json={})
+        assert response.headers['Retry-After'] == '1'
+
+        # Another session has its own bucket
+        assert client.post('/api/v1/voting/999999/vote', json={}).status_code == 404
+
+        for _ in range(10):
+            assert client.post('/api/v1/voting/515151/stop').status_code == 200
+
+        app.config['RATE_LIMIT_ENABLED'] = False
+        assert client.post('/api/v1/voting/515151/vote', json={}).status_code == 400
+
+
+def test_lane_denial_keeps_client_tokens():
+    """A full vote lane does not cost the client a token, and a client denial gives the lane its token back"""
+    app = create_app('testing')
+    app.config['RATE_LIMIT_VOTE'] = '0.001/2'
+    app.config['RATE_LIMIT_VOTE_LANE'] = '0.001/3'
+    store = app.extensions['rate_limit_store']
+
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+
+        statuses = [client.post('/api/v1/voting/525252/vote', json={}).status_code for _ in range(4)]
+        assert statuses == [404, 404, 429, 429]
+        # Denied by its own bucket twice, so the lane still holds its third token
+        assert client.post('/api/v1/voting/535353/vote', json={}).status_code == 404
+
+        # Lane empty now: a new client is denied without touching its bucket
+        assert client.post('/api/v1/voting/545454/vote', json={}).status_code == 429
+        assert store.consume('vote:127.0.0.1:545454', 0.001, 2.0) == 0
+        assert store.consume('vote:127.0.0.1:545454', 0.001, 2.0) == 0
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    print("Testing rate limiting...")
+    test_token_bucket()
+    test_buckets_shared_between_workers()
+    test_vote_lane_limited_admin_lane_not()
+    print("✓ Rate limiting working")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test read-replica routing. Two SQLite files stand in for the primary and a
+replica copied from it; with TEST_DATABASE_URL and TEST_REPLICA_DATABASE_URL
+pointing at a PostgreSQL pair (docker-compose.replica.yml) the lag
+measurement is checked against the real replica too.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import replica
+from config import TestingConfig
+from server import create_app
+from models import db, VotingSession
+from test_snapshot import create_mixed_session
+
+
+def test_read_only_views_use_fresh_replica(monkeypatch):
+    directory = tempfile.mkdtemp()
+    primary, copy = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{primary}')
+    monkeypatch.setattr(TestingConfig, 'REPLICA_DATABASE_URI', f'sqlite:///{copy}')
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        session.updated_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        shutil.copy(primary, copy)
+
+        # A change the replica has not seen yet, leaving updated_at alone
+        db.session.execute(db.text("UPDATE voting_sessions SET name = 'Renamed on primary'"))
+        db.session.commit()
+
+    # Every request gets its own app context and database session, as in production
+    client = app.test_client()
+    assert client.get('/api/v1/voting/654321/results').get_json()['session_name'] == 'Snapshot test'
+    assert client.get('/api/v1/voting').get_json()[0]['name'] == 'Snapshot test'
+    # Other views stay on the primary
+    assert client.get('/api/v1/voting/654321').get_json()['name'] == 'Renamed on primary'
+
+    # Right after stop_voting the session is read from the primary
+    assert client.post('/api/v1/voting/654321/stop').status_code == 200
+    assert client.get('/api/v1/voting/654321/results').get_json()['session_name'] == 'Renamed on primary'
+    assert client.get('/api/v1/voting').get_json()[0]['name'] == 'Snapshot test'
+
+    # A lagging replica is not used at all
+    monkeypatch.setattr(replica, 'measure_lag', lambda engine: app.config['REPLICA_MAX_STALENESS'] + 1)
+    app.extensions.pop('replica_lag', None)
+    assert client.get('/api/v1/voting').get_json()[0]['name'] == 'Renamed on primary'
+
+    # Neither is one whose lag cannot be measured, e.g. with its WAL receiver down
+    monkeypatch.setattr(replica, 'measure_lag', lambda engine: None)
+    app.extensions.pop('replica_lag', None)
+    assert client.get('/api/v1/voting').get_json()[0]['name'] == 'Renamed on primary'
+
+    with app.app_context():
+        assert VotingSession.query.first().name == 'Renamed on primary'
+
+
+def test_without_replica_everything_uses_primary():
+    app = create_app('testing')
+    with app.app_context():
+        assert replica.replica_usable() is False
+
+
+@pytest.mark.skipif(not os.environ.get('TEST_REPLICA_DATABASE_URL', '').startswith('postgresql'),
+                    reason='needs a PostgreSQL primary and replica (docker-compose.replica.yml)')
+def test_postgresql_replica_lag():
+    app = create_app('testing')
+    with app.app_context():
+        lag = replica.measure_lag(app.extensions['replica_engine'])
+        assert lag is not None and lag >= 0
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
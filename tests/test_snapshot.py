@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test columnar results snapshots of ended sessions
+"""
+
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_app
+from models import db, VotingSession, Question, Team, Vote, Voter
+from snapshot import ResultsSnapshot, snapshot_path
+
+
+def create_mixed_session():
+    """Create a started session with rating, multiple choice and team selection questions"""
+    session = VotingSession(unique_id='654321', name='Snapshot test', started=True)
+    db.session.add(session)
+    db.session.flush()
+
+    rating = Question(session_id=session.id, text='Quality', question_type='rating',
+                      options=['1', '2', '3', '4', '5'], order_index=0)
+    choice = Question(session_id=session.id, text='Deadline', question_type='multiple_choice',
+                      options=['Yes', 'No'], order_index=1)
+    selection = Question(session_id=session.id, text='MASKA', question_type='team_selection',
+                         options=[], order_index=2)
+    teams = [Team(session_id=session.id, name=name) for name in ['Alpha', 'Beta', 'Gamma']]
+    db.session.add_all([rating, choice, selection] + teams)
+    db.session.flush()
+
+    for n in range(12):
+        voter_team = teams[n % 3]
+        voter = Voter(session_id=session.id, identifier=f'voter-{n}')
+        db.session.add(voter)
+        db.session.flush()
+        voted = teams[(n + 1) % 3]
+        db.session.add_all([
+            Vote(session_id=session.id, question_id=rating.id, team_id=voted.id, voter_id=voter.id,
+                 voter_team_id=voter_team.id, option_selected=str(n % 5 + 1), numeric_value=n % 5 + 1),
+            Vote(session_id=session.id, question_id=choice.id, team_id=voted.id, voter_id=voter.id,
+                 voter_team_id=voter_team.id, option_selected='Yes' if n % 2 else 'No'),
+            Vote(session_id=session.id, question_id=selection.id, team_id=teams[n % 2].id, voter_id=voter.id,
+                 voter_team_id=voter_team.id if n < 10 else None, option_selected=teams[n % 2].name)
+        ])
+    db.session.commit()
+    return session
+
+
+def add_foreign_vote(session):
+    """A vote of the session naming a team that belongs to another session"""
+    other = VotingSession(unique_id='111111', name='Other room')
+    db.session.add(other)
+    db.session.flush()
+    stranger = Team(session_id=other.id, name='Stranger')
+    db.session.add(stranger)
+    db.session.flush()
+    question = Question.query.filter_by(session_id=session.id).order_by(Question.id).first()
+    voter = Voter(session_id=other.id, identifier='stranger')
+    db.session.add(voter)
+    db.session.flush()
+    db.session.add(Vote(session_id=session.id, question_id=question.id, team_id=stranger.id,
+                        voter_id=voter.id, voter_team_id=stranger.id, option_selected='5', numeric_value=5))
+    db.session.commit()
+
+
+def test_snapshot_results_match_live_results():
+    """Results served from the snapshot equal the results computed from rows"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        client = app.test_client()
+
+        live = client.get('/api/v1/voting/654321/results').get_json()
+
+        assert client.post('/api/v1/voting/654321/stop').status_code == 200
+        assert os.path.exists(snapshot_path(session))
+
+        frozen = client.get('/api/v1/voting/654321/results').get_json()
+        assert frozen == live
+
+        db.drop_all()
+
+
+def test_snapshot_statistics_and_crosstab():
+    """Statistics and cross-tabs are computed from the snapshot arrays"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        session = create_mixed_session()
+        add_foreign_vote(session)
+        snapshot = ResultsSnapshot.build(session)
+
+        path = os.path.join(app.config['SNAPSHOT_DIR'], 'roundtrip.npz')
+        snapshot.save(path)
+        loaded = ResultsSnapshot.load(path)
+        assert loaded.vote_count == snapshot.vote_count == 36
+        assert loaded.total_voters == 12
+        assert loaded.results() == snapshot.results()
+
+        statistics = snapshot.statistics()
+        quality = statistics[0]['teams']
+        # Beta receives votes from voters n = 0, 3, 6, 9 -> ratings 1, 4, 2, 5
+        assert quality['Beta']['count'] == 4
+        assert quality['Beta']['mean'] == 3.0
+        assert quality['Beta']['std'] == 1.58
+        assert quality['Beta']['by_voter_team'] == {'Alpha': 3.0}
+        assert statistics[1]['teams'] == {}
+
+        matrix, unknown = snapshot.crosstab(2)
+        assert int(matrix.sum()) == 10
+        assert unknown.tolist() == [1, 1, 0]
+
+        response = app.test_client().get('/api/v1/voting/654321/statistics')
+        assert response.status_code == 200
+        assert response.get_json()['statistics'] == statistics
+
+        db.drop_all()
+
+
+def test_crosstab_sql_matches_snapshot():
+    """The SQL cross-tab of a live session equals the snapshot cross-tab after stopping"""
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+
+    with app.app_context():
+        db.create_all()
+        add_foreign_vote(create_mixed_session())
+        client = app.test_client()
+
+        live = client.get('/api/v1/voting/654321/crosstab').get_json()
+        assert live['teams'] == ['Alpha', 'Beta', 'Gamma']
+
+        selection = live['questions'][2]
+        # Voters 0..9 pick Alpha (even n) or Beta (odd n); voters 10 and 11 have no team
+        assert selection['matrix'] == [[2, 2, 0], [1, 2, 0], [2, 1, 0]]
+        assert selection['unknown_voter'] == [1, 1, 0]
+        assert selection['totals'] == [6, 6, 0]
+
+        client.post('/api/v1/voting/654321/stop')
+        frozen = client.get('/api/v1/voting/654321/crosstab').get_json()
+        assert frozen == live
+
+        assert client.get('/api/v1/voting/999999/crosstab').status_code == 404
+
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    print("Testing results snapshots...")
+    test_snapshot_results_match_live_results()
+    test_snapshot_statistics_and_crosstab()
+    test_crosstab_sql_matches_snapshot()
+    print("✓ Results snapshots working")
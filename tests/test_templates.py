@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the cached, paginated question template catalogue
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import init_db
+from server import create_app
+from models import db, QuestionTemplate
+from broadcast import TEMPLATES_CHANGED
+from test_query_counts import count_queries
+
+
+def test_template_catalogue():
+    """Pages are cached per version stamp, revalidate with an ETag and refresh on create"""
+    app = create_app('testing')
+
+    with app.app_context():
+        db.create_all()
+        for n in range(12):
+            question_type = 'rating' if n % 3 == 0 else 'multiple_choice'
+            db.session.add(QuestionTemplate(name=f'Template {n:02d}', question_type=question_type,
+                                            options=['1', '2', '3']))
+        db.session.commit()
+        client = app.test_client()
+
+        response, queries = count_queries(client, '/api/v1/templates')
+        assert response.status_code == 200
+        assert len(response.get_json()) == 12
+        assert response.headers['X-Total-Count'] == '12'
+        assert response.headers['ETag'] == '"templates-12"'
+        # A second read is served from memory
+        response, queries = count_queries(client, '/api/v1/templates')
+        assert queries == 0
+
+        revalidated = client.get('/api/v1/templates', headers={'If-None-Match': '"templates-12"'})
+        assert revalidated.status_code == 304
+        revalidated = client.get('/api/v1/templates', headers={'Accept-Encoding': 'gzip',
+                                                              'If-None-Match': '"templates-12-gzip"'})
+        assert revalidated.status_code == 304
+        assert revalidated.headers['ETag'] == '"templates-12-gzip"'
+
+        page = client.get('/api/v1/templates?type=rating&per_page=3&page=2')
+        assert [t['name'] for t in page.get_json()] == ['Template 09']
+        assert page.headers['X-Total-Count'] == '4'
+        assert [t['name'] for t in client.get('/api/v1/templates?q=template 1').get_json()] == \
+            ['Template 10', 'Template 11']
+        # Names match by prefix, with LIKE wildcards taken literally
+        assert client.get('/api/v1/templates?q=plate').get_json() == []
+        assert client.get('/api/v1/templates?q=%25').get_json() == []
+        assert 'ix_question_templates_name_lower' in init_db.existing_indexes()['question_templates']
+        assert client.get('/api/v1/templates?per_page=0').status_code == 400
+
+        created = client.post('/api/v1/templates', json={'name': 'Fresh', 'question_type': 'rating'})
+        template_id = created.get_json()['id']
+        response = client.get('/api/v1/templates', headers={'If-None-Match': '"templates-12"'})
+        assert response.status_code == 200
+        assert response.headers['ETag'] == f'"templates-{template_id}"'
+        assert len(response.get_json()) == 13
+
+        # Templates created on another node arrive as a broadcast event
+        db.session.add(QuestionTemplate(name='Elsewhere', question_type='rating'))
+        db.session.commit()
+        app.extensions['broadcast'].dispatch(TEMPLATES_CHANGED, {'version': template_id + 1})
+        assert len(client.get('/api/v1/templates').get_json()) == 14
+
+        # A missed announcement is caught when the stamp is re-read
+        db.session.add(QuestionTemplate(name='Unannounced', question_type='rating'))
+        db.session.commit()
+        assert len(client.get('/api/v1/templates').get_json()) == 14
+        app.extensions['template_catalog'].version_ttl = 0
+        assert len(client.get('/api/v1/templates').get_json()) == 15
+
+        db.drop_all()
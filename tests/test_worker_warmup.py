@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test the gunicorn post_fork hook that prepares preloaded workers
+"""
+
+import os
+import runpy
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig
+from server import create_app
+from models import db
+from snapshot import _load_cached
+from test_snapshot import create_mixed_session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeLog:
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(('info', message))
+
+    def warning(self, message):
+        self.messages.append(('warning', message))
+
+
+class FakeServer:
+    log = FakeLog()
+
+
+class FakeWorker:
+    pid = 4242
+
+    def __init__(self, app):
+        self.app = type('GunicornApp', (), {'wsgi': staticmethod(lambda: app)})()
+
+
+def test_post_fork_warms_worker(monkeypatch):
+    """post_fork opens the pool and loads snapshots of ended sessions"""
+    # Disposing the pool drops an in-memory database, so use a file
+    database = os.path.join(tempfile.mkdtemp(), 'warmup.db')
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{database}')
+    settings = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+    assert settings['preload_app'] is True
+    assert settings['wsgi_app'] == 'server:create_app()'
+
+    app = create_app('testing')
+    app.config['SNAPSHOT_DIR'] = tempfile.mkdtemp()
+    with app.app_context():
+        db.create_all()
+        create_mixed_session()
+        app.test_client().post('/api/v1/voting/654321/stop')
+
+    _load_cached.cache_clear()
+    server = FakeServer()
+    settings['post_fork'](server, FakeWorker(app))
+
+    assert server.log.messages[-1][0] == 'info'
+    assert 'ready in' in server.log.messages[-1][1]
+    assert _load_cached.cache_info().currsize == 1
+
+    # Warm-up problems are logged, the worker still starts
+    app.config['WARM_SNAPSHOTS'] = 'many'
+    settings['post_fork'](server, FakeWorker(app))
+    assert server.log.messages[-1][0] == 'warning'
+
+
+if __name__ == '__main__':
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))